@@ -5,23 +5,48 @@ import uuid
 import base64
 import socket
 import mimetypes
+import stat
+import errno
 import secrets
 import random
 import unicodedata
 import requests
 import hashlib
+import atexit
+import sqlite3
+import gzip
+import zlib
+import zipfile
+import tarfile
+import time
+import select
+import ctypes
+import ctypes.util
+import struct
+import threading
 from io import BytesIO
 from pathlib import Path
+from collections import OrderedDict, deque
 from datetime import datetime
 from typing import Optional
 
 from flask import (
-    Flask, request, session, redirect, url_for, send_from_directory, send_file,
-    render_template_string, abort, jsonify, Response, make_response
+    Flask, request, session, redirect, url_for, send_file,
+    render_template, abort, jsonify, Response, make_response, has_request_context
 )
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, emit, join_room, leave_room, rooms
+from urllib.parse import quote, quote_plus
+from werkzeug.exceptions import ClientDisconnected, HTTPException
+from werkzeug.http import http_date, parse_date
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NeedData
 import qrcode
 from qrcode.constants import ERROR_CORRECT_H
+from concurrent.futures import ThreadPoolExecutor
+from jinja2 import ChoiceLoader, DictLoader
+try:
+    from PIL import Image, ImageOps, features as pil_features
+except ImportError:  # Pillow is optional; /thumb then falls back to the original image
+    Image = None
 
 # -----------------------------
 # Islamic Dhikr (Remembrance)
@@ -48,6 +73,115 @@ def generate_name() -> str:
 def get_user_icon(user_id: str) -> str:
     return USER_ICONS[hash(user_id) % len(USER_ICONS)]
 
+# -----------------------------
+# Expiring token stores
+# -----------------------------
+EXPIRING_STORES: list = []
+
+class ExpiringStore:
+    """Dict-like map for short-lived tokens (or other records, see label).
+
+    Entries expire ttl seconds after they are set; once max_size is reached the
+    least recently used entry is evicted. Safe to share between request threads.
+    label names the kind of store in the sweeper's "... full" log line.
+    """
+
+    def __init__(self, name: str, ttl: float, max_size: int, label: str = "Token store"):
+        self.name = name
+        self.label = label
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data: OrderedDict[str, tuple[float, object]] = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.metrics = {"sets": 0, "hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+        EXPIRING_STORES.append(self)
+
+    def _live(self, key: str, now: float):
+        # caller holds the lock
+        item = self._data.get(key)
+        if item is not None and item[0] <= now:
+            del self._data[key]
+            self.metrics["expired"] += 1
+            return None
+        return item
+
+    def set(self, key: str, value, ttl: Optional[float] = None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+            self._data.move_to_end(key)
+            self.metrics["sets"] += 1
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.metrics["evicted"] += 1
+
+    __setitem__ = set
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            item = self._live(key, time.monotonic())
+            if item is None:
+                self.metrics["misses"] += 1
+                return default
+            self._data.move_to_end(key)
+            self.metrics["hits"] += 1
+            return item[1]
+
+    def pop(self, key: str, default=None):
+        with self._lock:
+            item = self._live(key, time.monotonic())
+            if item is None:
+                self.metrics["misses"] += 1
+                return default
+            del self._data[key]
+            self.metrics["hits"] += 1
+            return item[1]
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return self._live(key, time.monotonic()) is not None
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def values(self) -> list:
+        now = time.monotonic()
+        with self._lock:
+            return [v for expires, v in self._data.values() if expires > now]
+
+    def sweep(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            dead = [k for k, (expires, _) in self._data.items() if expires <= now]
+            for k in dead:
+                del self._data[k]
+            self.metrics["expired"] += len(dead)
+        return len(dead)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"name": self.name, "size": len(self._data), "max_size": self.max_size, **self.metrics}
+
+def _sweeper():
+    evicted = {}
+    while True:
+        time.sleep(SWEEP_INTERVAL)
+        for store in EXPIRING_STORES:
+            store.sweep()
+            st = store.stats()
+            if st["evicted"] != evicted.get(store.name, 0):
+                # Evictions mean the store hit max_size: someone is churning tokens (or jobs).
+                print(f"{store.label} full:", ", ".join(f"{k}={v}" for k, v in st.items()))
+                evicted[store.name] = st["evicted"]
+        JOURNAL.sweep()
+        try:
+            gc_upload_sessions()
+            gc_job_files()
+        except Exception as e:
+            print("Upload session / job file GC failed:", e)
+
+def start_sweeper():
+    threading.Thread(target=_sweeper, name="sweeper", daemon=True).start()
+
 # -----------------------------
 # Config
 # -----------------------------
@@ -57,8 +191,19 @@ ROOT_DIR = Path(os.environ.get("ROOT_DIR", "./shared")).resolve()
 ALLOWED_UPLOAD_EXT = None  # e.g. {"txt","png","jpg","pdf"}
 MAX_CONTENT_LENGTH = 10 * 1024 * 1024 * 1024  # 10GB
 SESSION_COOKIE_NAME = "qrfiles_sess"
+INTERNAL_PREFIX = ".fv-"  # hidden bookkeeping entries (partial uploads, caches); never listed
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_FIELD_MAX = 64 * 1024  # max size of a plain (non-file) multipart field
+MKDIRS_MAX = 50000  # directories per /api/mkdirs call
+BATCH_DIR_EVENTS_MAX = 50  # a batch upload adding more than this to one folder tells its viewers to reload it instead
+ZERO_COPY = os.environ.get("ZERO_COPY", "1") != "0"  # use sendfile() for /raw ranges when the server allows
+UPLOAD_CHECKED_CHUNK_MAX = 16 * 1024 * 1024  # checksummed resumable chunks are held in memory until verified
+UPLOAD_SESSION_TTL = int(os.environ.get("UPLOAD_SESSION_TTL", str(24 * 3600)))  # seconds an idle resumable upload is kept
+SWEEP_INTERVAL = 60  # seconds between sweeps of expired tokens / stale upload sessions
+PENDING_LOGIN_TTL = int(os.environ.get("PENDING_LOGIN_TTL", "600"))  # an unscanned login QR stays valid this long
+PENDING_LOGIN_MAX = int(os.environ.get("PENDING_LOGIN_MAX", "10000"))
 # Pending admin-claim tokens (QR-based transfer)
-admin_claim_tokens: dict[str, dict] = {}
+admin_claim_tokens = ExpiringStore("admin_claim_tokens", ttl=600, max_size=1000)
 
 
 
@@ -87,6 +232,39 @@ NGROK_URL = os.environ.get("NGROK_URL", "").strip()
 DEVICE_COOKIE_NAME = "qr_device"
 DEVICE_MAP_FILE = ROOT_DIR / ".device_map.json"
 USERS_FILE = ROOT_DIR / ".users.json"  # folder -> {public, admin_device, salt, password_hash, prefs}
+METADATA_BACKEND = os.environ.get("METADATA_BACKEND", "sqlite")  # "sqlite" or "json" (the two files above)
+META_DB_FILE = ROOT_DIR / ".fv-meta.db"  # users, prefs, tokens, devices; imports the JSON files on first start
+JSON_FLUSH_INTERVAL_MS = int(os.environ.get("JSON_FLUSH_INTERVAL_MS", "500"))  # min gap between background JSON rewrites
+UPLOAD_SESSIONS_DIR = ROOT_DIR / ".fv-uploads"  # resumable upload state: <id>.json
+THUMB_DIR = ROOT_DIR / ".fv-thumbs"  # thumbnail cache: <sha1(path,size,mtime)>.webp|jpg
+JOB_DIR = ROOT_DIR / ".fv-jobs"  # archives built by ZIP jobs: <job id>.zip
+THUMB_SIZES = {"s": 96, "m": 256, "l": 512}
+THUMB_WORKERS = int(os.environ.get("THUMB_WORKERS", "2"))
+USAGE_FILE = ROOT_DIR / ".fv-usage.json"  # folder -> {files, dirs, bytes, reconciled}
+USAGE_RECONCILE_INTERVAL = int(os.environ.get("USAGE_RECONCILE_INTERVAL", "3600"))  # seconds between background rescans
+USAGE_SCAN_THROTTLE = 0.001  # pause after each directory during background rescans
+LIST_PAGE_SIZE = 200  # entries rendered with the page / returned per /api/list call
+LIST_PAGE_MAX = 1000
+LIST_CACHE_DIRS = 256  # directory listings kept in memory
+EVENT_BATCH_MS = int(os.environ.get("EVENT_BATCH_MS", "150"))  # live file updates are grouped over this window
+JOURNAL_MAX_EVENTS = int(os.environ.get("JOURNAL_MAX_EVENTS", "1000"))  # changes kept per account for /api/changes
+JOURNAL_TTL = int(os.environ.get("JOURNAL_TTL", "3600"))  # seconds a change stays replayable
+FS_WATCH = os.environ.get("FS_WATCH", "auto")  # "inotify", "poll" or "off"; auto = inotify where available, else poll
+FS_WATCH_DEBOUNCE_MS = int(os.environ.get("FS_WATCH_DEBOUNCE_MS", "500"))  # quiet time before outside changes are pushed
+FS_WATCH_MAX_DELAY = 3  # seconds; a steady stream of changes is still pushed this often
+FS_WATCH_POLL_INTERVAL = int(os.environ.get("FS_WATCH_POLL_INTERVAL", "10"))  # seconds between tree walks when polling
+FS_WATCH_OWN_TTL = 5  # seconds a path the app itself just changed is not reported again
+FS_WATCH_RESCAN_GAP = 10  # min seconds between usage rescans of one account triggered by outside changes
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))  # threads for background jobs (recursive delete, ZIP, rescan)
+JOB_KEEP = 600  # seconds a finished job (and its ZIP) stays available
+JOB_MAX_ACTIVE = int(os.environ.get("JOB_MAX_ACTIVE", "4"))  # queued + running jobs per account
+JOB_PROGRESS_INTERVAL = 0.5  # min seconds between job_progress events of one job
+# Already-compressed formats go into archives stored, not deflated again.
+ZIP_STORED_EXTS = {
+    "jpg", "jpeg", "png", "gif", "webp", "heic", "heif", "avif", "jxl",
+    "mp4", "m4v", "mov", "mkv", "webm", "avi", "3gp", "mp3", "m4a", "aac", "ogg", "oga", "opus", "flac",
+    "zip", "gz", "tgz", "bz2", "xz", "zst", "7z", "rar", "apk", "jar", "docx", "xlsx", "pptx", "odt", "epub", "pdf", "woff2",
+}
 
 ROOT_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -94,12 +272,12 @@ app = Flask(__name__, static_folder="static", static_url_path="/static")
 app.secret_key = APP_SECRET
 app.config["MAX_CONTENT_LENGTH"] = MAX_CONTENT_LENGTH
 app.config["SESSION_COOKIE_NAME"] = SESSION_COOKIE_NAME
-app.config["LOGIN_TOKENS"] = {}  # pc_token -> folder
+app.config["LOGIN_TOKENS"] = ExpiringStore("login_tokens", ttl=120, max_size=1000)  # pc_token -> folder
 
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode="threading")
 
 # In-memory pending sessions for QR login
-pending_sessions: dict[str, dict] = {}
+pending_sessions = ExpiringStore("pending_sessions", ttl=PENDING_LOGIN_TTL, max_size=PENDING_LOGIN_MAX)
 
 mimetypes.init()
 
@@ -172,29 +350,7 @@ mimetypes.add_type("font/woff2", ".woff2")  # make sure .woff2 served correctly
 
 
 # -----------------------------
-# Device map persistence
-# -----------------------------
-def load_device_map() -> dict:
-    try:
-        if DEVICE_MAP_FILE.exists():
-            return json.loads(DEVICE_MAP_FILE.read_text(encoding="utf-8"))
-    except Exception as e:
-        print("Device map load failed:", e)
-    return {}
-
-def save_device_map(mapdata: dict):
-    try:
-        DEVICE_MAP_FILE.parent.mkdir(parents=True, exist_ok=True)
-        tmp = DEVICE_MAP_FILE.with_suffix(".json.tmp")
-        tmp.write_text(json.dumps(mapdata, ensure_ascii=False, indent=2), encoding="utf-8")
-        tmp.replace(DEVICE_MAP_FILE)
-    except Exception as e:
-        print("Device map save failed:", e)
-
-app.config["DEVICE_MAP"] = load_device_map()
-
-# -----------------------------
-# Users (privacy + prefs)
+# Metadata store (users, devices, tokens, prefs)
 # -----------------------------
 def _load_json_file(p: Path, default: dict) -> dict:
     try:
@@ -204,37 +360,372 @@ def _load_json_file(p: Path, default: dict) -> dict:
         print(f"Load {p.name} failed:", e)
     return default.copy()
 
-def _save_json_file(p: Path, data: dict):
+def _json_copy(value):
+    """Deep copy of a JSON-shaped value (what _save_json_file would write)."""
+    return json.loads(json.dumps(value))
+
+def _save_json_file(p: Path, data: dict, fsync: bool = False) -> int:
+    """Write data to p via a temp file and rename; returns bytes written, 0 on failure."""
     try:
         p.parent.mkdir(parents=True, exist_ok=True)
         tmp = p.with_suffix(p.suffix + ".tmp")
-        tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+        payload = json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+        with open(tmp, "wb") as f:
+            f.write(payload)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
         tmp.replace(p)
+        return len(payload)
     except Exception as e:
         print(f"Save {p.name} failed:", e)
+        return 0
 
-def load_users() -> dict:
-    data = _load_json_file(USERS_FILE, {})
-    return data
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
 
-def save_users(data: dict):
-    _save_json_file(USERS_FILE, data)
+def hash_token_record(info: dict) -> bool:
+    """Swap a stored plaintext "token" for its digest; True if the record changed."""
+    plain = info.pop("token", None)
+    if plain is None:
+        return False
+    info["digest"] = token_digest(plain)
+    return True
+
+class JsonFlusher:
+    """Coalesces JSON file writes off the request path.
+
+    Callers mark a registered file dirty and return at once; a background thread
+    rewrites dirty files (fsync, then rename) at most once per interval.
+    """
+
+    def __init__(self, interval_ms: int):
+        self.interval = interval_ms / 1000.0
+        self.cond = threading.Condition()
+        self.flush_lock = threading.Lock()  # flusher thread vs. atexit
+        self.sources = {}  # path -> callable returning the dict to write
+        self.dirty: set[Path] = set()
+        self.stats = {"requests": 0, "coalesced": 0, "flushes": 0, "files_written": 0, "bytes_written": 0, "errors": 0}
+        self.thread = None
+
+    def register(self, p: Path, source):
+        """source() returns the dict to write for p.
+
+        It runs on the flusher thread, so it must return a snapshot taken under the lock its
+        writers use; the snapshot is then serialized and written outside that lock.
+        """
+        self.sources[p] = source
+
+    def mark_dirty(self, p: Path):
+        with self.cond:
+            self.stats["requests"] += 1
+            if p in self.dirty:
+                self.stats["coalesced"] += 1
+                return
+            self.dirty.add(p)
+            self.cond.notify()
+        if self.thread is None:
+            self.start()
+
+    def flush(self):
+        with self.flush_lock:
+            with self.cond:
+                paths, self.dirty = self.dirty, set()
+            if not paths:
+                return
+            self.stats["flushes"] += 1
+            for p in paths:
+                n = _save_json_file(p, self.sources[p](), fsync=True)
+                if n:
+                    self.stats["files_written"] += 1
+                    self.stats["bytes_written"] += n
+                else:
+                    # disk full, permissions...; try again next round
+                    self.stats["errors"] += 1
+                    with self.cond:
+                        self.dirty.add(p)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.dirty:
+                    self.cond.wait()
+            self.flush()
+            time.sleep(self.interval)
+
+    def start(self):
+        with self.cond:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self._run, name="json-flusher", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.flush()
+        if self.stats["requests"]:
+            print("JSON flusher:", ", ".join(f"{k}={v}" for k, v in self.stats.items()))
+
+JSON_FLUSHER = JsonFlusher(JSON_FLUSH_INTERVAL_MS)
+atexit.register(JSON_FLUSHER.close)
+
+class JsonMetaStore:
+    """Original layout: .users.json and .device_map.json, rewritten whole by the JSON flusher."""
+
+    def __init__(self, users_file: Path, devices_file: Path):
+        self.users_file = users_file
+        self.devices_file = devices_file
+        self.users = self._load(users_file)
+        self.devices = self._load(devices_file)
+        # What goes to disk: a private copy of each row, taken by the save_* call that
+        # changed it. The live dicts are edited by request threads without a lock.
+        self.lock = threading.Lock()
+        self.saved_users = {k: _json_copy(v) for k, v in self.users.items()}
+        self.saved_devices = {k: _json_copy(v) for k, v in self.devices.items()}
+        JSON_FLUSHER.register(users_file, lambda: self._snapshot(self.saved_users))
+        JSON_FLUSHER.register(devices_file, lambda: self._snapshot(self.saved_devices))
+
+    @staticmethod
+    def _load(p: Path) -> dict:
+        # Older SQLite migrations renamed the files to *.migrated instead of leaving them.
+        migrated = p.with_name(p.name + ".migrated")
+        return _load_json_file(p if p.exists() or not migrated.exists() else migrated, {})
+
+    def _snapshot(self, saved: dict) -> dict:
+        with self.lock:
+            return dict(saved)  # rows are replaced on save, never changed in place
+
+    def _save_row(self, saved: dict, live: dict, key: str, p: Path):
+        row = _json_copy(live.get(key))
+        with self.lock:
+            if row is None:
+                saved.pop(key, None)
+            else:
+                saved[key] = row
+        JSON_FLUSHER.mark_dirty(p)
+
+    def save_user(self, folder: str):
+        self._save_row(self.saved_users, self.users, folder, self.users_file)
+
+    def save_pref(self, folder: str, key: str):
+        self._save_row(self.saved_users, self.users, folder, self.users_file)
+
+    def save_device(self, device_id: str):
+        self._save_row(self.saved_devices, self.devices, device_id, self.devices_file)
+
+class SqliteMetaStore:
+    """One SQLite database in WAL mode; a change rewrites only the rows it touches.
+
+    users/devices stay loaded as plain dicts (the rest of the app reads them directly);
+    the save_* calls persist one account, one pref or one device in a transaction.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            folder TEXT PRIMARY KEY,
+            public INTEGER NOT NULL DEFAULT 1,
+            admin_device TEXT,
+            salt TEXT,
+            password_hash TEXT,
+            extra TEXT NOT NULL DEFAULT '{}'
+        );
+        CREATE INDEX IF NOT EXISTS users_admin_device ON users(admin_device);
+        CREATE TABLE IF NOT EXISTS prefs (
+            folder TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            PRIMARY KEY (folder, key)
+        );
+        CREATE TABLE IF NOT EXISTS tokens (
+            token_id TEXT PRIMARY KEY,
+            folder TEXT NOT NULL,
+            digest TEXT,
+            name TEXT,
+            created TEXT,
+            expires TEXT,
+            extra TEXT NOT NULL DEFAULT '{}'
+        );
+        CREATE INDEX IF NOT EXISTS tokens_folder ON tokens(folder);
+        CREATE INDEX IF NOT EXISTS tokens_digest ON tokens(digest);
+        CREATE TABLE IF NOT EXISTS devices (
+            device_id TEXT PRIMARY KEY,
+            folder TEXT NOT NULL,
+            created TEXT,
+            extra TEXT NOT NULL DEFAULT '{}'
+        );
+        CREATE INDEX IF NOT EXISTS devices_folder ON devices(folder);
+    """
+    USER_COLUMNS = ("public", "admin_device", "salt", "password_hash")
+    TOKEN_COLUMNS = ("digest", "name", "created", "expires")
+    DEVICE_COLUMNS = ("folder", "created")
+
+    def __init__(self, db_file: Path, users_file: Path, devices_file: Path):
+        self.lock = threading.RLock()
+        db_file.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(db_file), check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self._upgrade()
+        self.db.executescript(self.SCHEMA)
+        if self.db.execute("PRAGMA user_version").fetchone()[0] == 0:
+            self._migrate_json(users_file, devices_file)
+        self.users = self._read_users()
+        self.devices = self._read_devices()
+
+    def _upgrade(self):
+        """Bring a database written by an older version up to SCHEMA."""
+        cols = {row[1] for row in self.db.execute("PRAGMA table_info(tokens)")}
+        if cols and "digest" not in cols:
+            # Tokens used to be stored in plaintext: keep only their digests.
+            self.db.create_function("token_digest", 1, lambda t: token_digest(t) if t is not None else None)
+            self.db.execute("PRAGMA secure_delete=ON")
+            with self.lock, self.db:
+                self.db.execute("ALTER TABLE tokens ADD COLUMN digest TEXT")
+                self.db.execute("UPDATE tokens SET digest = token_digest(token), token = NULL")
+                self.db.execute("DROP INDEX IF EXISTS tokens_token")
+            self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def _migrate_json(self, users_file: Path, devices_file: Path):
+        """One-shot import of the JSON files.
+
+        They stay in place (rewritten with token digests only), so METADATA_BACKEND=json still
+        starts with the accounts as they were at migration time.
+        """
+        users = _load_json_file(users_file, {})
+        devices = _load_json_file(devices_file, {})
+        for cfg in users.values():
+            for info in (cfg.get("tokens") or {}).values():
+                hash_token_record(info)
+        with self.lock, self.db:
+            for folder, cfg in users.items():
+                self._write_user(folder, cfg)
+            for device_id, info in devices.items():
+                self._write_device(device_id, info)
+            self.db.execute("PRAGMA user_version = 1")
+        for f, data in ((users_file, users), (devices_file, devices)):
+            if f.exists():
+                _save_json_file(f, data, fsync=True)
+        if users or devices:
+            print(f"Metadata migrated to SQLite: {len(users)} accounts, {len(devices)} devices")
+
+    def _read_users(self) -> dict:
+        users = {}
+        for folder, public, admin_device, salt, password_hash, extra in self.db.execute(
+                "SELECT folder, public, admin_device, salt, password_hash, extra FROM users"):
+            cfg = json.loads(extra)
+            cfg.update(public=bool(public), admin_device=admin_device, salt=salt, password_hash=password_hash, prefs={})
+            users[folder] = cfg
+        for folder, key, value in self.db.execute("SELECT folder, key, value FROM prefs"):
+            if folder in users:
+                users[folder]["prefs"][key] = json.loads(value)
+        for token_id, folder, digest, name, created, expires, extra in self.db.execute(
+                "SELECT token_id, folder, digest, name, created, expires, extra FROM tokens"):
+            if folder in users:
+                info = json.loads(extra)
+                info.update(digest=digest, name=name, created=created, expires=expires)
+                users[folder].setdefault("tokens", {})[token_id] = info
+        return users
+
+    def _read_devices(self) -> dict:
+        devices = {}
+        for device_id, folder, created, extra in self.db.execute("SELECT device_id, folder, created, extra FROM devices"):
+            info = json.loads(extra)
+            info.update(folder=folder, created=created)
+            devices[device_id] = info
+        return devices
+
+    def _write_user(self, folder: str, cfg: dict):
+        cfg = dict(cfg)
+        prefs = list((cfg.pop("prefs", None) or {}).items())
+        tokens = list((cfg.pop("tokens", None) or {}).items())
+        row = [cfg.pop(k, None) for k in self.USER_COLUMNS]
+        row[0] = 1 if row[0] is None else int(bool(row[0]))
+        self.db.execute("INSERT OR REPLACE INTO users(folder, public, admin_device, salt, password_hash, extra) VALUES(?,?,?,?,?,?)",
+                        (folder, *row, json.dumps(cfg, ensure_ascii=False)))
+        self.db.execute("DELETE FROM prefs WHERE folder = ?", (folder,))
+        self.db.executemany("INSERT INTO prefs(folder, key, value) VALUES(?,?,?)",
+                            [(folder, k, json.dumps(v, ensure_ascii=False)) for k, v in prefs])
+        self.db.execute("DELETE FROM tokens WHERE folder = ?", (folder,))
+        for token_id, info in tokens:
+            info = dict(info)
+            cols = [info.pop(k, None) for k in self.TOKEN_COLUMNS]
+            self.db.execute("INSERT OR REPLACE INTO tokens(token_id, folder, digest, name, created, expires, extra) VALUES(?,?,?,?,?,?,?)",
+                            (token_id, folder, *cols, json.dumps(info, ensure_ascii=False)))
+
+    def _write_device(self, device_id: str, info: dict):
+        info = dict(info)
+        cols = [info.pop(k, None) for k in self.DEVICE_COLUMNS]
+        self.db.execute("INSERT OR REPLACE INTO devices(device_id, folder, created, extra) VALUES(?,?,?,?)",
+                        (device_id, *cols, json.dumps(info, ensure_ascii=False)))
+
+    def save_user(self, folder: str):
+        cfg = self.users.get(folder)
+        try:
+            with self.lock, self.db:
+                if cfg is None:
+                    for table in ("users", "prefs", "tokens"):
+                        self.db.execute(f"DELETE FROM {table} WHERE folder = ?", (folder,))
+                else:
+                    self._write_user(folder, cfg)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Save account {folder} failed:", e)
+
+    def save_pref(self, folder: str, key: str):
+        prefs = (self.users.get(folder) or {}).get("prefs") or {}
+        try:
+            with self.lock, self.db:
+                if key in prefs:
+                    self.db.execute("INSERT OR REPLACE INTO prefs(folder, key, value) VALUES(?,?,?)",
+                                    (folder, key, json.dumps(prefs[key], ensure_ascii=False)))
+                else:
+                    self.db.execute("DELETE FROM prefs WHERE folder = ? AND key = ?", (folder, key))
+        except (sqlite3.Error, OSError) as e:
+            print(f"Save pref {folder}/{key} failed:", e)
+
+    def save_device(self, device_id: str):
+        info = self.devices.get(device_id)
+        try:
+            with self.lock, self.db:
+                if info is None:
+                    self.db.execute("DELETE FROM devices WHERE device_id = ?", (device_id,))
+                else:
+                    self._write_device(device_id, info)
+        except (sqlite3.Error, OSError) as e:
+            print("Save device failed:", e)
+
+def open_meta_store():
+    if METADATA_BACKEND == "json":
+        return JsonMetaStore(USERS_FILE, DEVICE_MAP_FILE)
+    if METADATA_BACKEND == "sqlite":
+        return SqliteMetaStore(META_DB_FILE, USERS_FILE, DEVICE_MAP_FILE)
+    raise RuntimeError(f"Unknown METADATA_BACKEND: {METADATA_BACKEND!r} (use 'sqlite' or 'json')")
+
+META = open_meta_store()
+app.config["USERS"] = META.users
+app.config["DEVICE_MAP"] = META.devices
+
+def save_user(folder: str):
+    META.save_user(folder)
+
+def save_device(device_id: str):
+    META.save_device(device_id)
 
+# -----------------------------
+# Users (privacy + prefs)
+# -----------------------------
 def get_user_cfg(folder: str) -> dict:
-    users = app.config.setdefault("USERS", load_users())
+    users = app.config["USERS"]
     if folder not in users:
-        users[folder] = {
+        users.setdefault(folder, {
             "public": True,
             "admin_device": None,
             "salt": None,
             "password_hash": None,
             "prefs": {}
-        }
-        save_users(users)
+        })
+        save_user(folder)
     return users[folder]
 
 def set_privacy(folder: str, public: bool, password: Optional[str]=None):
-    users = app.config.setdefault("USERS", load_users())
+    users = app.config["USERS"]
     cfg = users.setdefault(folder, {"public": True, "admin_device": None, "salt": None, "password_hash": None, "prefs": {}})
     cfg["public"] = bool(public)
     if not public:
@@ -245,7 +736,7 @@ def set_privacy(folder: str, public: bool, password: Optional[str]=None):
     else:
         cfg["salt"] = None
         cfg["password_hash"] = None
-    save_users(users)
+    save_user(folder)
 
 def verify_password(folder: str, password: str) -> bool:
     cfg = get_user_cfg(folder)
@@ -259,13 +750,13 @@ def save_pref(folder: str, key: str, value):
     cfg = get_user_cfg(folder)
     prefs = cfg.setdefault("prefs", {})
     prefs[key] = value
-    save_users(app.config["USERS"])
+    META.save_pref(folder, key)
 
 # -----------------------------
 # Device folder with admin assignment
 # -----------------------------
 def ensure_unique_folder_name() -> str:
-    users_map = app.config.setdefault("USERS", load_users())
+    users_map = app.config["USERS"]
     used = set(users_map.keys()) | {info["folder"] for info in app.config["DEVICE_MAP"].values()}
     for _ in range(1000):
         name = generate_name()
@@ -281,17 +772,17 @@ def get_or_create_device_folder(req) -> tuple[str, str]:
         cfg = get_user_cfg(folder)
         if not cfg.get("admin_device"):
             cfg["admin_device"] = device_id
-            save_users(app.config["USERS"])
+            save_user(folder)
         return device_id, folder
     device_id = secrets.token_urlsafe(12)
     folder = ensure_unique_folder_name()
     (ROOT_DIR / folder).mkdir(parents=True, exist_ok=True)
     app.config["DEVICE_MAP"][device_id] = {"folder": folder, "created": datetime.utcnow().isoformat() + "Z"}
-    save_device_map(app.config["DEVICE_MAP"])
+    save_device(device_id)
     cfg = get_user_cfg(folder)
     if not cfg.get("admin_device"):
         cfg["admin_device"] = device_id
-        save_users(app.config["USERS"])
+        save_user(folder)
     return device_id, folder
 
 # -----------------------------
@@ -316,7 +807,7 @@ def api_accounts_list():
     did = request.cookies.get(DEVICE_COOKIE_NAME)
     if not did:
         return jsonify({"ok": False, "error": "device not recognized"}), 400
-    users = app.config.setdefault("USERS", load_users())
+    users = app.config["USERS"]
     device_map = app.config["DEVICE_MAP"]
     default_folder = (device_map.get(did) or {}).get("folder")
 
@@ -366,11 +857,11 @@ def api_accounts_create():
     uc["admin_device"] = did
     uc.setdefault("public", True)
     uc.setdefault("prefs", {})
-    save_users(app.config["USERS"])
+    save_user(name)
 
     if make_default:
         app.config["DEVICE_MAP"][did] = {"folder": name, "created": datetime.utcnow().isoformat() + "Z"}
-        save_device_map(app.config["DEVICE_MAP"])
+        save_device(did)
         session["folder"] = name
         session["icon"] = get_user_icon(name)
 
@@ -386,7 +877,7 @@ def api_accounts_switch():
     if not folder:
         return jsonify({"ok": False, "error": "folder required"}), 400
 
-    users = app.config.setdefault("USERS", load_users())
+    users = app.config["USERS"]
     if folder not in users:
         return jsonify({"ok": False, "error": "no such account"}), 404
 
@@ -400,26 +891,58 @@ def api_accounts_switch():
 
     if make_default:
         app.config["DEVICE_MAP"][did] = {"folder": folder, "created": datetime.utcnow().isoformat() + "Z"}
-        save_device_map(app.config["DEVICE_MAP"])
+        save_device(did)
 
     return jsonify({"ok": True, "folder": folder, "browse_url": url_for("browse", subpath=folder)})
 
+# API tokens are stored as sha256 digests only; this index maps digest -> (folder, token_id).
+_token_index: dict[str, tuple[str, str]] = {}
+_token_index_lock = threading.Lock()
+
+def rebuild_token_index():
+    """Index every stored token; plaintext tokens left by older versions are hashed and saved."""
+    index = {}
+    for folder, cfg in list(app.config["USERS"].items()):
+        changed = False
+        for token_id, info in list((cfg.get("tokens") or {}).items()):
+            changed |= hash_token_record(info)
+            if info.get("digest"):
+                index[info["digest"]] = (folder, token_id)
+        if changed:
+            save_user(folder)
+    with _token_index_lock:
+        _token_index.clear()
+        _token_index.update(index)
+
+def index_token(digest: str, folder: str, token_id: str):
+    with _token_index_lock:
+        _token_index[digest] = (folder, token_id)
+
+def unindex_token(digest: Optional[str]):
+    if digest:
+        with _token_index_lock:
+            _token_index.pop(digest, None)
+
+rebuild_token_index()
+
 def get_user_by_token(token):
     """Find a user by their API token"""
     if not token:
         return None
-        
-    users = app.config.setdefault("USERS", load_users())
-    
-    # Search through all users and their tokens
-    for folder, user_data in users.items():
-        tokens = user_data.get("tokens", {})
-        for token_id, token_info in tokens.items():
-            if token_info.get("token") == token:
-                # Return user data with folder included
-                return {"folder": folder, "icon": user_data.get("icon"), **user_data}
-    
-    return None
+    digest = token_digest(token)
+    hit = _token_index.get(digest)
+    if not hit:
+        return None
+    folder, token_id = hit
+    user_data = app.config["USERS"].get(folder)
+    info = ((user_data or {}).get("tokens") or {}).get(token_id)
+    if not info or not secrets.compare_digest(info.get("digest") or "", digest):
+        return None
+    expires = info.get("expires")
+    if expires and datetime.fromisoformat(expires.replace("Z", "")) < datetime.utcnow():
+        return None
+    # Return user data with folder included
+    return {"folder": folder, "icon": user_data.get("icon"), **user_data}
 
 @app.route("/api/accounts/token", methods=["POST"])
 def api_accounts_token():
@@ -433,7 +956,7 @@ def api_accounts_token():
         if not folder:
             return jsonify({"ok": False, "error": "folder required"}), 400
 
-    users = app.config.setdefault("USERS", load_users())
+    users = app.config["USERS"]
     if folder not in users:
         return jsonify({"ok": False, "error": "no such account"}), 404
 
@@ -441,36 +964,70 @@ def api_accounts_token():
     if users[folder].get("admin_device") != did:
         return jsonify({"ok": False, "error": "only admin device can generate tokens"}), 403
 
-    # Check if a permanent token already exists
+    # Only digests are stored, so an existing permanent token can't be shown again.
+    # Replacing it breaks every link and QR code made from it: require rotate=true.
     user_cfg = users[folder]
     tokens = user_cfg.setdefault("tokens", {})
-    existing = next((info for info in tokens.values() if info.get("expires") is None), None)
-
-    if existing:
+    rotated = [tid for tid, info in tokens.items() if info.get("expires") is None]
+    if rotated and data.get("rotate") is not True:
         return jsonify({
-            "ok": True,
-            "token": existing["token"],
-            "message": "Permanent token already exists"
-        })
+            "ok": False,
+            "error": "A permanent token already exists. Replacing it stops every link and QR code made with it from working.",
+            "rotate_required": True
+        }), 409
+    for tid in rotated:
+        unindex_token(tokens.pop(tid).get("digest"))
 
-    # Otherwise generate one new permanent token
     token = secrets.token_urlsafe(32)
     token_id = str(uuid.uuid4())
     tokens[token_id] = {
-        "token": token,
+        "digest": token_digest(token),
         "created": datetime.utcnow().isoformat() + "Z",
         "name": data.get("name", "API Token"),
         "expires": None
     }
-    save_users(users)
+    index_token(tokens[token_id]["digest"], folder, token_id)
+    save_user(folder)
 
     return jsonify({
         "ok": True,
         "token": token,
         "token_id": token_id,
-        "message": "Permanent token created successfully"
+        "rotated": len(rotated),
+        "message": "Permanent token replaced" if rotated else "Permanent token created successfully"
     })
 
+@app.route("/api/accounts/token/revoke", methods=["POST"])
+def api_accounts_token_revoke():
+    if not is_authed():
+        return jsonify({"ok": False, "error": "not authed"}), 401
+
+    data = request.get_json(silent=True) or {}
+    folder = (data.get("folder") or "").strip() or session.get("folder", "")
+    users = app.config["USERS"]
+    if folder not in users:
+        return jsonify({"ok": False, "error": "no such account"}), 404
+
+    did = request.cookies.get(DEVICE_COOKIE_NAME)
+    if users[folder].get("admin_device") != did:
+        return jsonify({"ok": False, "error": "only admin device can revoke tokens"}), 403
+
+    # Revoke one token (by id or by its value) or, with neither given, all of them.
+    tokens = users[folder].get("tokens") or {}
+    token_id = (data.get("token_id") or "").strip()
+    if not token_id and data.get("token"):
+        hit = _token_index.get(token_digest(data["token"]))
+        token_id = hit[1] if hit and hit[0] == folder else ""
+        if not token_id:
+            return jsonify({"ok": False, "error": "no such token"}), 404
+    if token_id and token_id not in tokens:
+        return jsonify({"ok": False, "error": "no such token"}), 404
+    revoked = [token_id] if token_id else list(tokens)
+    for tid in revoked:
+        unindex_token(tokens.pop(tid).get("digest"))
+    save_user(folder)
+    return jsonify({"ok": True, "revoked": revoked})
+
 def get_local_ip() -> str:
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     try:
@@ -543,6 +1100,9 @@ def sanitize_filename(filename: str) -> str:
         name = base[:200 - len(ext)] + ext
     return name
 
+def is_internal_name(name: str) -> bool:
+    return name.startswith(INTERNAL_PREFIX)
+
 def human_size(n: Optional[int]) -> str:
     if n is None: return "-"
     units = ["B","KB","MB","GB","TB"]
@@ -561,42 +1121,60 @@ def guess_mime(p: Path) -> str:
 def path_rel(p: Path) -> str:
     return p.relative_to(ROOT_DIR).as_posix()
 
+URL_QUERY_SAFE = "!$'()*,/:;?@"  # what url_for leaves unescaped in query values
+
+class FileMeta:
+    """One listing entry, filled from a single stat result.
+
+    Templates read the attributes directly; JSON responses and socket events use as_dict().
+    """
+    FIELDS = ("name", "rel", "is_dir", "mime", "size", "size_h", "mtime", "mtime_h", "raw_url", "thumb_url", "download_url")
+    __slots__ = FIELDS + ("name_key",)
+
+    def __init__(self, name: str, rel: str, st: os.stat_result, urls: tuple[str, str, str]):
+        raw_prefix, download_prefix, thumb_prefix = urls
+        is_file = stat.S_ISREG(st.st_mode)
+        q = quote_plus(rel, safe=URL_QUERY_SAFE)
+        self.name = name
+        self.name_key = name.lower()
+        self.rel = rel
+        self.is_dir = stat.S_ISDIR(st.st_mode)
+        self.mime = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        self.size = st.st_size if is_file else 0
+        self.size_h = human_size(st.st_size) if is_file else "-"
+        self.mtime = int(st.st_mtime)
+        self.mtime_h = human_time(st.st_mtime)
+        self.raw_url = raw_prefix + q
+        self.download_url = download_prefix + q
+        self.thumb_url = f"{thumb_prefix}{q}&v={self.mtime}" if self.mime.startswith("image/") else None
+
+    def as_dict(self) -> dict:
+        return {k: getattr(self, k) for k in self.FIELDS}
+
+def file_url_prefixes() -> tuple[str, str, str]:
+    """raw/download/thumb URLs up to the path value, resolved once per listing instead of per entry.
+
+    Outside a request (the file watcher's thread) they are built from the URL map alone.
+    """
+    build = url_for if has_request_context() else app.url_map.bind("localhost").build
+    return (build("raw") + "?path=", build("download") + "?path=", build("thumb") + "?path=")
+
 def get_file_meta(p: Path) -> dict:
-    rel = path_rel(p)
-    mime = guess_mime(p)
-    return {
-        "name": p.name,
-        "rel": rel,
-        "is_dir": p.is_dir(),
-        "mime": mime,
-        "size": p.stat().st_size if p.is_file() else 0,
-        "size_h": human_size(p.stat().st_size) if p.is_file() else "-",
-        "mtime": int(p.stat().st_mtime),
-        "mtime_h": human_time(p.stat().st_mtime),
-        "raw_url": url_for("raw", path=rel),
-        "download_url": url_for("download", path=rel),
-    }
-
-def get_stats(folder: Path) -> dict:
-    files = 0
-    dirs = 0
-    size = 0
-    for p in folder.rglob("*"):
-        try:
-            if p.is_file():
-                files += 1
-                size += p.stat().st_size
-            elif p.is_dir():
-                dirs += 1
-        except Exception:
-            pass
-    return {"files": files, "dirs": dirs, "size_h": human_size(size)}
+    return FileMeta(p.name, path_rel(p), p.stat(), file_url_prefixes()).as_dict()
 
 def first_segment(rel: str) -> Optional[str]:
     rel = (rel or "").strip().strip("/")
     if not rel: return None
     return rel.split("/", 1)[0]
 
+def path_folder(p: Path) -> Optional[str]:
+    """Account a resolved path (from safe_path) lies in; None for ROOT_DIR itself.
+
+    Access checks must use this, not first_segment() of the request string: "pub/../priv"
+    starts with "pub" but resolves into "priv".
+    """
+    return first_segment(path_rel(p)) if p != ROOT_DIR else None
+
 def has_folder_access(folder: str) -> bool:
     cfg = get_user_cfg(folder)
     if cfg.get("public", True): return True
@@ -614,64 +1192,1345 @@ def enforce_access_or_redirect(folder: str):
     return redirect(url_for("unlock", folder=folder, next=next_url))
 
 # -----------------------------
-# Range streaming for /raw
+# Directory listings (cached per directory, paged by /api/list)
+# -----------------------------
+_listing_cache: OrderedDict[str, dict] = OrderedDict()  # dir path -> {"stamp", "entries", "views"}
+_listing_cache_guard = threading.Lock()
+
+LIST_SORTS = {
+    "name": lambda m: m.name_key,
+    "date": lambda m: m.mtime,
+    "size": lambda m: m.size,
+    "type": lambda m: m.mime.lower(),
+}
+
+def dir_listing(d: Path) -> dict:
+    """FileMeta for every visible entry of d, rebuilt only when d's mtime changes.
+
+    One scandir pass and one stat per entry.
+    """
+    key = str(d)
+    stamp = d.stat().st_mtime_ns
+    with _listing_cache_guard:
+        hit = _listing_cache.get(key)
+        if hit is not None and hit["stamp"] == stamp:
+            _listing_cache.move_to_end(key)
+            return hit
+    urls = file_url_prefixes()
+    base = path_rel(d) + "/" if d != ROOT_DIR else ""
+    entries = []
+    with os.scandir(d) as it:
+        for e in it:
+            if is_internal_name(e.name):
+                continue
+            try:
+                entries.append(FileMeta(e.name, base + e.name, e.stat(), urls))
+            except OSError:
+                continue  # removed while listing
+    listing = {"stamp": stamp, "entries": entries, "views": {}}
+    with _listing_cache_guard:
+        _listing_cache[key] = listing
+        _listing_cache.move_to_end(key)
+        while len(_listing_cache) > LIST_CACHE_DIRS:
+            _listing_cache.popitem(last=False)
+    return listing
+
+def invalidate_listing(d: Path):
+    with _listing_cache_guard:
+        _listing_cache.pop(str(d), None)
+
+def sorted_listing(d: Path, sort: str = "name", desc: bool = False, folders_first: bool = True) -> list[FileMeta]:
+    """Entries of d in the order the browse page shows them; each ordering is computed once per listing."""
+    listing = dir_listing(d)
+    if sort not in LIST_SORTS:
+        sort = "name"
+    view_key = (sort, desc, folders_first)
+    view = listing["views"].get(view_key)
+    if view is None:
+        by = LIST_SORTS[sort]
+        view = sorted(listing["entries"], key=lambda m: (by(m), m.name_key), reverse=desc)
+        if folders_first:
+            # Folders stay on top in both directions, like the client-side sort did.
+            view = [m for m in view if m.is_dir] + [m for m in view if not m.is_dir]
+        listing["views"][view_key] = view
+    return view
+
+def list_page(d: Path, sort: str, desc: bool, folders_first: bool, q: str = "", cursor: str = "", limit: int = LIST_PAGE_SIZE) -> dict:
+    view = sorted_listing(d, sort, desc, folders_first)
+    q = (q or "").strip().lower()
+    if q:
+        view = [m for m in view if q in m.name_key]
+    try:
+        start = max(0, int(cursor or 0))
+    except ValueError:
+        start = 0
+    limit = max(1, min(int(limit), LIST_PAGE_MAX))
+    page = view[start:start + limit]
+    end = start + len(page)
+    return {
+        "entries": page,
+        "total": len(view),
+        "next_cursor": str(end) if end < len(view) else None,
+    }
+
+def list_args(args, prefs: Optional[dict] = None) -> dict:
+    """Sort options from query args, falling back to the saved "sort" pref.
+
+    The pref is whatever a client once posted to /api/prefs, so anything but a dict of
+    strings is ignored.
+    """
+    prefs = prefs if isinstance(prefs, dict) else {}
+
+    def pref(key: str, default):
+        value = prefs.get(key)
+        return value if isinstance(value, type(default)) and value != "" else default
+
+    sort = args.get("sort") or pref("by", "date")
+    order = args.get("order") or pref("dir", "desc")
+    ff = args.get("folders_first")
+    folders_first = pref("foldersFirst", True) if ff is None else ff not in ("0", "false")
+    return {"sort": sort, "desc": order == "desc", "folders_first": bool(folders_first)}
+
+# -----------------------------
+# Usage ledger (per-account counters, reconciled in the background)
+# -----------------------------
+_usage_lock = threading.Lock()
+_usage_seq: dict[str, int] = {}  # folder -> incremental updates so far; a rescan that raced one is dropped
+
+def load_usage() -> dict:
+    return _load_json_file(USAGE_FILE, {})
+
+app.config["USAGE"] = load_usage()
+def usage_snapshot() -> dict:
+    with _usage_lock:
+        return {folder: dict(u) for folder, u in app.config["USAGE"].items()}
+
+JSON_FLUSHER.register(USAGE_FILE, usage_snapshot)
+
+def scan_usage(root: Path, throttle: float = 0.0, job: Optional["Job"] = None) -> dict:
+    """Count files, dirs and bytes under root; internal entries and their contents are skipped."""
+    files = dirs = size = 0
+    stack = [root]
+    while stack:
+        if job is not None:
+            job.progress(done=files + dirs, size=0)
+            job.check()
+        try:
+            with os.scandir(stack.pop()) as it:
+                for e in it:
+                    if is_internal_name(e.name):
+                        continue
+                    try:
+                        if e.is_dir(follow_symlinks=False):
+                            dirs += 1
+                            stack.append(e.path)
+                        elif e.is_file():
+                            files += 1
+                            size += e.stat().st_size
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+        if throttle:
+            time.sleep(throttle)
+    return {"files": files, "dirs": dirs, "bytes": size}
+
+def get_usage(folder: str) -> dict:
+    """Ledger entry for an account; the tree is scanned only the first time an account is seen."""
+    usage = app.config["USAGE"]
+    with _usage_lock:
+        u = usage.get(folder)
+    if u is None:
+        root = ROOT_DIR / folder
+        for _ in range(3):
+            with _usage_lock:
+                seq = _usage_seq.get(folder, 0)
+            u = scan_usage(root) if folder and root.is_dir() else {"files": 0, "dirs": 0, "bytes": 0}
+            with _usage_lock:
+                if _usage_seq.get(folder, 0) == seq:
+                    break  # no upload/delete landed mid-scan
+        u["reconciled"] = time.time()
+        with _usage_lock:
+            u = usage.setdefault(folder, u)
+            JSON_FLUSHER.mark_dirty(USAGE_FILE)
+    return u
+
+def adjust_usage(folder: Optional[str], files: int = 0, dirs: int = 0, size: int = 0):
+    if not folder:
+        return
+    usage = app.config["USAGE"]
+    with _usage_lock:
+        _usage_seq[folder] = _usage_seq.get(folder, 0) + 1
+        u = usage.get(folder)
+        if u is None:
+            return  # not tracked yet; the first get_usage() scans
+        u["files"] = max(0, u["files"] + files)
+        u["dirs"] = max(0, u["dirs"] + dirs)
+        u["bytes"] = max(0, u["bytes"] + size)
+        JSON_FLUSHER.mark_dirty(USAGE_FILE)
+
+def usage_stats(folder: str) -> dict:
+    u = get_usage(folder)
+    return {"files": u["files"], "dirs": u["dirs"], "size_h": human_size(u["bytes"])}
+
+def reconcile_usage(throttle: float = USAGE_SCAN_THROTTLE, folders: Optional[list] = None, log: bool = True,
+                    job: Optional["Job"] = None):
+    """Rescan every tracked account (or just folders) and replace counters that drifted (edits made outside the app)."""
+    usage = app.config["USAGE"]
+    if folders is None:
+        with _usage_lock:
+            folders = list(usage)
+    for folder in folders:
+        root = ROOT_DIR / folder
+        with _usage_lock:
+            seq = _usage_seq.get(folder, 0)
+        fresh = scan_usage(root, throttle, job) if root.is_dir() else None
+        with _usage_lock:
+            if fresh is None:
+                usage.pop(folder, None)
+            elif _usage_seq.get(folder, 0) == seq:
+                old = usage.get(folder) or {}
+                if log and any(old.get(k) != fresh[k] for k in ("files", "dirs", "bytes")):
+                    print(f"Usage for {folder} corrected: {old.get('files')}/{old.get('dirs')}/{old.get('bytes')} -> "
+                          f"{fresh['files']}/{fresh['dirs']}/{fresh['bytes']}")
+                fresh["reconciled"] = time.time()
+                usage[folder] = fresh
+            # else: updated while we were scanning; the next pass picks it up
+    JSON_FLUSHER.mark_dirty(USAGE_FILE)
+
+def _usage_reconciler():
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)  # Linux: niceness of this thread only
+    except (AttributeError, OSError):
+        pass
+    while True:
+        try:
+            reconcile_usage()
+        except Exception as e:
+            print("Usage reconcile failed:", e)
+        time.sleep(USAGE_RECONCILE_INTERVAL)
+
+def start_usage_reconciler():
+    threading.Thread(target=_usage_reconciler, name="usage-reconcile", daemon=True).start()
+
+def remove_counted(p: Path, removed: dict, job: Optional["Job"] = None):
+    """Delete a file or a whole tree, adding what went away to removed["files"/"dirs"/"bytes"].
+
+    Trees are walked bottom-up one directory at a time instead of being listed whole first.
+    With a job, progress is reported and cancellation checked after every entry.
+    """
+    def gone(path: str, is_dir: bool, size: int = 0):
+        if not is_internal_name(os.path.basename(path)):
+            removed["dirs" if is_dir else "files"] += 1
+            removed["bytes"] += size
+        if job is not None:
+            job.progress(done=removed["files"] + removed["dirs"], size=size)
+            job.check()
+
+    if p.is_symlink() or not p.is_dir():
+        size = p.lstat().st_size
+        p.unlink()
+        gone(str(p), False, size)
+        return
+    for root, dirs, files in os.walk(p, topdown=False):
+        for name in files:
+            fp = os.path.join(root, name)
+            size = os.lstat(fp).st_size
+            os.unlink(fp)
+            gone(fp, False, size)
+        for name in dirs:
+            dp = os.path.join(root, name)
+            if os.path.islink(dp):
+                os.unlink(dp)  # not followed, not counted
+            else:
+                os.rmdir(dp)
+                gone(dp, True)
+    p.rmdir()
+    gone(str(p), True)
+
+# -----------------------------
+# Background jobs (recursive delete, ZIP building, usage rescans): handlers answer 202 with a job
+# -----------------------------
+JOB_POOL = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+JOBS = ExpiringStore("jobs", ttl=JOB_KEEP, max_size=1000, label="Job store")  # finished jobs only
+ACTIVE_JOBS: dict[str, "Job"] = {}  # queued/running jobs; never evicted, at most JOB_MAX_ACTIVE per account
+_active_jobs_lock = threading.Lock()
+JOB_RUNNING_TTL = 7 * 24 * 3600  # how long a running delete may keep the watcher off its paths
+
+class JobCancelled(Exception):
+    pass
+
+class JobLimitReached(Exception):
+    pass
+
+class Job:
+    """One background operation for an account.
+
+    The runner gets the job: it calls progress() as it goes and check(), which raises
+    JobCancelled once cancel() was asked for. Progress reaches the account's sockets as
+    job_progress, at most every JOB_PROGRESS_INTERVAL seconds plus every state change.
+    """
+
+    def __init__(self, kind: str, folder: str, label: str):
+        self.id = secrets.token_urlsafe(12)
+        self.kind = kind
+        self.folder = folder
+        self.label = label
+        self.state = "queued"  # -> running -> done | failed | cancelled
+        self.done = 0
+        self.total: Optional[int] = None
+        self.bytes = 0
+        self.total_bytes: Optional[int] = None
+        self.error: Optional[str] = None
+        self.result: Optional[dict] = None
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.cancel_event = threading.Event()
+        self.future = None
+        self._emitted = 0.0
+
+    def as_dict(self) -> dict:
+        return {"id": self.id, "kind": self.kind, "label": self.label, "state": self.state,
+                "done": self.done, "total": self.total, "bytes": self.bytes, "total_bytes": self.total_bytes,
+                "error": self.error, "result": self.result, "created": self.created, "finished": self.finished}
+
+    def progress(self, done: Optional[int] = None, size: int = 0):
+        if done is not None:
+            self.done = done
+        self.bytes += size
+        now = time.monotonic()
+        if now - self._emitted >= JOB_PROGRESS_INTERVAL:
+            self.emit()
+
+    def check(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def emit(self):
+        self._emitted = time.monotonic()
+        socketio.emit("job_progress", self.as_dict(), to=account_room(self.folder))
+
+    def cancel(self):
+        self.cancel_event.set()
+        if self.future is not None and self.future.cancel():  # never started
+            self._finish("cancelled")
+
+    def _finish(self, state: str):
+        self.state = state
+        self.finished = time.time()
+        JOBS.set(self.id, self)  # kept JOB_KEEP seconds from now
+        with _active_jobs_lock:
+            ACTIVE_JOBS.pop(self.id, None)
+        self.emit()
+
+def _run_job(job: Job, fn):
+    if job.cancel_event.is_set():
+        return job._finish("cancelled")
+    job.state = "running"
+    job.emit()
+    try:
+        result = fn(job)
+        if result is not None:
+            job.result = {**(job.result or {}), **result}
+        job._finish("done")
+    except JobCancelled:
+        job._finish("cancelled")
+    except Exception as e:
+        print(f"Job {job.kind} {job.id} failed:", e)
+        job.error = str(e)
+        job._finish("failed")
+
+def start_job(job: Job, fn) -> Job:
+    """Queue fn(job) on the job pool; returns job for the 202 answer.
+
+    Raises JobLimitReached when the account already has JOB_MAX_ACTIVE jobs queued or running:
+    the pool's queue is unbounded and a ZIP job writes a whole copy of its tree to disk.
+    """
+    with _active_jobs_lock:
+        if sum(1 for j in ACTIVE_JOBS.values() if j.folder == job.folder) >= JOB_MAX_ACTIVE:
+            raise JobLimitReached()
+        ACTIVE_JOBS[job.id] = job
+    job.future = JOB_POOL.submit(_run_job, job, fn)
+    return job
+
+def get_job(job_id: str) -> Optional[Job]:
+    with _active_jobs_lock:
+        job = ACTIVE_JOBS.get(job_id)
+    return job or JOBS.get(job_id)
+
+def all_jobs() -> list[Job]:
+    with _active_jobs_lock:
+        jobs = {j.id: j for j in ACTIVE_JOBS.values()}
+    for j in JOBS.values():
+        jobs.setdefault(j.id, j)
+    return list(jobs.values())
+
+def job_response(job: Job):
+    return jsonify({"ok": True, "job": job.as_dict()}), 202
+
+def job_limit_response(**extra):
+    return jsonify({"ok": False, "error": f"too many jobs running (max {JOB_MAX_ACTIVE})", **extra}), 429
+
+def delete_tree_job(paths: list[Path], folder: str) -> Job:
+    """Delete directories in the background; viewers get "deleted" once each is gone."""
+    label = f"Deleting {paths[0].name}" if len(paths) == 1 else f"Deleting {len(paths)} folders"
+
+    def run(job: Job):
+        removed = {"files": 0, "dirs": 0, "bytes": 0}
+        gone = []
+        for p in paths:
+            FS_WATCHER.note_own(path_rel(p), ttl=JOB_RUNNING_TTL)  # the watcher would report every entry
+        try:
+            for p in paths:
+                remove_counted(p, removed, job)
+                gone.append(p)
+        finally:
+            adjust_usage(folder, -removed["files"], -removed["dirs"], -removed["bytes"])
+            for p in paths:
+                invalidate_listing(p.parent)
+                invalidate_listing(p)
+                FS_WATCHER.note_own(path_rel(p))
+                parent = path_rel(p.parent) if p.parent != ROOT_DIR else ""
+                if p in gone:
+                    emit_file_update({"action": "deleted", "dir": parent, "rel": path_rel(p)})
+                elif p.exists():
+                    emit_file_update({"action": "refresh", "dir": path_rel(p)})  # cancelled part way
+        return {"deleted": [path_rel(p) for p in gone], **removed}
+
+    return start_job(Job("delete", folder, label), run)
+
+def zip_job_file(job_id: str) -> Path:
+    return JOB_DIR / f"{job_id}.zip"
+
+def zip_archive_job(targets: list[Path], folder: str, name: str) -> Job:
+    """Build the archive /api/zip would stream into JOB_DIR, for a ranged (resumable) download later."""
+    job = Job("zip", folder, f"Zipping {name}")
+    job.result = {"name": name, "download_url": url_for("api_job_download", job_id=job.id)}
+
+    def run(job: Job):
+        members = [p for p, _ in zip_members(targets)]
+        job.total = len([p for p in members if p.is_file()])
+        job.total_bytes = sum(p.stat().st_size for p in members if p.is_file())
+        JOB_DIR.mkdir(exist_ok=True)
+        dst = zip_job_file(job.id)
+        tmp = dst.with_suffix(".part")
+        try:
+            with open(tmp, "wb") as out:
+                for chunk in iter_zip(targets, job):
+                    out.write(chunk)
+            os.replace(tmp, dst)
+        finally:
+            tmp.unlink(missing_ok=True)
+        return {"size": dst.stat().st_size}
+
+    return start_job(job, run)
+
+def usage_rescan_job(folder: str) -> Job:
+    def run(job: Job):
+        reconcile_usage(USAGE_SCAN_THROTTLE, folders=[folder], job=job)
+        stats = usage_stats(folder)
+        socketio.emit("usage_update", stats, to=account_room(folder))
+        return stats
+
+    return start_job(Job("rescan", folder, "Recounting storage"), run)
+
+def gc_job_files():
+    """Drop archives whose job expired (or is unknown after a restart)."""
+    if not JOB_DIR.is_dir():
+        return
+    for f in JOB_DIR.iterdir():
+        job_id = f.name.split(".", 1)[0]
+        job = get_job(job_id)
+        if job is None or job.state in ("failed", "cancelled"):
+            f.unlink(missing_ok=True)
+
+# -----------------------------
+# Filesystem watcher (changes made to account folders by other programs)
+# -----------------------------
+IN_MODIFY, IN_ATTRIB, IN_CLOSE_WRITE = 0x2, 0x4, 0x8
+IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x40, 0x80, 0x100, 0x200
+IN_DELETE_SELF, IN_MOVE_SELF, IN_Q_OVERFLOW, IN_IGNORED = 0x400, 0x800, 0x4000, 0x8000
+IN_ONLYDIR, IN_DONT_FOLLOW, IN_EXCL_UNLINK, IN_ISDIR = 0x01000000, 0x02000000, 0x04000000, 0x40000000
+INOTIFY_MASK = (IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+                | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK)
+INOTIFY_EVENT = struct.Struct("iIII")  # wd, mask, cookie, name length
+
+class Inotify:
+    """Minimal inotify binding over libc (Linux only); raises OSError where it is unavailable."""
+
+    def __init__(self):
+        libname = ctypes.util.find_library("c")
+        if not libname or not hasattr(os, "O_NONBLOCK"):
+            raise OSError("inotify not available")
+        self.libc = ctypes.CDLL(libname, use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError("inotify not available")
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def add_watch(self, path: str, mask: int) -> int:
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), ctypes.c_uint32(mask))
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def close(self, wds=()):
+        """Remove the given watches and close the descriptor."""
+        for wd in wds:
+            self.libc.inotify_rm_watch(self.fd, wd)
+        os.close(self.fd)
+
+    def read(self, timeout: float) -> list[tuple[int, int, str]]:
+        """(wd, mask, name) for the events that arrive within timeout seconds."""
+        if not select.select([self.fd], [], [], max(timeout, 0))[0]:
+            return []
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events, i = [], 0
+        while i + INOTIFY_EVENT.size <= len(buf):
+            wd, mask, _cookie, n = INOTIFY_EVENT.unpack_from(buf, i)
+            i += INOTIFY_EVENT.size
+            events.append((wd, mask, os.fsdecode(buf[i:i + n].rstrip(b"\0"))))
+            i += n
+        return events
+
+class FsWatcher:
+    """Pushes changes made under ROOT_DIR by other programs (rsync, scanners) through emit_file_update().
+
+    Events are gathered per path until FS_WATCH_DEBOUNCE_MS passes without new ones, then each
+    path is stat'ed once and reported as added or deleted; listings are dropped from the cache and
+    the account's usage is rescanned. Paths the app changed itself (noted by emit_file_update) are
+    skipped for FS_WATCH_OWN_TTL seconds, as are internal entries and files directly in ROOT_DIR.
+    Uses inotify on Linux and falls back to walking the tree every FS_WATCH_POLL_INTERVAL seconds.
+    """
+
+    def __init__(self, root: Path, mode: str):
+        self.root = root
+        self.mode = mode
+        self.debounce = FS_WATCH_DEBOUNCE_MS / 1000.0
+        self._own: dict[str, float] = {}  # rel -> monotonic time until which changes to it (and below) are ours
+        self._own_lock = threading.Lock()
+        self.pending: dict[str, bool] = {}  # rel -> first event was a create/move-in
+        self.first_at = self.last_at = 0.0
+        self.rescan_at: dict[str, float] = {}  # folder -> earliest time of its next usage rescan
+        self.rescanned: dict[str, float] = {}
+        self.inotify = None
+        self.wds: dict[int, str] = {}  # inotify watch -> rel of the watched dir ("" = ROOT_DIR)
+        self.snapshot: dict[str, tuple] = {}
+        self.thread = None
+        self.stats = {"events": 0, "reported": 0, "own": 0, "rescans": 0, "overflows": 0}
+
+    # ---- bookkeeping shared with request threads
+    def note_own(self, rel: str, ttl: float = FS_WATCH_OWN_TTL):
+        if not rel:
+            return
+        with self._own_lock:
+            self._own[rel] = time.monotonic() + ttl
+
+    def is_own(self, rel: str) -> bool:
+        now = time.monotonic()
+        with self._own_lock:
+            if len(self._own) > 1000:
+                self._own = {k: t for k, t in self._own.items() if t > now}
+            while rel:
+                if self._own.get(rel, 0) > now:
+                    return True
+                rel = rel.rpartition("/")[0]
+        return False
+
+    # ---- change collection
+    def _note(self, rel: str, created: bool):
+        if "/" not in rel or any(is_internal_name(part) for part in rel.split("/")):
+            return  # ROOT_DIR itself holds only account folders and bookkeeping files
+        now = time.monotonic()
+        if not self.pending:
+            self.first_at = now
+        self.last_at = now
+        self.pending[rel] = self.pending.get(rel, False) or created
+        self.stats["events"] += 1
+
+    def _watch_tree(self, rel: str):
+        """Watch rel and every directory below it; entries found there count as created."""
+        stack = [rel]
+        while stack:
+            cur = stack.pop()
+            try:
+                self.wds[self.inotify.add_watch(str(self.root / cur) if cur else str(self.root), INOTIFY_MASK)] = cur
+                with os.scandir(self.root / cur) as it:
+                    for e in it:
+                        if is_internal_name(e.name):
+                            continue
+                        child = f"{cur}/{e.name}" if cur else e.name
+                        if cur:
+                            self._note(child, True)  # may predate the watch
+                        if e.is_dir(follow_symlinks=False):
+                            stack.append(child)
+            except (FileNotFoundError, NotADirectoryError, PermissionError):
+                continue
+
+    def _read_inotify(self, timeout: float):
+        for wd, mask, name in self.inotify.read(timeout):
+            if mask & IN_Q_OVERFLOW:
+                self.stats["overflows"] += 1
+                print("File watcher queue overflowed; rescanning all accounts")
+                with _listing_cache_guard:
+                    _listing_cache.clear()
+                for folder in self._account_folders():
+                    self.rescan_at[folder] = 0
+                continue
+            if mask & IN_IGNORED:
+                self.wds.pop(wd, None)
+                continue
+            base = self.wds.get(wd)
+            if base is None or not name or is_internal_name(name):
+                continue
+            rel = f"{base}/{name}" if base else name
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self._watch_tree(rel)  # moved-in dirs keep their watch ids; this also re-maps them
+            self._note(rel, bool(mask & (IN_CREATE | IN_MOVED_TO)))
+
+    def _account_folders(self) -> list[str]:
+        try:
+            with os.scandir(self.root) as it:
+                return [e.name for e in it if not is_internal_name(e.name) and e.is_dir(follow_symlinks=False)]
+        except OSError:
+            return []
+
+    def _walk(self) -> dict[str, tuple]:
+        snap = {}
+        stack = self._account_folders()
+        while stack:
+            cur = stack.pop()
+            try:
+                with os.scandir(self.root / cur) as it:
+                    for e in it:
+                        if is_internal_name(e.name):
+                            continue
+                        try:
+                            st = e.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        rel = f"{cur}/{e.name}"
+                        is_dir = stat.S_ISDIR(st.st_mode)
+                        snap[rel] = (is_dir, 0 if is_dir else st.st_size, st.st_mtime_ns)
+                        if is_dir:
+                            stack.append(rel)
+            except OSError:
+                continue
+            time.sleep(USAGE_SCAN_THROTTLE)
+        return snap
+
+    def _poll(self):
+        snap = self._walk()
+        old = self.snapshot
+        for rel, sig in snap.items():
+            if old.get(rel) != sig:
+                self._note(rel, rel not in old)
+        for rel in old.keys() - snap.keys():
+            self._note(rel, False)
+        self.snapshot = snap
+
+    # ---- reporting
+    def flush(self):
+        pending, self.pending = self.pending, {}
+        payloads, touched, covered = [], set(), set()
+        for rel in sorted(pending):  # parents before children
+            if self.is_own(rel):
+                self.stats["own"] += 1
+                continue
+            p = self.root / rel
+            parent = rel.rpartition("/")[0]
+            invalidate_listing(p.parent)
+            invalidate_listing(p)
+            touched.add(first_segment(rel))
+            if any(a in covered for a in self._ancestors(parent)):
+                continue  # inside a tree that appeared or vanished as a whole: reported at its top
+            try:
+                meta = get_file_meta(p)
+            except OSError:
+                meta = None
+            if meta is not None:
+                if pending[rel]:
+                    covered.add(rel)
+                payloads.append({"action": "added", "dir": parent, "meta": meta})
+            elif not pending[rel]:  # else it came and went within the window (a temp file)
+                covered.add(rel)
+                payloads.append({"action": "deleted", "dir": parent, "rel": rel})
+        now = time.monotonic()
+        for folder in touched:
+            self.rescan_at.setdefault(folder, max(now, self.rescanned.get(folder, 0) + FS_WATCH_RESCAN_GAP))
+        self._rescan_due(now, emit_usage=False)
+        for payload in payloads:
+            emit_file_update(payload, external=True)
+        self.stats["reported"] += len(payloads)
+
+    @staticmethod
+    def _ancestors(rel: str):
+        while rel:
+            yield rel
+            rel = rel.rpartition("/")[0]
+
+    def _rescan_due(self, now: float, emit_usage: bool = True):
+        due = [f for f, t in self.rescan_at.items() if t <= now]
+        if not due:
+            return
+        for folder in due:
+            del self.rescan_at[folder]
+            self.rescanned[folder] = now
+        reconcile_usage(USAGE_SCAN_THROTTLE, folders=due, log=False)
+        self.stats["rescans"] += len(due)
+        if emit_usage:
+            for folder in due:
+                socketio.emit("usage_update", usage_stats(folder), to=account_room(folder))
+
+    def _timeout(self, now: float) -> float:
+        waits = [min(t for t in self.rescan_at.values()) - now] if self.rescan_at else []
+        if self.pending:
+            waits.append(min(self.last_at + self.debounce, self.first_at + FS_WATCH_MAX_DELAY) - now)
+        elif self.inotify is None:
+            waits.append(FS_WATCH_POLL_INTERVAL)
+        return max(0.0, min(waits)) if waits else 60.0
+
+    def _stop_inotify(self):
+        """Drop the watches added so far and close the descriptor before falling back to polling."""
+        if self.inotify is not None:
+            try:
+                self.inotify.close(list(self.wds))
+            except OSError as e:
+                print("File watcher: closing inotify failed:", e)
+        self.inotify, self.wds = None, {}
+
+    def start(self) -> bool:
+        if self.mode == "off":
+            return False
+        if self.mode in ("auto", "inotify"):
+            try:
+                self.inotify = Inotify()
+                self._watch_tree("")
+                self.pending.clear()  # what is there at startup is not a change
+            except OSError as e:
+                print(f"File watcher: inotify unavailable ({e}); polling every {FS_WATCH_POLL_INTERVAL}s")
+                self._stop_inotify()
+                self.pending.clear()
+        if self.inotify is None:
+            self.snapshot = self._walk()
+        self.thread = threading.Thread(target=self._run, name="fs-watcher", daemon=True)
+        self.thread.start()
+        return True
+
+    def _run(self):
+        next_poll = time.monotonic() + FS_WATCH_POLL_INTERVAL
+        while True:
+            try:
+                now = time.monotonic()
+                if self.inotify is not None:
+                    self._read_inotify(self._timeout(now))
+                else:
+                    if now >= next_poll:
+                        self._poll()
+                        next_poll = time.monotonic() + FS_WATCH_POLL_INTERVAL
+                    time.sleep(min(self._timeout(time.monotonic()), max(0.0, next_poll - time.monotonic())))
+                now = time.monotonic()
+                if self.pending and (now - self.last_at >= self.debounce or now - self.first_at >= FS_WATCH_MAX_DELAY):
+                    self.flush()
+                self._rescan_due(now)
+            except OSError as e:
+                if self.inotify is not None and e.errno == errno.ENOSPC:
+                    print("File watcher: out of inotify watches (fs.inotify.max_user_watches); switching to polling")
+                    self._stop_inotify()
+                    self.snapshot = self._walk()
+                else:
+                    print("File watcher error:", e)
+                    time.sleep(1)
+            except Exception as e:
+                print("File watcher error:", e)
+                time.sleep(1)
+
+FS_WATCHER = FsWatcher(ROOT_DIR, FS_WATCH)
+
+def start_fs_watcher():
+    FS_WATCHER.start()
+
+# -----------------------------
+# Streaming uploads (no Werkzeug spool file)
+# -----------------------------
+def iter_multipart(stream, boundary: bytes):
+    """Yield multipart events while reading the body in UPLOAD_CHUNK_SIZE pieces."""
+    decoder = MultipartDecoder(boundary)
+    while True:
+        event = decoder.next_event()
+        if isinstance(event, NeedData):
+            decoder.receive_data(stream.read(UPLOAD_CHUNK_SIZE) or None)
+        elif isinstance(event, Epilogue):
+            return
+        else:
+            yield event
+
+def open_upload_temp(dest_dir: Path):
+    # Same filesystem as the final file, so the commit is a rename, not a copy.
+    tmp = dest_dir / f"{INTERNAL_PREFIX}upload-{secrets.token_hex(8)}.part"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o666)
+    return os.fdopen(fd, "wb"), tmp
+
+def commit_upload_temp(tmp: Path, dest_dir: Path, filename: str) -> Path:
+    """Move tmp to filename in dest_dir, or "name (n).ext" if taken.
+
+    The name is claimed atomically (hard link, or an O_EXCL placeholder where links are not
+    supported), so two uploads racing for one free name never overwrite each other.
+    """
+    base, ext = os.path.splitext(filename)
+    i = 0
+    while True:
+        save_path = dest_dir / (filename if i == 0 else f"{base} ({i}){ext}")
+        i += 1
+        if os.path.lexists(save_path):
+            continue
+        try:
+            os.link(tmp, save_path)
+        except FileExistsError:
+            continue
+        except OSError as e:
+            if e.errno == errno.EXDEV:
+                raise
+            try:
+                os.close(os.open(save_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+            except FileExistsError:
+                continue
+            os.replace(tmp, save_path)
+            return save_path
+        tmp.unlink()
+        return save_path
+
+def split_upload_relpath(relpath: str) -> Optional[list[str]]:
+    """Sanitized segments of a relative path sent with a batch upload; None if it climbs out or is empty."""
+    parts = [seg for seg in (relpath or "").replace("\\", "/").split("/") if seg not in ("", ".")]
+    if not parts or ".." in parts:
+        return None
+    return [sanitize_filename(seg) for seg in parts]
+
+class UploadBatch:
+    """Entries of one /api/upload/batch body (or /api/mkdirs list), written one after another below dest_dir.
+
+    Directories in the relative paths are created on the way. finish() updates caches and
+    usage once and reports the new entries in one go.
+    """
+
+    def __init__(self, dest_dir: Path):
+        self.dest_dir = dest_dir
+        self.known_dirs = {dest_dir}
+        self.new_dirs: list[Path] = []
+        self.saved: list[tuple[Path, int]] = []
+        self.skipped: list[str] = []
+        self.out = self.tmp = self.current = None
+
+    def make_dirs(self, parts: list[str]) -> Optional[Path]:
+        d = self.dest_dir
+        for seg in parts:
+            d = d / seg
+            if d in self.known_dirs:
+                continue
+            if not d.is_dir():
+                if d.exists():
+                    return None  # a file is in the way
+                d.mkdir()
+                self.new_dirs.append(d)
+                FS_WATCHER.note_own(path_rel(d))
+            self.known_dirs.add(d)
+        return d
+
+    def add_dir(self, relpath: str):
+        parts = split_upload_relpath(relpath)
+        if not parts or self.make_dirs(parts) is None:
+            self.skipped.append(relpath)
+
+    def begin(self, relpath: str):
+        """Temp file for the next entry's bytes; None if the entry is skipped."""
+        parts = split_upload_relpath(relpath)
+        if parts and ALLOWED_UPLOAD_EXT:
+            ext = parts[-1].rsplit(".", 1)[-1].lower() if "." in parts[-1] else ""
+            if ext not in ALLOWED_UPLOAD_EXT:
+                parts = None
+        d = self.make_dirs(parts[:-1]) if parts else None
+        if d is None:
+            self.skipped.append(relpath)
+            return None
+        self.out, self.tmp = open_upload_temp(d)
+        self.current = (d, parts[-1])
+        return self.out
+
+    def end(self):
+        if self.out is None:
+            return
+        size = self.out.tell()
+        self.out.close()
+        d, name = self.current
+        p = commit_upload_temp(self.tmp, d, name)
+        self.out = self.tmp = self.current = None
+        FS_WATCHER.note_own(path_rel(p))
+        self.saved.append((p, size))
+        queue_thumbnail(p)
+
+    def discard(self):
+        """Drop a half-written entry (bad body, client gone)."""
+        if self.out is not None:
+            self.out.close()
+            self.tmp.unlink(missing_ok=True)
+            self.out = self.tmp = self.current = None
+
+    def finish(self) -> dict:
+        new_dirs = set(self.new_dirs)
+        entries = self.new_dirs + [p for p, _ in self.saved]
+        for d in {p.parent for p in entries}:
+            invalidate_listing(d)
+        adjust_usage(first_segment(path_rel(self.dest_dir)), files=len(self.saved), dirs=len(self.new_dirs),
+                     size=sum(size for _, size in self.saved))
+        by_dir: dict[Path, list[Path]] = {}
+        for p in entries:
+            if p.parent not in new_dirs:  # inside a new folder: its own "added" covers it
+                by_dir.setdefault(p.parent, []).append(p)
+        for d, items in by_dir.items():
+            parent_rel = path_rel(d) if d != ROOT_DIR else ""
+            if len(items) > BATCH_DIR_EVENTS_MAX:
+                emit_file_update({"action": "refresh", "dir": parent_rel, "count": len(items)})
+                continue
+            for p in items:
+                try:
+                    emit_file_update({"action": "added", "dir": parent_rel, "meta": get_file_meta(p)})
+                except OSError:
+                    continue
+        return {"saved": len(self.saved), "dirs": len(self.new_dirs), "bytes": sum(size for _, size in self.saved),
+                "skipped": self.skipped[:100]}
+
+# -----------------------------
+# Resumable uploads (tus-style sessions, state kept on disk)
+# -----------------------------
+_upload_locks: dict[str, threading.Lock] = {}
+_upload_locks_guard = threading.Lock()
+_last_upload_gc = 0.0
+
+def upload_session_lock(upload_id: str) -> threading.Lock:
+    with _upload_locks_guard:
+        return _upload_locks.setdefault(upload_id, threading.Lock())
+
+def upload_session_file(upload_id: str) -> Optional[Path]:
+    if not re.fullmatch(r"[A-Za-z0-9_\-]{16,64}", upload_id or ""):
+        return None
+    return UPLOAD_SESSIONS_DIR / f"{upload_id}.json"
+
+def load_upload_session(upload_id: str) -> Optional[dict]:
+    p = upload_session_file(upload_id)
+    if not p or not p.exists():
+        return None
+    info = _load_json_file(p, {}) or None
+    if info is not None and "ranges" not in info:
+        info["ranges"] = [[0, info["offset"]]] if info.get("offset") else []
+    return info
+
+def save_upload_session(info: dict):
+    info["updated"] = time.time()
+    _save_json_file(UPLOAD_SESSIONS_DIR / f"{info['id']}.json", info)
+
+def upload_part_path(info: dict) -> Optional[Path]:
+    part = (ROOT_DIR / (info.get("part") or "")).resolve()
+    if ROOT_DIR in part.parents and is_internal_name(part.name):
+        return part
+    return None
+
+def discard_upload_session(info: dict):
+    part = upload_part_path(info)
+    if part:
+        part.unlink(missing_ok=True)
+    meta = upload_session_file(info.get("id", ""))
+    if meta:
+        meta.unlink(missing_ok=True)
+    with _upload_locks_guard:
+        _upload_locks.pop(info.get("id"), None)
+
+def gc_upload_sessions(force: bool = False):
+    """Drop resumable uploads that have not received data for UPLOAD_SESSION_TTL seconds."""
+    global _last_upload_gc
+    now = time.time()
+    if not force and now - _last_upload_gc < 600:
+        return
+    _last_upload_gc = now
+    if not UPLOAD_SESSIONS_DIR.exists():
+        return
+    for meta in UPLOAD_SESSIONS_DIR.glob("*.json"):
+        info = _load_json_file(meta, {})
+        if now - float(info.get("updated", 0)) < UPLOAD_SESSION_TTL:
+            continue
+        with upload_session_lock(meta.stem):
+            discard_upload_session({**info, "id": meta.stem})
+
+def add_upload_range(info: dict, start: int, end: int):
+    """Merge [start, end) into the committed ranges; "offset" is the contiguous prefix."""
+    merged: list[list[int]] = []
+    for a, b in sorted(info["ranges"] + [[start, end]]):
+        if merged and a <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], b)
+        else:
+            merged.append([a, b])
+    info["ranges"] = merged
+    info["offset"] = merged[0][1] if merged and merged[0][0] == 0 else 0
+
+def preallocate(fd: int, size: int):
+    if size <= 0:
+        return
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except (AttributeError, OSError):
+        os.ftruncate(fd, size)  # no fallocate here (or unsupported FS): sparse file instead
+
+class _Crc32:
+    def __init__(self):
+        self.value = 0
+    def update(self, data: bytes):
+        self.value = zlib.crc32(data, self.value)
+    def digest(self) -> bytes:
+        return (self.value & 0xFFFFFFFF).to_bytes(4, "big")
+
+UPLOAD_CHECKSUMS = {"crc32": _Crc32, "md5": hashlib.md5, "sha1": hashlib.sha1, "sha256": hashlib.sha256}
+
+def parse_upload_checksum(header: Optional[str]):
+    """Parse `Upload-Checksum: <algo> <base64 digest>` (tus checksum extension)."""
+    if not header:
+        return None
+    algo, _, b64 = header.strip().partition(" ")
+    factory = UPLOAD_CHECKSUMS.get(algo.lower())
+    if not factory:
+        raise ValueError(f"unsupported checksum algorithm: {algo}")
+    return factory(), base64.b64decode(b64.strip(), validate=True)
+
+def upload_offset_response(info: dict, status: int = 200):
+    rv = jsonify({"ok": status < 400, "id": info["id"], "offset": info["offset"], "ranges": info["ranges"],
+                  "size": info["size"], "name": info["name"]})
+    rv.status_code = status
+    rv.headers["Upload-Offset"] = str(info["offset"])
+    rv.headers["Upload-Length"] = str(info["size"])
+    rv.headers["Cache-Control"] = "no-store"
+    return rv
+
+# -----------------------------
+# Range streaming for /raw and /download (RFC 7232/7233)
 # -----------------------------
-def send_partial_file(p: Path, mime: str):
-    size = p.stat().st_size
-    range_header = request.headers.get("Range", None)
-    if not range_header:
-        return send_file(p, mimetype=mime, conditional=True)
-    m = re.match(r"bytes=(\d+)-(\d*)", range_header)
-    if not m:
-        return send_file(p, mimetype=mime, conditional=True)
-    start = int(m.group(1))
-    end = m.group(2)
-    end = int(end) if end else size - 1
-    if start >= size:
-        return Response(status=416, headers={"Content-Range": f"bytes */{size}"})
-    length = end - start + 1
-    def stream():
-        with p.open("rb") as f:
+SENDFILE_BLOCK = 8 * 1024 * 1024
+MAX_RANGES = 64  # more than this in one request is treated as no Range at all
+
+def file_etag(st: os.stat_result) -> str:
+    return f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+def parse_byte_ranges(header: str, size: int) -> Optional[list[tuple[int, int]]]:
+    """Parse a Range header into sorted, coalesced inclusive (start, end) pairs.
+
+    Returns None when the header must be ignored (syntax error, other unit,
+    too many ranges) and [] when it is valid but unsatisfiable.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes":
+        return None
+    specs = [x.strip() for x in spec.split(",") if x.strip()]
+    if not specs or len(specs) > MAX_RANGES:
+        return None
+    ranges = []
+    for item in specs:
+        first, sep, last = item.partition("-")
+        first, last = first.strip(), last.strip()
+        if not sep or (first and not re.fullmatch(r"[0-9]+", first)) or (last and not re.fullmatch(r"[0-9]+", last)):
+            return None
+        if first:
+            start = int(first)
+            if last and int(last) < start:
+                return None
+            end = int(last) if last else size - 1
+            if start < size:
+                ranges.append((start, min(end, size - 1)))
+        elif last:
+            n = int(last)  # suffix range: the last n bytes
+            if n > 0 and size > 0:
+                ranges.append((max(0, size - n), size - 1))
+        else:
+            return None
+    merged: list[tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def if_range_allows(if_range: Optional[str], etag: str, mtime: float) -> bool:
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith(('"', "W/")):
+        return if_range == etag  # strong comparison; weak tags never match
+    date = parse_date(if_range)
+    return date is not None and int(date.timestamp()) == int(mtime)
+
+def not_modified(etag: str, mtime: float) -> bool:
+    inm = request.headers.get("If-None-Match")
+    if inm:
+        tags = {t.strip().removeprefix("W/") for t in inm.split(",")}
+        return "*" in tags or etag in tags
+    ims = parse_date(request.headers.get("If-Modified-Since"))
+    return ims is not None and int(mtime) <= int(ims.timestamp())
+
+def _read_segments(p: Path, segments: list):
+    with p.open("rb") as f:
+        for seg in segments:
+            if isinstance(seg, bytes):
+                yield seg
+                continue
+            start, remaining = seg
             f.seek(start)
-            remaining = length
             chunk = 1024 * 1024
             while remaining > 0:
                 data = f.read(min(chunk, remaining))
                 if not data: break
                 remaining -= len(data)
                 yield data
-    rv = Response(stream(), status=206, mimetype=mime, direct_passthrough=True)
-    rv.headers.add("Content-Range", f"bytes {start}-{end}/{size}")
-    rv.headers.add("Accept-Ranges", "bytes")
-    rv.headers.add("Content-Length", str(length))
+
+def _sendfile_segments(sock, p: Path, segments: list):
+    with p.open("rb") as f:
+        # The empty chunk makes the server flush the status line and headers
+        # (Content-Length is set, so no chunked framing); the body then goes
+        # file -> socket inside the kernel.
+        yield b""
+        for seg in segments:
+            if isinstance(seg, bytes):
+                sock.sendall(seg)
+            else:
+                sock.sendfile(f, seg[0], seg[1])
+
+def range_body(p: Path, segments: list, size: int):
+    """Body iterator for a list of literal bytes and (offset, length) file spans.
+
+    Zero-copy when the WSGI server allows it, plain read loop otherwise.
+    """
+    environ = request.environ
+    if ZERO_COPY:
+        wrapper = environ.get("wsgi.file_wrapper")
+        if wrapper is not None and len(segments) == 1 and sum(segments[0]) == size:
+            # gunicorn & co. sendfile() from the current position to EOF
+            f = p.open("rb")
+            f.seek(segments[0][0])
+            return wrapper(f, SENDFILE_BLOCK)
+        sock = environ.get("werkzeug.socket")
+        if sock is not None and hasattr(os, "sendfile"):
+            return _sendfile_segments(sock, p, segments)
+    return _read_segments(p, segments)
+
+def set_content_disposition(rv: Response, name: str):
+    try:
+        name.encode("ascii")
+        names = {"filename": name}
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+        names = {"filename": simple, "filename*": "UTF-8''" + quote(name, safe="!#$&+-.^_`|~")}
+    rv.headers.set("Content-Disposition", "attachment", **names)
+
+def send_partial_file(p: Path, mime: str, as_attachment: bool = False):
+    """Serve p with validators, If-Range and single/multiple byte ranges."""
+    st = p.stat()
+    size = st.st_size
+    etag = file_etag(st)
+    headers = {"Accept-Ranges": "bytes", "ETag": etag, "Last-Modified": http_date(st.st_mtime), "Cache-Control": "no-cache"}
+
+    # If-None-Match / If-Modified-Since come before Range and If-Range (RFC 7232 section 6).
+    if not_modified(etag, st.st_mtime):
+        return Response(status=304, headers=headers)
+    range_header = request.headers.get("Range")
+    ranges = None
+    if range_header and if_range_allows(request.headers.get("If-Range"), etag, st.st_mtime):
+        ranges = parse_byte_ranges(range_header, size)
+    if ranges == []:
+        return Response(status=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    if not ranges:
+        status, segments = 200, [(0, size)]
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        status, segments = 206, [(start, end - start + 1)]
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    else:
+        boundary = secrets.token_hex(16)
+        status, segments = 206, []
+        for start, end in ranges:
+            part_head = f"\r\n--{boundary}\r\nContent-Type: {mime}\r\nContent-Range: bytes {start}-{end}/{size}\r\n\r\n"
+            segments += [part_head.encode("latin-1"), (start, end - start + 1)]
+        segments.append(f"\r\n--{boundary}--\r\n".encode("latin-1"))
+    length = sum(len(seg) if isinstance(seg, bytes) else seg[1] for seg in segments)
+
+    rv = Response(range_body(p, segments, size), status=status, mimetype=mime, headers=headers, direct_passthrough=True)
+    rv.headers["Content-Length"] = str(length)
+    if len(segments) > 1:
+        rv.headers["Content-Type"] = f"multipart/byteranges; boundary={boundary}"
+    if as_attachment:
+        set_content_disposition(rv, p.name)
     return rv
 
 # -----------------------------
-# Templates (UI)
+# Streaming ZIP archives (/api/zip): built while it is sent, never held in memory or on disk
 # -----------------------------
-BASE_HTML = """
-<!doctype html>
-<html lang="en">
-<head>
+class _ZipSink:
+    """Write-only target for ZipFile. It can tell() but not seek(), so entries get data descriptors."""
 
-<script>
-  (function(){try{var t=localStorage.getItem('theme')||''; if(t&&t!=='dark') document.documentElement.classList.add(t);}catch(e){}})();
-</script>
-  <meta charset="utf-8"/>
-  <meta name="viewport" content="width=device-width, initial-scale=1, viewport-fit=cover"/>
-  <meta name="apple-mobile-web-app-capable" content="yes"/>
-  <meta name="apple-mobile-web-app-status-bar-style" content="black-translucent"/>
-  <title>FileVault</title>
+    def __init__(self):
+        self.chunks: list[bytes] = []
+        self.pos = 0
 
-<link rel="icon" href="/static/favicon.svg" type="image/svg+xml" />
-<link rel="manifest" href="/static/site.webmanifest" />
-<meta name="theme-color" content="#0F172A" id="themeColorMeta" />
-<link rel="stylesheet" href="/static/fonts.css" />
-<link rel="stylesheet" href="/static/vendor/fontawesome/css/all.min.css" />
-<link rel="stylesheet" href="/static/vendor/fontawesome/css/fa-shims.css" />
+    def write(self, b) -> int:
+        self.chunks.append(bytes(b))
+        self.pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self.pos
+
+    def flush(self):
+        pass
 
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+def zip_members(targets: list[Path]):
+    """(path, name in archive) for each target and everything below it; internal entries and symlinks are left out."""
+    used = set()
+    for top in targets:
+        name = top.name
+        stem, dot, ext = name.partition(".") if top.is_file() else (name, "", "")
+        n = 2
+        while name in used:
+            name = f"{stem} ({n}){dot}{ext}"
+            n += 1
+        used.add(name)
+        stack = [(top, name)]
+        while stack:
+            p, arc = stack.pop()
+            yield p, arc
+            if p.is_dir() and not p.is_symlink():
+                try:
+                    with os.scandir(p) as it:
+                        children = sorted((e.name for e in it if not is_internal_name(e.name) and not e.is_symlink()), reverse=True)
+                except OSError:
+                    continue
+                stack.extend((p / c, f"{arc}/{c}") for c in children)
+
+def iter_zip(targets: list[Path], job: Optional["Job"] = None):
+    """Yield a ZIP64 archive of targets piece by piece; memory stays at about one read chunk."""
+    sink = _ZipSink()
+    zf = zipfile.ZipFile(sink, "w", allowZip64=True)
+    for p, arc in zip_members(targets):
+        try:
+            zi = zipfile.ZipInfo.from_file(p, arc, strict_timestamps=False)
+            if zi.is_dir():
+                zf.writestr(zi, b"")
+                yield sink.drain()
+                continue
+            src = open(p, "rb")
+        except OSError:
+            continue  # removed since the listing
+        with src:
+            ext = os.path.splitext(arc)[1][1:].lower()
+            zi.compress_type = zipfile.ZIP_STORED if ext in ZIP_STORED_EXTS else zipfile.ZIP_DEFLATED
+            with zf.open(zi, "w", force_zip64=zi.file_size > 0x7FFFFFFF) as dst:
+                while True:
+                    chunk = src.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    if job is not None:
+                        job.progress(size=len(chunk))
+                        job.check()
+                    yield sink.drain()
+        if job is not None:
+            job.progress(done=job.done + 1)
+        yield sink.drain()
+    zf.close()
+    yield sink.drain()
+
+# -----------------------------
+# Thumbnails (Pillow, cached on disk, rendered by a small worker pool)
+# -----------------------------
+THUMB_FORMAT = ("WEBP" if pil_features.check("webp") else "JPEG") if Image else None
+THUMB_MIME = {"WEBP": "image/webp", "JPEG": "image/jpeg"}.get(THUMB_FORMAT)
+THUMB_POOL = ThreadPoolExecutor(max_workers=THUMB_WORKERS, thread_name_prefix="thumb")
+_thumb_jobs: dict[Path, object] = {}
+_thumb_jobs_guard = threading.Lock()
+
+def thumb_cache_path(p: Path, st: os.stat_result, size_key: str) -> Path:
+    key = hashlib.sha1(f"{path_rel(p)}\0{size_key}\0{st.st_mtime_ns}\0{st.st_size}".encode("utf-8")).hexdigest()
+    return THUMB_DIR / key[:2] / f"{key}.{THUMB_FORMAT.lower()}"
+
+def _render_thumb(src: Path, dst: Path, px: int):
+    with Image.open(src) as im:
+        im.draft("RGB", (px, px))  # JPEG: let the decoder downscale (much faster than full decode)
+        im = ImageOps.exif_transpose(im)
+        im.thumbnail((px, px))
+        if THUMB_FORMAT == "JPEG" or im.mode not in ("RGB", "RGBA"):
+            im = im.convert("RGBA" if THUMB_FORMAT == "WEBP" and im.mode in ("LA", "P", "PA") else "RGB")
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dst.with_name(f"{dst.stem}.{secrets.token_hex(4)}.tmp")
+        try:
+            im.save(tmp, THUMB_FORMAT, quality=80)
+            os.replace(tmp, dst)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+def _finish_thumb_job(dst: Path):
+    with _thumb_jobs_guard:
+        _thumb_jobs.pop(dst, None)
+
+def queue_thumbnail(p: Path, size_key: str = "m"):
+    """Schedule rendering (deduplicated); returns the Future, or None when cached/unsupported."""
+    if not Image or not guess_mime(p).startswith("image/") or p.suffix.lower() == ".svg":
+        return None
+    try:
+        st = p.stat()
+    except OSError:
+        return None
+    dst = thumb_cache_path(p, st, size_key)
+    if dst.exists():
+        return None
+    with _thumb_jobs_guard:
+        fut = _thumb_jobs.get(dst)
+        if fut is not None:
+            return fut
+        fut = THUMB_POOL.submit(_render_thumb, p, dst, THUMB_SIZES[size_key])
+        _thumb_jobs[dst] = fut
+    # Outside the guard: a job that already finished runs the callback right here.
+    fut.add_done_callback(lambda _f: _finish_thumb_job(dst))
+    return fut
+
+def get_thumbnail(p: Path, size_key: str) -> Optional[Path]:
+    fut = queue_thumbnail(p, size_key)
+    if fut is not None:
+        try:
+            fut.result(timeout=30)
+        except Exception as e:
+            print(f"Thumbnail failed for {p.name}:", e)
+            return None
+    try:
+        dst = thumb_cache_path(p, p.stat(), size_key)
+    except OSError:
+        return None
+    return dst if dst.exists() else None
 
-  <style>
+# -----------------------------
+# Templates (UI)
+# -----------------------------
+# -----------------------------
+# Static bundles: CSS/JS shared by every page, written to /static/build at
+# startup under content-hashed names (see build_static_bundles)
+# -----------------------------
+APP_CSS = """
     * { margin:0; padding:0; box-sizing:border-box; -webkit-tap-highlight-color:transparent; }
     :root {
       --primary:#3B82F6; --primary-dark:#2563EB; --secondary:#8B5CF6; --success:#10B981; --danger:#EF4444; --warning:#F59E0B;
@@ -840,6 +2699,8 @@ BASE_HTML = """
     .stat-card { background:linear-gradient(135deg,var(--bg-secondary), rgba(59,130,246,.05)); border:1px solid var(--border); border-radius:.75rem; padding:.875rem; display:flex; align-items:center; gap:.75rem; }
     .stat-icon { width:36px; height:36px; border-radius:.5rem; display:flex; align-items:center; justify-content:center; font-size:1rem; flex-shrink:0; }
     .stat-info { flex:1; min-width:0; }
+    .stat-rescan { background:none; border:none; color:var(--text-muted); cursor:pointer; padding:.25rem; }
+    .stat-rescan:hover { color:var(--text-primary); }
     .stat-label { font-size:.625rem; color:var(--text-muted); margin-bottom:.125rem; }
     .stat-value { font-size:1rem; font-weight:700; overflow:hidden; text-overflow:ellipsis; white-space:nowrap; }
 
@@ -863,223 +2724,36 @@ BASE_HTML = """
       .toast-container { top:calc(var(--header-height) + 70px + 1rem); right:1rem; }
     }
     @media (min-width: 1024px) { .file-grid { grid-template-columns: repeat(auto-fill, minmax(250px, 1fr)); } }
-  </style>
-</head>
-<body class="{% if authed %}with-dhikr{% endif %}">
-  <header class="header">
-    <div class="header-content">
-      <a class="logo" href="{{ url_for('home') }}" title="My Files">
-        <i class="fas fa-shield-alt"></i><span>FileVault</span>
-      </a>
-      <nav class="nav-menu">
-        <a class="btn btn-secondary" href="{{ url_for('home') }}" title="My Files"><i class="fas fa-home"></i></a>
-        <div class="user-badge">{{ icon or "📁" }} {{ user_label }}</div>
-{% if authed %}
-  {% if is_admin %}
-    <button class="btn btn-secondary btn-icon" id="accountsBtn" title="Accounts"><i class="fas fa-user-gear"></i></button>
-    <button class="btn btn-secondary btn-icon" id="settingsBtn" title="Settings"><i class="fas fa-gear"></i></button>
-  {% endif %}
-  <button class="btn btn-success btn-icon" id="myQRBtn" title="My QR"><i class="fas fa-qrcode"></i></button>
-  <button id="themeBtn" class="btn btn-secondary btn-icon" title="Toggle theme"><i class="fas fa-moon"></i></button>
-  <a href="{{ url_for('logout') }}" class="btn btn-danger btn-icon" title="Logout"><i class="fas fa-sign-out-alt"></i></a>
-{% endif %}
-      </nav>
-    </div>
-  </header>
+"""
 
-  {% if authed %}
-  <div class="dhikr-banner" id="dhikrBanner">
-    <div class="dhikr-content">
-      <span class="dhikr-icon">✨</span>
-      <span class="dhikr-arabic" id="dhikrArabic">{{ dhikr }}</span>
-      <span class="dhikr-icon">🌟</span>
-    </div>
-    <button class="dhikr-refresh" onclick="changeDhikr()" title="Change Dhikr">
-      <i class="fas fa-sync-alt"></i>
-    </button>
-  </div>
-  {% endif %}
+ACCOUNTS_JS = """
+  // ACCOUNTS (admin)
+  async function openAccounts(){
+    try {
+      const r = await fetch('/api/accounts', {cache:'no-store'});
+      const j = await r.json();
+      if(!j.ok){ showToast(j.error || 'Failed to load accounts', 'error'); return; }
 
-  <div class="toast-container" id="toastContainer"></div>
+      const items = (j.accounts || []).map(a => {
+        const badge = a.is_default ? '<span style="font-size:.75rem; background:var(--success); color:white; padding:.125rem .375rem; border-radius:.375rem; margin-left:.5rem;">default</span>' : '';
+        const privacy = a.public ? '<span style="color:var(--text-muted); font-size:.8rem;">public</span>' : '<span style="color:var(--warning); font-size:.8rem;">private</span>';
+        return `
+          <div class="card" style="display:flex; align-items:center; justify-content:space-between; gap:.5rem;">
+            <div style="min-width:0;">
+              <div style="font-weight:700; overflow:hidden; text-overflow:ellipsis;">${safeHTML(a.folder)} ${badge}</div>
+              <div style="color:var(--text-muted); font-size:.8rem;">${privacy}</div>
+            </div>
+            <div style="display:flex; gap:.5rem;">
+              <button class="btn btn-primary" onclick="switchAccount('${a.folder.replace(/'/g,"\\'")}', true)"><i class="fas fa-right-left"></i> Switch</button>
+              <button class="btn btn-secondary" onclick="openTransferAdmin('${a.folder.replace(/'/g,"\\'")}')"><i class="fas fa-key"></i> Transfer Admin</button>
+            </div>
+          </div>`;
+      }).join('') || '<div class="card" style="color:var(--text-muted);">No accounts yet.</div>';
 
-  <div class="container">
-    {{ body|safe }}
-  </div>
-
-  <!-- Preview Modal -->
-  <div class="modal" id="previewModal">
-    <div class="modal-content">
-      <div class="modal-header">
-        <div class="modal-title" id="pvTitle">Preview</div>
-        <button class="modal-close" onclick="closeModal('previewModal')" aria-label="Close"><i class="fas fa-times"></i></button>
-      </div>
-      <div class="modal-body">
-        <div class="preview-container" style="position:relative;">
-          <div class="preview-holder" id="pvMedia">Loading…</div>
-          <button class="nav-arrow nav-prev" id="pvPrevBtn" style="position:absolute; left:10px; top:50%; transform:translateY(-50%); background:rgba(0,0,0,0.5); color:white; border:none; border-radius:50%; width:40px; height:40px; display:flex; align-items:center; justify-content:center; cursor:pointer;"><i class="fas fa-chevron-left"></i></button>
-          <button class="nav-arrow nav-next" id="pvNextBtn" style="position:absolute; right:10px; top:50%; transform:translateY(-50%); background:rgba(0,0,0,0.5); color:white; border:none; border-radius:50%; width:40px; height:40px; display:flex; align-items:center; justify-content:center; cursor:pointer;"><i class="fas fa-chevron-right"></i></button>
-        </div>
-        <div class="row" style="gap:.5rem; align-items:center; margin-top:10px;">
-          <button class="btn btn-primary" id="pvOpenBtn"><i class="fas fa-up-right-from-square"></i> Open</button>
-          <a class="btn btn-secondary" id="pvDownloadBtn"><i class="fas fa-download"></i> Download</a>
-          <button class="btn btn-secondary" id="pvCopyBtn" style="display:none;"><i class="fas fa-copy"></i> Copy Text</button>
-          <button class="btn btn-secondary" id="pvShareBtn"><i class="fas fa-share"></i> Share</button>
-        </div>
-      </div>
-    </div>
-  </div>
-
-  <!-- Settings Modal -->
-  <div class="modal" id="settingsModal">
-    <div class="modal-content" style="max-width:520px;">
-      <div class="modal-header">
-        <div class="modal-title">Settings</div>
-        <button class="modal-close" onclick="closeModal('settingsModal')" aria-label="Close"><i class="fas fa-times"></i></button>
-      </div>
-      <div class="modal-body" id="settingsBody">
-        <div class="toggle-container">
-          <span class="toggle-label">Public</span>
-          <div class="toggle-switch" id="privacyToggle">
-            <div class="slider"></div>
-          </div>
-          <span class="toggle-label">Private</span>
-        </div>
-        <div style="margin-top:.75rem;">
-          <label class="form-label">Password (set/change when switching to Private)</label>
-          <input type="password" id="privacyPassword" class="form-input" placeholder="New password">
-        </div>
-        <div style="margin-top:1.5rem;">
-          <label class="form-label">API Token</label>
-          <div class="row" style="gap:.5rem; margin-top:.5rem;">
-            <input type="text" id="apiTokenInput" class="form-input" placeholder="Token will appear here" readonly style="flex:1;">
-            <button class="btn btn-primary" id="generateTokenBtn"><i class="fas fa-key"></i> Generate Token</button>
-            <button class="btn btn-secondary" id="shareTokenBtn" style="display:none;"><i class="fas fa-share"></i> Share</button>
-          </div>
-          <div style="margin-top:.5rem; color:var(--text-muted); font-size:.85rem;">Generate a non-expiring token for API access.</div>
-        </div>
-        <div style="margin-top:.75rem; color:var(--text-muted); font-size:.85rem;">Only the first device (admin) can change privacy.</div>
-      </div>
-      <div class="modal-footer">
-        <button class="btn btn-secondary" onclick="closeModal('settingsModal')">Close</button>
-        <button class="btn btn-primary" id="saveSettingsBtn"><i class="fas fa-save"></i> Save</button>
-      </div>
-    </div>
-  </div>
-  
-  <!-- Token Share Modal -->
-  <div class="modal" id="tokenShareModal">
-    <div class="modal-content" style="max-width:520px;">
-      <div class="modal-header">
-        <div class="modal-title">Share Access Token</div>
-        <button class="modal-close" onclick="closeModal('tokenShareModal')" aria-label="Close"><i class="fas fa-times"></i></button>
-      </div>
-      <div class="modal-body" id="tokenShareBody">
-        <div class="qr-box"><div style="color:#222;">Loading…</div></div>
-        <div class="row" style="justify-content:space-between; margin-top:.75rem;">
-          <div style="font-size:.85rem; color:var(--text-secondary); word-break:break-all;" id="tokenShareLink"></div>
-          <button class="btn btn-secondary" id="copyTokenShareBtn"><i class="fas fa-link"></i> Copy</button>
-        </div>
-        <div style="margin-top:1rem; color:var(--text-muted); font-size:.85rem;">
-          <p>Scan this QR code or share the link to allow others to access your server even after restarts.</p>
-          <p>This token does not expire and provides full access to your files.</p>
-        </div>
-      </div>
-    </div>
-  </div>
-
-  <!-- My QR Modal -->
-  <div class="modal" id="myQRModal">
-    <div class="modal-content" style="max-width:400px;">
-      <div class="modal-header">
-        <div class="modal-title">My QR</div>
-        <button class="modal-close" onclick="closeModal('myQRModal')" aria-label="Close"><i class="fas fa-times"></i></button>
-      </div>
-      <div class="modal-body" id="myQRBody">
-        <div class="qr-box"><div style="color:#222;">Loading…</div></div>
-        <div class="row" style="justify-content:space-between; margin-top:.75rem;">
-          <div style="font-size:.85rem; color:var(--text-secondary); word-break:break-all;" id="myQRLink"></div>
-          <button class="btn btn-secondary" id="copyQRBtn"><i class="fas fa-link"></i> Copy</button>
-        </div>
-      </div>
-    </div>
-  </div>
-
-<!-- Accounts Modal -->
-<div class="modal" id="accountsModal">
-  <div class="modal-content" style="max-width:620px;">
-    <div class="modal-header">
-      <div class="modal-title">Accounts</div>
-      <button class="modal-close" onclick="closeModal('accountsModal')" aria-label="Close"><i class="fas fa-times"></i></button>
-    </div>
-    <div class="modal-body" id="accountsBody">Loading…</div>
-    <div class="modal-footer" style="flex-wrap:wrap; gap:.5rem;">
-      <input type="text" id="accCreateNameInput" class="form-input" placeholder="Custom name (optional) e.g. lucky-duck-042" style="flex:1; min-width:220px;">
-      <button class="btn btn-primary" id="accCreateBtn"><i class="fas fa-user-plus"></i> Create & Switch</button>
-    </div>
-  </div>
-</div>
-
-<!-- Transfer Admin Modal -->
-<div class="modal" id="transferAdminModal">
-  <div class="modal-content" style="max-width:520px;">
-    <div class="modal-header">
-      <div class="modal-title" id="transferTitle">Transfer Admin</div>
-      <button class="modal-close" onclick="closeModal('transferAdminModal')" aria-label="Close"><i class="fas fa-times"></i></button>
-    </div>
-    <div class="modal-body" id="transferBody">
-      <div class="qr-box"><div style="color:#222;">Generating…</div></div>
-      <div class="row" style="justify-content:space-between; margin-top:.75rem;">
-        <div style="font-size:.85rem; color:var(--text-secondary); word-break:break-all;" id="transferLink"></div>
-        <button class="btn btn-secondary" id="transferCopyBtn"><i class="fas fa-link"></i> Copy</button>
-      </div>
-      <div style="margin-top:.5rem; color:var(--text-muted); font-size:.85rem;">
-        Scan this QR from the new device to become the admin of this account. The scanning device will be logged into the account and set as default.
-      </div>
-    </div>
-    <div class="modal-footer">
-      <button class="btn btn-secondary" onclick="closeModal('transferAdminModal')">Close</button>
-    </div>
-  </div>
-</div>
-</div>
-
-  <script src="/static/socket.io.min.js"></script>
-  <script>
-    if (typeof io === 'undefined') {
-      var s = document.createElement('script');
-      s.src = '/socket.io/socket.io.js';
-      document.head.appendChild(s);
-    }
-  </script>
-
-<script>
-  // ACCOUNTS (admin)
-  async function openAccounts(){
-    try {
-      const r = await fetch('/api/accounts', {cache:'no-store'});
-      const j = await r.json();
-      if(!j.ok){ showToast(j.error || 'Failed to load accounts', 'error'); return; }
-
-      const items = (j.accounts || []).map(a => {
-        const badge = a.is_default ? '<span style="font-size:.75rem; background:var(--success); color:white; padding:.125rem .375rem; border-radius:.375rem; margin-left:.5rem;">default</span>' : '';
-        const privacy = a.public ? '<span style="color:var(--text-muted); font-size:.8rem;">public</span>' : '<span style="color:var(--warning); font-size:.8rem;">private</span>';
-        return `
-          <div class="card" style="display:flex; align-items:center; justify-content:space-between; gap:.5rem;">
-            <div style="min-width:0;">
-              <div style="font-weight:700; overflow:hidden; text-overflow:ellipsis;">${safeHTML(a.folder)} ${badge}</div>
-              <div style="color:var(--text-muted); font-size:.8rem;">${privacy}</div>
-            </div>
-            <div style="display:flex; gap:.5rem;">
-              <button class="btn btn-primary" onclick="switchAccount('${a.folder.replace(/'/g,"\\'")}', true)"><i class="fas fa-right-left"></i> Switch</button>
-              <button class="btn btn-secondary" onclick="openTransferAdmin('${a.folder.replace(/'/g,"\\'")}')"><i class="fas fa-key"></i> Transfer Admin</button>
-            </div>
-          </div>`;
-      }).join('') || '<div class="card" style="color:var(--text-muted);">No accounts yet.</div>';
-
-      document.getElementById('accountsBody').innerHTML = `
-        <div style="margin-bottom:.5rem; color:var(--text-secondary);">Switching also sets it as default for this device.</div>
-        ${items}
-      `;
+      document.getElementById('accountsBody').innerHTML = `
+        <div style="margin-bottom:.5rem; color:var(--text-secondary);">Switching also sets it as default for this device.</div>
+        ${items}
+      `;
 
       // Button binds
       document.getElementById('accCreateBtn')?.addEventListener('click', createAccountAndSwitch);
@@ -1162,13 +2836,13 @@ BASE_HTML = """
       showToast('Failed to start transfer', 'error');
     }
   }
-</script>
-  
-  <script>
+"""
+
+APP_JS = """
     'use strict';
 
     // Dhikr data
-    const dhikrList = {{ dhikr_list|tojson }};
+    const dhikrList = (window.FV_CONFIG || {}).dhikrList || [];
     
 async function changeDhikr() {
   try {
@@ -1331,6 +3005,8 @@ async function changeDhikr() {
       if(by) localStorage.setItem('sortBy', by);
       if(dir) localStorage.setItem('sortDir', dir);
       if(typeof foldersFirst === 'boolean') localStorage.setItem('foldersFirst', String(foldersFirst));
+      // The server renders the first page in this order next time.
+      savePref('sort', getSortPrefs());
     }
     function applySort(){
       const grid = document.getElementById('fileGrid'); if(!grid) return;
@@ -1363,6 +3039,95 @@ async function changeDhikr() {
       const ff = document.getElementById('foldersFirst'); if(ff) ff.checked = prefs.foldersFirst;
     }
 
+    // LISTING (sorted and searched server-side, fetched a page at a time)
+    const listState = { cursor: null, loading: false, seq: 0 };
+    let listSearchTimer = null;
+
+    function listQuery(cursor){
+      const prefs = getSortPrefs();
+      const params = new URLSearchParams({
+        path: window.currentPath || '',
+        sort: prefs.by,
+        order: prefs.dir,
+        folders_first: prefs.foldersFirst ? '1' : '0',
+        q: (document.getElementById('searchInput')?.value || '').trim()
+      });
+      if(cursor) params.set('cursor', cursor);
+      return '/api/list?' + params.toString();
+    }
+    function sentinelNearViewport(){
+      const s = document.getElementById('listSentinel');
+      return !!s && s.getBoundingClientRect().top < window.innerHeight + 600;
+    }
+    async function loadMoreEntries(reset){
+      const grid = document.getElementById('fileGrid'); if(!grid) return;
+      if(!reset && (listState.loading || !listState.cursor)) return;
+      const seq = ++listState.seq;
+      listState.loading = true;
+      try {
+        const r = await fetch(listQuery(reset ? null : listState.cursor), {cache:'no-store'});
+        const j = await r.json();
+        if(seq !== listState.seq) return; // superseded by a newer sort/search
+        if(!j.ok){ showToast(j.error || 'Failed to load files', 'error'); return; }
+        if(reset) grid.querySelectorAll('.file-card').forEach(el => el.remove());
+        if(j.entries.length) grid.querySelectorAll(':scope > .card').forEach(el => el.remove());
+        const frag = document.createDocumentFragment();
+        j.entries.forEach(meta => { if(!qsCardByRel(meta.rel)) frag.appendChild(renderFileCard(meta)); });
+        grid.appendChild(frag);
+        listState.cursor = j.next_cursor;
+        if(reset){ changeState.epoch = j.epoch; changeState.seq = j.seq; }
+      } catch(e){
+        if(seq === listState.seq) showToast('Failed to load files', 'error');
+      } finally {
+        if(seq === listState.seq){
+          listState.loading = false;
+          if(listState.cursor && sentinelNearViewport()) setTimeout(()=> loadMoreEntries(false), 0);
+        }
+      }
+    }
+    function reloadListing(){ loadMoreEntries(true); }
+
+    // CHANGE JOURNAL (what this page has seen; replayed after a reconnect or a sleeping tab wakes)
+    const changeState = { epoch: '', seq: 0, busy: false };
+    async function catchUpChanges(){
+      if(!document.getElementById('fileGrid') || !changeState.epoch || changeState.busy) return;
+      changeState.busy = true;
+      try {
+        const params = new URLSearchParams({path: window.currentPath || '', since: String(changeState.seq), epoch: changeState.epoch});
+        const r = await fetch('/api/changes?' + params.toString(), {cache:'no-store'});
+        const j = await r.json();
+        if(!j.ok) return;
+        if(j.resync){ reloadListing(); return; } // missed more than the server kept
+        applyFileUpdates(j.events);
+        changeState.seq = Math.max(changeState.seq, j.seq);
+      } catch(e){
+        console.warn('Catch-up failed', e);
+      } finally {
+        changeState.busy = false;
+      }
+    }
+    function initListing(){
+      const grid = document.getElementById('fileGrid'); if(!grid) return;
+      listState.cursor = grid.dataset.nextCursor || null;
+      changeState.epoch = grid.dataset.changesEpoch || '';
+      changeState.seq = parseInt(grid.dataset.changesSeq || '0', 10) || 0;
+      const sentinel = document.getElementById('listSentinel');
+      if(sentinel && 'IntersectionObserver' in window){
+        new IntersectionObserver(es => { if(es.some(e => e.isIntersecting)) loadMoreEntries(false); }, {rootMargin: '600px'}).observe(sentinel);
+      } else {
+        window.addEventListener('scroll', ()=>{ if(sentinelNearViewport()) loadMoreEntries(false); }, {passive:true});
+      }
+      document.getElementById('searchInput')?.addEventListener('input', ()=>{
+        clearTimeout(listSearchTimer);
+        listSearchTimer = setTimeout(reloadListing, 250);
+      });
+      // First page was rendered with the saved server pref; refetch if this browser sorts differently.
+      const prefs = getSortPrefs();
+      if(grid.dataset.sort !== prefs.by || grid.dataset.order !== prefs.dir || (grid.dataset.foldersFirst === '1') !== prefs.foldersFirst){
+        reloadListing();
+      }
+    }
+
     // UPLOADS
     const activeXHRs = new Map();
 
@@ -1379,6 +3144,9 @@ async function changeDhikr() {
       area.addEventListener('dragleave', ()=> area.classList.remove('dragover'));
       area.addEventListener('drop', e=>{
         area.classList.remove('dragover');
+        // Entries must be taken during the event; walk them afterwards if a folder was dropped.
+        const entries = Array.from(e.dataTransfer.items || []).map(it => it.webkitGetAsEntry ? it.webkitGetAsEntry() : null).filter(Boolean);
+        if(entries.some(en => en.isDirectory)){ walkEntries(entries).then(t => uploadTree(t.files, t.dirs)); return; }
         const files = e.dataTransfer.files; if(files?.length) handleNewFiles(files);
       });
 
@@ -1386,16 +3154,288 @@ async function changeDhikr() {
         const files = e.target.files; if(files?.length){ handleNewFiles(files); }
         input.value = '';
       }, false);
+
+      const folderInput = document.getElementById('uploadFolderInput');
+      folderInput?.addEventListener('change', ()=>{
+        const files = Array.from(folderInput.files || []);
+        files.forEach(f => f.relPath = f.webkitRelativePath || f.name);
+        if(files.length) uploadTree(files, []);
+        folderInput.value = '';
+      });
+    }
+
+    // FOLDER TREES: create every directory with one /api/mkdirs call, then queue the files into them
+    function readAllEntries(reader){
+      return new Promise((resolve, reject)=>{
+        const out = [];
+        const next = ()=> reader.readEntries(batch => {
+          if(!batch.length) return resolve(out);
+          out.push(...batch); // readEntries hands out ~100 at a time
+          next();
+        }, reject);
+        next();
+      });
+    }
+    async function walkEntries(entries){
+      const files = [], dirs = [];
+      const stack = entries.map(en => [en, en.name]);
+      while(stack.length){
+        const [en, path] = stack.pop();
+        if(en.isDirectory){
+          dirs.push(path);
+          let children = [];
+          try { children = await readAllEntries(en.createReader()); } catch(e){ console.warn('Cannot read folder', path, e); }
+          const fileEntries = children.filter(c => c.isFile);
+          children.filter(c => c.isDirectory).forEach(c => stack.push([c, `${path}/${c.name}`]));
+          const got = await Promise.all(fileEntries.map(c => new Promise(res => c.file(f => { f.relPath = `${path}/${c.name}`; res(f); }, ()=> res(null)))));
+          got.forEach(f => f && files.push(f));
+        } else if(en.isFile){
+          const f = await new Promise(res => en.file(res, ()=> res(null)));
+          if(f){ f.relPath = path; files.push(f); }
+        }
+      }
+      return {files, dirs};
+    }
+    const parentOf = (p)=> p.includes('/') ? p.slice(0, p.lastIndexOf('/')) : '';
+    async function uploadTree(files, dirs){
+      const dest = window.currentPath || '';
+      const all = new Set(dirs);
+      files.forEach(f => { for(let d = parentOf(f.relPath); d; d = parentOf(d)) all.add(d); });
+      const list = Array.from(all).sort();
+      const created = {};
+      if(list.length){
+        try {
+          const r = await fetch('/api/mkdirs', {method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({dest, dirs: list})});
+          const j = await r.json();
+          if(!r.ok || !j.ok) throw new Error(j.error || `HTTP ${r.status}`);
+          list.forEach((d, i) => { if(j.dirs[i] != null) created[d] = j.dirs[i]; });
+        } catch(e){
+          showToast(`Could not create folders: ${e.message}`, 'error');
+          return;
+        }
+      }
+      // Server-side names may differ (sanitized); single uploads go to the folder it reported.
+      const ready = files.filter(f => {
+        const dir = parentOf(f.relPath);
+        f.uploadDest = dir ? created[dir] : dest;
+        return f.uploadDest != null;
+      });
+      if(ready.length < files.length) showToast(`${files.length - ready.length} files skipped`, 'warning');
+      if(!ready.length){ if(list.length) showToast(`Created ${list.length} folders`, 'success'); return; }
+      handleNewFiles(ready);
     }
 
     function handleNewFiles(files){
       const arr = Array.from(files || []);
       if(!arr.length) return;
-      const container = document.getElementById('progressContainer');
-      if(container) container.innerHTML = '';
-      for(const f of arr){
-        const id = `up-${Date.now()}-${Math.random().toString(36).slice(2)}`;
-        uploadSingleFile({file:f, id});
+      // Small files share requests; bigger ones go alone (resumable above 32MB). The queue runs smallest first.
+      const small = arr.filter(f => f.size <= BATCH_FILE_MAX);
+      const rest = small.length > 1 ? arr.filter(f => f.size > BATCH_FILE_MAX) : arr;
+      if(small.length > 1){
+        const batches = planBatches(small);
+        batches.forEach((batch, i) => enqueueUpload({
+          id: newUploadId(), size: batch.bytes, priority: batch.largest,
+          label: batches.length > 1 ? `${batch.files.length} files (${i + 1}/${batches.length})` : `${batch.files.length} files`,
+          run: job => uploadBatch(job, batch)
+        }));
+      }
+      for(const f of rest){
+        enqueueUpload({id: newUploadId(), size: f.size, priority: f.size, label: f.relPath || f.name, file: f, dest: f.uploadDest, run: job => uploadSingleFile(job)});
+      }
+      pumpUploads();
+    }
+    function newUploadId(){ return `up-${Date.now()}-${Math.random().toString(36).slice(2)}`; }
+
+    // UPLOAD QUEUE: a few jobs at a time (more on the LAN than through a tunnel), smallest first,
+    // pausable as a whole; paused jobs go back in the queue (resumable ones keep what the server has)
+    const UPLOAD_CONCURRENCY_LAN = 4;
+    const UPLOAD_CONCURRENCY_REMOTE = 2;
+    const uploadQueue = { pending: [], running: new Map(), paused: false, total: 0, done: 0, jobs: 0, finished: 0, samples: [] };
+
+    function isLanHost(host){
+      return host === 'localhost' || host.endsWith('.local') || host === '[::1]'
+        || /^(127\\.|10\\.|192\\.168\\.|172\\.(1[6-9]|2\\d|3[01])\\.)/.test(host);
+    }
+    function uploadConcurrency(){
+      const n = parseInt(localStorage.getItem('uploadConcurrency') || '', 10); // manual override
+      if(n > 0) return n;
+      return isLanHost(location.hostname) ? UPLOAD_CONCURRENCY_LAN : UPLOAD_CONCURRENCY_REMOTE;
+    }
+    // job: {id, size, priority, label, run(job) -> Promise<'done'|'failed'|'paused'|'cancelled'>}; call pumpUploads() after adding
+    function enqueueUpload(job){
+      const q = uploadQueue;
+      job.sent = 0;
+      job.row = createProgressElement(job.label, job.id);
+      job.row.querySelector('.stat-eta').textContent = 'Queued';
+      document.getElementById('progressContainer')?.appendChild(job.row);
+      job.progress = bytes => { job.sent = bytes; renderUploadSummary(); };
+      q.pending.push(job);
+      q.total += job.size;
+      q.jobs++;
+    }
+    function pumpUploads(){
+      const q = uploadQueue;
+      q.pending.sort((a, b) => a.priority - b.priority);
+      while(!q.paused && q.pending.length && q.running.size < uploadConcurrency()){
+        const job = q.pending.shift();
+        q.running.set(job.id, job);
+        job.paused = false;
+        job.row.querySelector('.stat-eta').textContent = 'Starting…';
+        Promise.resolve().then(()=> job.run(job)).catch(()=> 'failed').then(result => {
+          q.running.delete(job.id);
+          if(result === 'paused'){
+            job.row.querySelector('.stat-eta').textContent = 'Paused';
+            q.pending.push(job);
+          } else if(result === 'done' || result === 'failed'){
+            q.finished++;
+            q.done += job.size;
+          } else {
+            q.total -= job.size; // cancelled
+            q.jobs--;
+          }
+          job.sent = 0;
+          pumpUploads();
+        });
+      }
+      renderUploadSummary();
+    }
+    function setUploadsPaused(paused){
+      const q = uploadQueue;
+      q.paused = paused;
+      if(paused){
+        q.running.forEach(job => {
+          job.paused = true;
+          const h = activeXHRs.get(job.id);
+          if(h){ if(h.stop) h.stop(); else h.abort(); }
+        });
+      }
+      pumpUploads();
+    }
+    function dropQueuedUpload(id){
+      const q = uploadQueue;
+      const i = q.pending.findIndex(j => j.id === id);
+      if(i < 0) return false;
+      const [job] = q.pending.splice(i, 1);
+      q.total -= job.size;
+      q.jobs--;
+      renderUploadSummary();
+      return true;
+    }
+    function renderUploadSummary(){
+      const q = uploadQueue;
+      let el = document.getElementById('uploadSummary');
+      if(!q.pending.length && !q.running.size){
+        if(el) el.remove();
+        Object.assign(q, {total: 0, done: 0, jobs: 0, finished: 0, samples: []});
+        return;
+      }
+      if(!el){
+        const container = document.getElementById('progressContainer'); if(!container) return;
+        el = document.createElement('div');
+        el.id = 'uploadSummary';
+        el.className = 'progress-item';
+        el.innerHTML = `
+          <div class="progress-header">
+            <div class="progress-info">
+              <div class="progress-filename"></div>
+              <div class="progress-stats"><span class="stat-speed"></span><span class="stat-eta"></span></div>
+            </div>
+            <div class="progress-actions">
+              <span class="progress-percent"></span>
+              <button class="progress-cancel" title="Pause all"><i class="fas fa-pause"></i></button>
+            </div>
+          </div>
+          <div class="progress-bar"><div class="progress-fill" style="width:0%"></div></div>
+        `;
+        el.querySelector('.progress-cancel').addEventListener('click', ()=> setUploadsPaused(!uploadQueue.paused));
+        container.prepend(el);
+      }
+      let sent = q.done;
+      q.running.forEach(j => sent += Math.min(j.sent, j.size));
+      // throughput over the last few seconds, across all running uploads
+      const now = Date.now();
+      q.samples.push([now, sent]);
+      while(q.samples.length > 2 && now - q.samples[0][0] > 5000) q.samples.shift();
+      const [t0, s0] = q.samples[0];
+      const speed = now - t0 >= 250 ? Math.max(0, sent - s0) / ((now - t0) / 1000) : 0;
+      const percent = sent / Math.max(q.total, 1) * 100;
+      el.querySelector('.progress-filename').textContent = `${q.finished} of ${q.jobs} uploads done` + (q.paused ? ' · paused' : '');
+      el.querySelector('.stat-speed').textContent = formatSpeed(speed) + ` · ${q.running.size} active`;
+      el.querySelector('.stat-eta').textContent = q.paused ? 'Paused' : formatETA((q.total - sent) / Math.max(speed, 1));
+      el.querySelector('.progress-percent').textContent = `${Math.round(percent)}%`;
+      el.querySelector('.progress-fill').style.width = `${percent}%`;
+      const btn = el.querySelector('.progress-cancel');
+      btn.title = q.paused ? 'Resume all' : 'Pause all';
+      btn.innerHTML = q.paused ? '<i class="fas fa-play"></i>' : '<i class="fas fa-pause"></i>';
+    }
+
+    // BATCHES: many small files per multipart request to /api/upload/batch
+    const BATCH_FILE_MAX = 4 * 1024 * 1024;
+    const BATCH_MAX_FILES = 200;
+    const BATCH_MAX_BYTES = 64 * 1024 * 1024;
+
+    function planBatches(files){
+      const batches = [];
+      let cur = null;
+      for(const f of files){
+        if(!cur || cur.files.length >= BATCH_MAX_FILES || cur.bytes + f.size > BATCH_MAX_BYTES){
+          cur = {files: [], bytes: 0, largest: 0};
+          batches.push(cur);
+        }
+        cur.files.push(f);
+        cur.bytes += f.size;
+        cur.largest = Math.max(cur.largest, f.size);
+      }
+      return batches;
+    }
+
+    function sendBatch(batch, id, onProgress){
+      return new Promise((resolve, reject)=>{
+        const form = new FormData();
+        form.append('dest', window.currentPath || '');
+        for(const f of batch.files){
+          form.append('path', f.relPath || f.webkitRelativePath || f.name);
+          form.append('file', f, f.name);
+        }
+        const xhr = new XMLHttpRequest();
+        activeXHRs.set(id, xhr);
+        xhr.upload.addEventListener('progress', e=>{ if(e.lengthComputable) onProgress(e.loaded / e.total * batch.bytes); });
+        xhr.addEventListener('load', ()=>{
+          activeXHRs.delete(id);
+          let j = {};
+          try { j = JSON.parse(xhr.responseText || '{}'); } catch(e){}
+          if(xhr.status >= 200 && xhr.status < 300 && j.ok) resolve(j);
+          else reject(new Error(j.error || `HTTP ${xhr.status}`));
+        });
+        xhr.addEventListener('error', ()=>{ activeXHRs.delete(id); reject(new Error('network')); });
+        xhr.addEventListener('abort', ()=>{ activeXHRs.delete(id); reject(new Error('aborted')); });
+        xhr.open('POST', '/api/upload/batch');
+        xhr.send(form);
+      });
+    }
+
+    async function uploadBatch(job, batch){
+      const row = job.row;
+      const start = Date.now();
+      try {
+        const j = await sendBatch(batch, job.id, loaded => {
+          const speed = loaded / Math.max(0.25, (Date.now() - start) / 1000);
+          updateProgress(row, {percent: loaded / Math.max(batch.bytes, 1) * 100, speed, eta: (batch.bytes - loaded) / Math.max(speed, 1)});
+          job.progress(loaded);
+        });
+        const failed = (j.skipped || []).length;
+        markProgressComplete(row, !failed);
+        showToast(failed ? `Uploaded ${j.saved} files, ${failed} skipped` : `Uploaded ${j.saved} files`, failed ? 'warning' : 'success');
+        return 'done';
+      } catch(e){
+        if(e.message === 'aborted'){
+          if(job.paused) return 'paused';
+          row.remove();
+          return 'cancelled';
+        }
+        markProgressComplete(row, false);
+        showToast(`Failed: ${batch.files.length} files`, 'error');
+        return 'failed';
       }
     }
 
@@ -1437,7 +3477,7 @@ async function changeDhikr() {
       if(!element) return;
       element.querySelector('.progress-fill').style.width = `${data.percent}%`;
       element.querySelector('.progress-percent').textContent = `${Math.round(data.percent)}%`;
-      element.querySelector('.stat-speed').textContent = formatSpeed(data.speed);
+      element.querySelector('.stat-speed').textContent = formatSpeed(data.speed) + (data.streams > 1 ? ` · ${data.streams} streams` : '');
       element.querySelector('.stat-eta').textContent = data.percent >= 100 ? 'Done' : formatETA(data.eta);
     }
     function markProgressComplete(element, success){
@@ -1447,65 +3487,292 @@ async function changeDhikr() {
       setTimeout(()=>{ element.remove(); }, 900);
     }
 
+    // BACKGROUND JOBS (folder delete, ZIP build, storage recount): progress rows fed by
+    // job_progress socket events, with polling while the socket is quiet
+    const trackedJobs = new Map();  // id -> {row, onDone, timer, seen}
+    const JOB_POLL_MS = 2000;
+    function formatBytes(n){ return formatSpeed(n).replace('/s', ''); }
+    function trackJob(job, onDone){
+      if(!job || trackedJobs.has(job.id)) return;
+      const row = createProgressElement(job.label, job.id);
+      row.querySelector('.progress-cancel').title = 'Cancel';
+      document.getElementById('progressContainer')?.appendChild(row);
+      const t = {row, onDone, seen: Date.now()};
+      t.timer = setInterval(async ()=>{
+        if(Date.now() - t.seen < JOB_POLL_MS) return;
+        try{
+          const r = await fetch(`/api/jobs/${encodeURIComponent(job.id)}`);
+          if(r.status === 404){ updateJob({...job, state: 'failed', error: 'job expired'}); return; }
+          const j = await r.json();
+          if(j.ok) updateJob(j.job);
+        }catch(e){}
+      }, JOB_POLL_MS);
+      trackedJobs.set(job.id, t);
+      updateJob(job);
+    }
+    function updateJob(job){
+      const t = job && trackedJobs.get(job.id);
+      if(!t) return;
+      t.seen = Date.now();
+      const row = t.row;
+      let percent = 0;
+      if(job.total_bytes) percent = 100 * job.bytes / job.total_bytes;
+      else if(job.total) percent = 100 * job.done / job.total;
+      if(job.state === 'done') percent = 100;
+      row.querySelector('.progress-fill').style.width = `${Math.min(percent, 100)}%`;
+      row.querySelector('.progress-percent').textContent = (job.total || job.total_bytes || job.state === 'done') ? `${Math.round(percent)}%` : '';
+      const parts = [`${job.done} item${job.done === 1 ? '' : 's'}`];
+      if(job.bytes) parts.push(formatBytes(job.bytes));
+      row.querySelector('.stat-speed').textContent = parts.join(' · ');
+      row.querySelector('.stat-eta').textContent = job.state === 'failed' ? (job.error || 'failed') : job.state;
+      if(!['done', 'failed', 'cancelled'].includes(job.state)) return;
+      clearInterval(t.timer);
+      trackedJobs.delete(job.id);
+      if(job.state === 'cancelled'){ row.remove(); showToast(`Cancelled: ${job.label}`, 'warning'); }
+      else markProgressComplete(row, job.state === 'done');
+      if(job.state === 'failed') showToast(`${job.label} failed${job.error ? ': ' + job.error : ''}`, 'error');
+      t.onDone?.(job);
+    }
+    async function cancelJob(id){
+      try{
+        const r = await fetch(`/api/jobs/${encodeURIComponent(id)}/cancel`, {method: 'POST'});
+        const j = await r.json();
+        if(j.ok) updateJob(j.job);
+      }catch(e){ showToast('Cancel failed', 'error'); }
+    }
+    async function startZipJob(paths){
+      const form = new FormData();
+      paths.forEach(p => form.append('paths', p));
+      form.append('job', '1');
+      try{
+        const r = await fetch('/api/zip', {method: 'POST', body: form});
+        const j = await r.json();
+        if(!j.ok){ showToast(j.error || 'ZIP failed', 'error'); return; }
+        trackJob(j.job, job => { if(job.state === 'done') window.location.href = job.result.download_url; });
+      }catch(e){ showToast('ZIP failed', 'error'); }
+    }
+    async function rescanUsage(){
+      try{
+        const r = await fetch('/api/usage/rescan', {method: 'POST'});
+        const j = await r.json();
+        if(j.ok) trackJob(j.job);  // the new numbers arrive as usage_update
+        else showToast(j.error || 'Recount failed', 'error');
+      }catch(e){ showToast('Recount failed', 'error'); }
+    }
+
     function uploadSingleFile(item){
+      if(item.file.size >= RESUMABLE_MIN_SIZE) return uploadResumable(item);
       const {file, id} = item;
-      const container = document.getElementById('progressContainer');
-      const row = createProgressElement(file.name, id);
-      container?.appendChild(row);
+      const row = item.row || createProgressElement(file.name, id);
+      if(!row.isConnected) document.getElementById('progressContainer')?.appendChild(row);
+      const done = (ok)=>{
+        markProgressComplete(row, ok);
+        showToast(ok ? `Uploaded: ${file.name}` : `Failed: ${file.name}`, ok ? 'success' : 'error');
+        return ok ? 'done' : 'failed';
+      };
 
-      const form = new FormData();
-      form.append('dest', window.currentPath || '');
-      form.append('file', file, file.name);
+      return new Promise(resolve => {
+        const form = new FormData();
+        form.append('dest', item.dest ?? (window.currentPath || ''));
+        form.append('file', file, file.name);
+
+        const xhr = new XMLHttpRequest();
+        activeXHRs.set(id, xhr);
+
+        const start = Date.now();
+        xhr.upload.addEventListener('progress', e=>{
+          if(e.lengthComputable){
+            const percent = (e.loaded/e.total) * 100;
+            const seconds = Math.max(0.25, (Date.now()-start)/1000);
+            const speed = e.loaded/seconds;
+            const eta = (e.total-e.loaded) / Math.max(speed, 1);
+            updateProgress(row, {percent, speed, eta});
+            item.progress?.(file.size * e.loaded / e.total);
+          }
+        });
+        xhr.addEventListener('load', ()=>{
+          activeXHRs.delete(id);
+          let j = {};
+          try { j = JSON.parse(xhr.responseText || '{}'); } catch(e){ j = {ok: true}; }
+          resolve(done(xhr.status >= 200 && xhr.status < 300 && j.ok));
+        });
+        xhr.addEventListener('error', ()=>{
+          activeXHRs.delete(id);
+          resolve(done(false));
+        });
+        xhr.addEventListener('abort', ()=>{
+          activeXHRs.delete(id);
+          if(item.paused){ resolve('paused'); return; }
+          row.remove();
+          resolve('cancelled');
+        });
 
-      const xhr = new XMLHttpRequest();
-      activeXHRs.set(id, xhr);
+        xhr.open('POST', '/api/upload');
+        xhr.send(form);
+      });
+    }
 
+    // RESUMABLE (large files): session + offset-addressed chunks sent over several parallel
+    // requests; survives network drops and reloads, only missing chunks are resent
+    const RESUMABLE_MIN_SIZE = 32 * 1024 * 1024;
+    const RESUMABLE_CHUNK = 8 * 1024 * 1024;
+    const RESUMABLE_PARALLEL = 4;
+    const RESUMABLE_MAX_RETRIES = 8;
+    const sleep = (ms)=> new Promise(res => setTimeout(res, ms));
+
+    const CRC32_TABLE = (()=>{
+      const t = new Uint32Array(256);
+      for(let n = 0; n < 256; n++){
+        let c = n;
+        for(let k = 0; k < 8; k++) c = (c & 1) ? (0xEDB88320 ^ (c >>> 1)) : (c >>> 1);
+        t[n] = c >>> 0;
+      }
+      return t;
+    })();
+    function crc32(bytes){
+      let c = 0xFFFFFFFF;
+      for(let i = 0; i < bytes.length; i++) c = CRC32_TABLE[(c ^ bytes[i]) & 0xFF] ^ (c >>> 8);
+      return (c ^ 0xFFFFFFFF) >>> 0;
+    }
+    async function chunkChecksum(blob){
+      const v = crc32(new Uint8Array(await blob.arrayBuffer()));
+      return 'crc32 ' + btoa(String.fromCharCode((v >>> 24) & 255, (v >>> 16) & 255, (v >>> 8) & 255, v & 255));
+    }
+
+    function resumableKey(file, dest){
+      return `fv-upload:${dest}|${file.name}|${file.size}|${file.lastModified}`;
+    }
+
+    function missingChunks(size, ranges){
+      const out = [];
+      for(let start = 0; start < size; start += RESUMABLE_CHUNK){
+        const end = Math.min(start + RESUMABLE_CHUNK, size);
+        if(!(ranges || []).some(([a, b]) => a <= start && b >= end)) out.push({start, end});
+      }
+      return out;
+    }
+
+    function sendUploadChunk(uploadId, chunk, blob, checksum, onProgress, handle){
+      return new Promise((resolve, reject)=>{
+        const xhr = new XMLHttpRequest();
+        handle.xhrs.add(xhr);
+        const done = ()=> handle.xhrs.delete(xhr);
+        xhr.upload.addEventListener('progress', e=>{ if(e.lengthComputable) onProgress(e.loaded); });
+        xhr.addEventListener('load', ()=>{
+          done();
+          let j = {};
+          try { j = JSON.parse(xhr.responseText || '{}'); } catch(e){}
+          if(xhr.status >= 200 && xhr.status < 300) resolve(j);
+          else reject(Object.assign(new Error(j.error || `HTTP ${xhr.status}`), {status: xhr.status}));
+        });
+        xhr.addEventListener('error', ()=>{ done(); reject(new Error('network')); });
+        xhr.addEventListener('abort', ()=>{ done(); reject(new Error('aborted')); });
+        xhr.open('PATCH', `/api/uploads/${encodeURIComponent(uploadId)}`);
+        xhr.setRequestHeader('Upload-Offset', String(chunk.start));
+        xhr.setRequestHeader('Upload-Checksum', checksum);
+        xhr.setRequestHeader('Content-Type', 'application/offset+octet-stream');
+        xhr.send(blob);
+      });
+    }
+
+    async function uploadResumable(item){
+      const {file, id} = item;
+      const dest = item.dest ?? (window.currentPath || '');
+      const row = item.row || createProgressElement(file.name, id);
+      if(!row.isConnected) document.getElementById('progressContainer')?.appendChild(row);
+
+      const handle = {cancelled:false, stopped:false, xhrs:new Set(), uploadId:null,
+        stop(){ this.stopped = true; this.xhrs.forEach(x => { try { x.abort(); } catch(e){} }); },
+        abort(){ this.cancelled = true; this.stop(); }};
+      activeXHRs.set(id, handle);
+      const key = resumableKey(file, dest);
       const start = Date.now();
-      xhr.upload.addEventListener('progress', e=>{
-        if(e.lengthComputable){
-          const percent = (e.loaded/e.total) * 100;
-          const seconds = Math.max(0.25, (Date.now()-start)/1000);
-          const speed = e.loaded/seconds;
-          const eta = (e.total-e.loaded) / Math.max(speed, 1);
-          updateProgress(row, {percent, speed, eta});
+      const inflight = new Map();  // chunk start -> bytes sent so far
+      let committed = 0, startCommitted = 0;
+      const report = ()=>{
+        let sent = committed;
+        inflight.forEach(v => sent += v);
+        const seconds = Math.max(0.25, (Date.now()-start)/1000);
+        const speed = Math.max(0, sent - startCommitted)/seconds;  // combined over all streams
+        updateProgress(row, {percent: (sent/Math.max(file.size, 1))*100, speed, eta: (file.size-sent)/Math.max(speed, 1), streams: inflight.size});
+        item.progress?.(sent);
+      };
+
+      try {
+        let uploadId = localStorage.getItem(key), ranges = [];
+        if(uploadId){
+          const r = await fetch(`/api/uploads/${encodeURIComponent(uploadId)}`, {cache:'no-store'});
+          if(r.ok){ ranges = (await r.json()).ranges || []; } else { uploadId = null; }
         }
-      });
-      xhr.addEventListener('load', ()=>{
-        activeXHRs.delete(id);
-        try {
-          const j = JSON.parse(xhr.responseText || '{}');
-          if(xhr.status >= 200 && xhr.status < 300 && j.ok){
-            markProgressComplete(row, true);
-            showToast(`Uploaded: ${file.name}`, 'success');
-          } else {
-            markProgressComplete(row, false);
-            showToast(`Failed: ${file.name}`, 'error');
-          }
-        } catch(e){
-          if(xhr.status >= 200 && xhr.status < 300){
-            markProgressComplete(row, true);
-            showToast(`Uploaded: ${file.name}`, 'success');
-          } else {
-            markProgressComplete(row, false);
-            showToast(`Failed: ${file.name}`, 'error');
-          }
+        if(!uploadId){
+          const r = await fetch('/api/uploads', {method:'POST', headers:{'Content-Type':'application/json'},
+            body: JSON.stringify({dest, name: file.name, size: file.size})});
+          const j = await r.json();
+          if(!r.ok || !j.ok) throw new Error(j.error || 'create failed');
+          uploadId = j.id;
+          localStorage.setItem(key, uploadId);
         }
-      });
-      xhr.addEventListener('error', ()=>{
-        activeXHRs.delete(id);
+        handle.uploadId = uploadId;
+
+        const queue = missingChunks(file.size, ranges);
+        committed = startCommitted = file.size - queue.reduce((n, c) => n + (c.end - c.start), 0);
+        report();
+
+        const worker = async ()=>{
+          while(queue.length && !handle.stopped){
+            const chunk = queue.shift();
+            const blob = file.slice(chunk.start, chunk.end);
+            const checksum = await chunkChecksum(blob);
+            for(let attempt = 1; ; attempt++){
+              try {
+                inflight.set(chunk.start, 0);
+                await sendUploadChunk(uploadId, chunk, blob, checksum, loaded => { inflight.set(chunk.start, loaded); report(); }, handle);
+                inflight.delete(chunk.start);
+                committed += chunk.end - chunk.start;
+                report();
+                break;
+              } catch(e){
+                inflight.delete(chunk.start);
+                if(handle.stopped) return;
+                if(e.status === 404 || e.status === 410 || attempt >= RESUMABLE_MAX_RETRIES) throw e;
+                await sleep(Math.min(30000, 1000 * 2 ** (attempt - 1)));
+              }
+            }
+          }
+        };
+        await Promise.all(Array.from({length: Math.min(RESUMABLE_PARALLEL, queue.length || 1)}, worker));
+        if(handle.cancelled) return 'cancelled';
+        if(item.paused) return 'paused'; // the session stays; the next run sends only what is missing
+
+        const r = await fetch(`/api/uploads/${encodeURIComponent(uploadId)}/finish`, {method:'POST'});
+        const j = await r.json();
+        if(!r.ok || !j.ok) throw new Error(j.error || 'finish failed');
+        localStorage.removeItem(key);
+        updateProgress(row, {percent:100, speed:0, eta:0});
+        markProgressComplete(row, true);
+        showToast(`Uploaded: ${file.name}`, 'success');
+        return 'done';
+      } catch(e){
+        if(handle.cancelled) return 'cancelled';
+        if(item.paused) return 'paused';
+        if(e.status === 404 || e.status === 410) localStorage.removeItem(key);
+        else handle.stop();  // stop sibling streams; the session stays resumable
         markProgressComplete(row, false);
         showToast(`Failed: ${file.name}`, 'error');
-      });
-      xhr.addEventListener('abort', ()=>{
+        return 'failed';
+      } finally {
         activeXHRs.delete(id);
-        row.remove();
-      });
-
-      xhr.open('POST', '{{ url_for("api_upload") }}');
-      xhr.send(form);
+        if(handle.cancelled){
+          row.remove();
+          localStorage.removeItem(key);
+          if(handle.uploadId) fetch(`/api/uploads/${encodeURIComponent(handle.uploadId)}`, {method:'DELETE'}).catch(()=>{});
+        }
+      }
     }
 
     function cancelUpload(id){
+      if(trackedJobs.has(id)){ cancelJob(id); return; }
+      dropQueuedUpload(id);
       const xhr = activeXHRs.get(id);
       if(xhr){ xhr.abort(); activeXHRs.delete(id); }
       const el = document.querySelector(`[data-upload-id="${id}"]`);
@@ -1514,7 +3781,7 @@ async function changeDhikr() {
 
     // SHARE / COPY
     function shareFile(rel){
-      const rawUrl = `${window.location.origin}{{ url_for('raw') }}?path=${encodeURIComponent(rel)}`;
+      const rawUrl = `${window.location.origin}/raw?path=${encodeURIComponent(rel)}`;
       if(navigator.share && /mobile|android|iphone/i.test(navigator.userAgent)){
         navigator.share({title:'Shared File', url:rawUrl}).catch(()=> copyLink(rawUrl));
       } else {
@@ -1574,7 +3841,7 @@ async function changeDhikr() {
 
       const isDir = card.dataset.isDir === '1';
       const rel = card.dataset.rel, name = card.dataset.name, mime = card.dataset.mime, raw = card.dataset.raw, dl = card.dataset.dl;
-      if(isDir){ window.location = "{{ url_for('browse') }}/" + rel; }
+      if(isDir){ window.location = "/b/" + rel; }
       else { openPreview(rel, name, mime, raw, dl); }
     }
 
@@ -1819,9 +4086,10 @@ document.addEventListener("keydown", function (e) {
     // DELETE
     function deleteFile(rel){
       if(!confirm('Delete this item?')) return;
-      fetch('{{ url_for("api_delete") }}', {method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({files:[rel]})})
+      fetch('/api/delete', {method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({files:[rel]})})
         .then(r=>r.json()).then(j=>{
-          if(j.ok){ showToast('Deleted', 'success'); setTimeout(()=> location.reload(), 400); }
+          if(j.ok && j.job){ trackJob(j.job, job => { if(job.state !== 'failed') location.reload(); }); }
+          else if(j.ok){ showToast('Deleted', 'success'); setTimeout(()=> location.reload(), 400); }
           else showToast(j.error || 'Delete failed', 'error');
         }).catch(()=> showToast('Delete failed', 'error'));
     }
@@ -1832,7 +4100,7 @@ document.addEventListener("keydown", function (e) {
       const name = (document.getElementById('folderNameInput')?.value || '').trim();
       if(!name){ showToast('Enter folder name', 'warning'); return; }
       try{
-        const r = await fetch('{{ url_for("api_mkdir") }}', {method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({dest: window.currentPath || '', name})});
+        const r = await fetch('/api/mkdir', {method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({dest: window.currentPath || '', name})});
         const j = await r.json();
         if(j.ok){ showToast('Folder created', 'success'); closeModal('newFolderModal'); setTimeout(()=> location.reload(), 300); }
         else showToast(j.error || 'Failed', 'error');
@@ -1856,7 +4124,7 @@ document.addEventListener("keydown", function (e) {
       }
       
       try {
-        const r = await fetch('{{ url_for("api_cliptext") }}', {
+        const r = await fetch('/api/cliptext', {
           method: 'POST',
           headers: {'Content-Type':'application/json'},
           body: JSON.stringify({ dest: window.currentPath || '', name: fname, text })
@@ -1880,7 +4148,7 @@ document.addEventListener("keydown", function (e) {
       const sortDir = document.getElementById('sortDir');
       const ff = document.getElementById('foldersFirst');
       const prefs = getSortPrefs();
-      if(sortBy){ sortBy.value = prefs.by; sortBy.addEventListener('change', ()=>{ setSortPrefs(sortBy.value, null, null); applySort(); }); }
+      if(sortBy){ sortBy.value = prefs.by; sortBy.addEventListener('change', ()=>{ setSortPrefs(sortBy.value, null, null); applySort(); reloadListing(); }); }
       if(sortDir){
         sortDir.dataset.dir = prefs.dir;
         sortDir.innerHTML = prefs.dir === 'asc' ? '<i class="fas fa-arrow-up-wide-short"></i>' : '<i class="fas fa-arrow-down-wide-short"></i>';
@@ -1890,9 +4158,10 @@ document.addEventListener("keydown", function (e) {
           sortDir.dataset.dir = cur;
           sortDir.innerHTML = cur === 'asc' ? '<i class="fas fa-arrow-up-wide-short"></i>' : '<i class="fas fa-arrow-down-wide-short"></i>';
           applySort();
+          reloadListing();
         });
       }
-      if(ff){ ff.checked = prefs.foldersFirst; ff.addEventListener('change', ()=>{ setSortPrefs(null, null, ff.checked); applySort(); }); }
+      if(ff){ ff.checked = prefs.foldersFirst; ff.addEventListener('change', ()=>{ setSortPrefs(null, null, ff.checked); applySort(); reloadListing(); }); }
     }
 
 // SOCKET (live update without reload)
@@ -1900,30 +4169,29 @@ function initSocket(){
   try {
     const socket = io({reconnection:true, reconnectionAttempts:5, reconnectionDelay:1000});
 
-    socket.on('file_update', (msg)=> {
-      // Server emits:
-      //  - on add: {action:'added', dir:'<parent_rel>', meta:{...}}
-      //  - on delete: {action:'deleted', dir:'<parent_rel>', rel:'<path>'}
-      const cur = window.currentPath || '';
-      if (!msg || typeof msg !== 'object') return;
-
-      if (msg.dir === cur) {
-        if (msg.action === 'added' && msg.meta) {
-          upsertFileCard(msg.meta);
-          showToast(`Added: ${msg.meta.name}`, 'success');
-        } else if (msg.action === 'deleted' && msg.rel) {
-          removeFileCard(msg.rel);
-          showToast('Deleted', 'warning');
-        }
-      } else {
-        // Optional: notify if update happened in another folder
-        // showToast(`Update in ${msg.dir || 'root'}`, 'info');
-      }
-
-      // Keep your dhikr shuffle if you like
-      try { changeDhikr(); } catch(e){}
+    // Updates are sent per folder: (re)subscribe to the one on screen after every (re)connect.
+    // Then fetch whatever happened while disconnected (nothing, on the first connect).
+    socket.on('connect', ()=> {
+      if (window.FV_LOGIN) { socket.emit('watch_login', {token: window.FV_LOGIN.token}); return; }
+      socket.emit('watch_dir', {dir: window.currentPath || ''}); catchUpChanges();
+    });
+    // QR login page: the server pushes login_ready once the phone has scanned.
+    socket.on('login_ready', (msg)=> window.FV_LOGIN?.onReady(msg && msg.url));
+    document.addEventListener('visibilitychange', ()=> { if (document.visibilityState === 'visible') catchUpChanges(); });
+    socket.on('job_progress', updateJob);
+    socket.on('usage_update', (u)=> {
+      if (!u || typeof u !== 'object') return;
+      const set = (id, v)=> { const el = document.getElementById(id); if (el && v !== undefined) el.textContent = v; };
+      set('statFiles', u.files); set('statSize', u.size_h); set('statDirs', u.dirs);
     });
 
+    // Server emits file_update_batch: {dir:'<parent_rel>', events:[...]}, each event one of
+    //  - on add: {action:'added', dir:'<parent_rel>', meta:{...}, seq:N}
+    //  - on delete: {action:'deleted', dir:'<parent_rel>', rel:'<path>', seq:N}
+    //  - after a big batch upload: {action:'refresh', dir:'<parent_rel>', count:N, seq:N}
+    socket.on('file_update_batch', (batch)=> applyFileUpdates(batch && batch.events));
+    socket.on('file_update', (msg)=> applyFileUpdates([msg]));
+
   } catch(e){
     console.warn('Socket init failed', e);
   }
@@ -1944,7 +4212,7 @@ function renderFileCard(meta){
   if(isDir){
     preview = `<div class="file-icon-large" style="font-size:2rem;opacity:.6;">📁</div>`;
   } else if(mime.startsWith('image/')){
-    preview = `<img src="${meta.raw_url}" alt="${safeHTML(meta.name)}" loading="lazy" />`;
+    preview = `<img src="${meta.thumb_url || meta.raw_url}" alt="${safeHTML(meta.name)}" loading="lazy" decoding="async" />`;
   } else if(mime.startsWith('video/')){
     preview = `<div class="file-icon-large" style="font-size:2rem;opacity:.6;">🎬</div>`;
   } else if(mime.startsWith('audio/')){
@@ -1975,6 +4243,7 @@ function renderFileCard(meta){
       <div class="file-actions">
         ${isDir
           ? `<a class="btn btn-secondary btn-icon" href="${openHref}" title="Open"><i class="fas fa-folder-open"></i></a>
+             ${document.getElementById('fileGrid')?.dataset.canZip === '1' ? `<a class="btn btn-secondary btn-icon" href="/api/zip?paths=${encodeURIComponent(meta.rel)}" title="Download as ZIP"><i class="fas fa-file-zipper"></i></a>` : ''}
              <button class="btn btn-danger btn-icon" onclick="event.stopPropagation(); deleteFile('${meta.rel.replace(/'/g,"\\'")}')" title="Delete Folder"><i class="fas fa-trash"></i></button>`
           : `<a class="btn btn-primary btn-icon" href="${meta.download_url}" title="Download"><i class="fas fa-download"></i></a>
              <button class="btn btn-secondary btn-icon" onclick="event.stopPropagation(); shareFile('${meta.rel.replace(/'/g,"\\'")}')" title="Share"><i class="fas fa-share"></i></button>
@@ -1985,7 +4254,7 @@ function renderFileCard(meta){
   `;
   return el;
 }
-function upsertFileCard(meta){
+function upsertFileCard(meta, opts={}){
   const grid = document.getElementById('fileGrid');
   if(!grid || !meta) return;
   const existing = qsCardByRel(meta.rel);
@@ -1995,10 +4264,38 @@ function upsertFileCard(meta){
   } else {
     grid.appendChild(node);
   }
+  if(opts.deferSort) return; // caller re-sorts once for the whole batch
   // Keep UX consistent: apply current sort and search filter
   try { applySort(); } catch(e){}
   try { searchFiles(); } catch(e){}
 }
+// Apply a list of {action, dir, meta|rel} events with one sort/filter pass.
+function applyFileUpdates(events){
+  const cur = window.currentPath || '';
+  let added = 0, deleted = 0, lastName = '', refresh = false;
+  (events || []).forEach(msg => {
+    if (!msg || typeof msg !== 'object') return;
+    if (msg.seq > changeState.seq) changeState.seq = msg.seq;
+    if (msg.dir !== cur) return;
+    if (msg.action === 'added' && msg.meta) {
+      upsertFileCard(msg.meta, {deferSort: true});
+      added++; lastName = msg.meta.name;
+    } else if (msg.action === 'deleted' && msg.rel) {
+      removeFileCard(msg.rel);
+      deleted++;
+    } else if (msg.action === 'refresh') {
+      refresh = true; // too many changes to send one by one
+    }
+  });
+  if (refresh) { reloadListing(); return; }
+  if (!added && !deleted) return;
+  if (added) { try { applySort(); } catch(e){} }
+  try { searchFiles(); } catch(e){}
+  if (added) showToast(added === 1 ? `Added: ${lastName}` : `Added ${added} items`, 'success');
+  if (deleted) showToast(deleted === 1 ? 'Deleted' : `Deleted ${deleted} items`, 'warning');
+  // Keep your dhikr shuffle if you like (once per batch, not per file)
+  try { changeDhikr(); } catch(e){}
+}
 function removeFileCard(rel){
   const el = qsCardByRel(rel);
   if(el) el.remove();
@@ -2008,7 +4305,7 @@ function removeFileCard(rel){
     async function showMyQR(){
       try {
         const mode = qrOnlineMode ? 'online' : 'local';
-        const r = await fetch(`{{ url_for("api_my_qr") }}?mode=${mode}`, {cache:'no-store'});
+        const r = await fetch(`/api/my_qr?mode=${mode}`, {cache:'no-store'});
         const j = await r.json();
         if(j.ok){
           const toggleId = 'qrToggle-' + Date.now();
@@ -2062,7 +4359,7 @@ function removeFileCard(rel){
     function togglePrivacy(){ const t = document.getElementById('privacyToggle'); t.classList.toggle('active'); }
     document.getElementById('settingsBtn')?.addEventListener('click', openSettings);
     document.getElementById('privacyToggle')?.addEventListener('click', togglePrivacy);
-    document.getElementById('generateTokenBtn')?.addEventListener('click', generateToken);
+    document.getElementById('generateTokenBtn')?.addEventListener('click', () => generateToken(false));
     document.getElementById('shareTokenBtn')?.addEventListener('click', showTokenShare);
     document.getElementById('saveSettingsBtn')?.addEventListener('click', async ()=>{
       const priv = document.getElementById('privacyToggle').classList.contains('active'); // true => private
@@ -2075,16 +4372,18 @@ function removeFileCard(rel){
       } catch(e){ showToast('Failed', 'error'); }
     });
     
-    async function generateToken() {
+    async function generateToken(rotate) {
       try {
         const r = await fetch('/api/accounts/token', {
           method: 'POST',
           headers: {'Content-Type': 'application/json'},
-          body: JSON.stringify({name: 'Non-expiring API Token'})
+          body: JSON.stringify({name: 'Non-expiring API Token', rotate: rotate === true})
         });
         const j = await r.json();
         
-        if (j.ok) {
+        if (j.rotate_required) {
+          if (confirm(j.error + '\\n\\nReplace it?')) generateToken(true);
+        } else if (j.ok) {
           const tokenInput = document.getElementById('apiTokenInput');
           tokenInput.value = j.token;
           tokenInput.select();
@@ -2093,7 +4392,7 @@ function removeFileCard(rel){
           tokenInput.dataset.token = j.token;
           // Show share button
           document.getElementById('shareTokenBtn').style.display = 'inline-flex';
-          showToast('Token generated and copied to clipboard', 'success');
+          showToast(j.rotated ? 'New token copied; the previous token no longer works' : 'Token generated and copied to clipboard', 'success');
         } else {
           showToast(j.error || 'Failed to generate token', 'error');
         }
@@ -2114,7 +4413,7 @@ function removeFileCard(rel){
         
         // Generate QR code for token URL
         const mode = localStorage.getItem('qrMode') === 'online' ? 'online' : 'local';
-        const r = await fetch(`{{ url_for("api_my_qr") }}?mode=${mode}&token=${encodeURIComponent(token)}`, {cache:'no-store'});
+        const r = await fetch(`/api/my_qr?mode=${mode}&token=${encodeURIComponent(token)}`, {cache:'no-store'});
         const j = await r.json();
         
         if (j.ok) {
@@ -2208,35 +4507,252 @@ function removeFileCard(rel){
       }
     }
 
-    // INIT
-    document.addEventListener('DOMContentLoaded', async ()=>{
-      window.currentPath = "{{ current_rel|default('', true) }}";
-      try {
-        const r = await fetch('/api/prefs'); const j = await r.json();
-        const v = j?.prefs?.view || localStorage.getItem('fileView') || 'grid';
-        setView(v);
-      } catch(e){ setView(localStorage.getItem('fileView') || 'grid'); }
+    // INIT
+    document.addEventListener('DOMContentLoaded', async ()=>{
+      window.currentPath = (window.FV_CONFIG || {}).currentPath || '';
+      try {
+        const r = await fetch('/api/prefs'); const j = await r.json();
+        const v = j?.prefs?.view || localStorage.getItem('fileView') || 'grid';
+        setView(v);
+      } catch(e){ setView(localStorage.getItem('fileView') || 'grid'); }
+
+      document.getElementById('searchInput')?.addEventListener('input', searchFiles);
+      initUploadArea();
+      initFileGrid();
+      initSortControls();
+      applySort();
+      initListing();
+      initSocket();
+
+      // Bind Create Folder / Paste text buttons
+      document.getElementById('mkdirCreateBtn')?.addEventListener('click', createNewFolder);
+      document.getElementById('folderNameInput')?.addEventListener('keydown', (e)=>{ if(e.key==='Enter'){ e.preventDefault(); createNewFolder(); }});
+      document.getElementById('openClipBtn')?.addEventListener('click', openClipModal);
+      document.getElementById('clipSaveBtn')?.addEventListener('click', saveClipboardText);
+      document.getElementById('clipTextInput')?.addEventListener('keydown', (e)=>{ if((e.ctrlKey||e.metaKey) && e.key==='Enter'){ e.preventDefault(); saveClipboardText(); }});
+      document.getElementById('clipNameInput')?.addEventListener('keydown', (e)=>{ if(e.key==='Enter'){ e.preventDefault(); saveClipboardText(); }});
+    });
+
+    // FAB
+    function toggleFabMenu(){ document.getElementById('fabMenu')?.classList.toggle('active'); }
+    function closeFabMenu(){ document.getElementById('fabMenu')?.classList.remove('active'); }
+"""
+
+BASE_HTML = """
+<!doctype html>
+<html lang="en">
+<head>
+
+<script>
+  (function(){try{var t=localStorage.getItem('theme')||''; if(t&&t!=='dark') document.documentElement.classList.add(t);}catch(e){}})();
+</script>
+  <meta charset="utf-8"/>
+  <meta name="viewport" content="width=device-width, initial-scale=1, viewport-fit=cover"/>
+  <meta name="apple-mobile-web-app-capable" content="yes"/>
+  <meta name="apple-mobile-web-app-status-bar-style" content="black-translucent"/>
+  <title>FileVault</title>
+
+<link rel="icon" href="/static/favicon.svg" type="image/svg+xml" />
+<link rel="manifest" href="/static/site.webmanifest" />
+<meta name="theme-color" content="#0F172A" id="themeColorMeta" />
+<link rel="stylesheet" href="/static/fonts.css" />
+<link rel="stylesheet" href="/static/vendor/fontawesome/css/all.min.css" />
+<link rel="stylesheet" href="/static/vendor/fontawesome/css/fa-shims.css" />
+
+
+  <link rel="stylesheet" href="{{ asset_url('app.css') }}" />
+</head>
+<body class="{% if authed %}with-dhikr{% endif %}">
+  <header class="header">
+    <div class="header-content">
+      <a class="logo" href="{{ url_for('home') }}" title="My Files">
+        <i class="fas fa-shield-alt"></i><span>FileVault</span>
+      </a>
+      <nav class="nav-menu">
+        <a class="btn btn-secondary" href="{{ url_for('home') }}" title="My Files"><i class="fas fa-home"></i></a>
+        <div class="user-badge">{{ icon or "📁" }} {{ user_label }}</div>
+{% if authed %}
+  {% if is_admin %}
+    <button class="btn btn-secondary btn-icon" id="accountsBtn" title="Accounts"><i class="fas fa-user-gear"></i></button>
+    <button class="btn btn-secondary btn-icon" id="settingsBtn" title="Settings"><i class="fas fa-gear"></i></button>
+  {% endif %}
+  <button class="btn btn-success btn-icon" id="myQRBtn" title="My QR"><i class="fas fa-qrcode"></i></button>
+  <button id="themeBtn" class="btn btn-secondary btn-icon" title="Toggle theme"><i class="fas fa-moon"></i></button>
+  <a href="{{ url_for('logout') }}" class="btn btn-danger btn-icon" title="Logout"><i class="fas fa-sign-out-alt"></i></a>
+{% endif %}
+      </nav>
+    </div>
+  </header>
+
+  {% if authed %}
+  <div class="dhikr-banner" id="dhikrBanner">
+    <div class="dhikr-content">
+      <span class="dhikr-icon">✨</span>
+      <span class="dhikr-arabic" id="dhikrArabic">{{ dhikr }}</span>
+      <span class="dhikr-icon">🌟</span>
+    </div>
+    <button class="dhikr-refresh" onclick="changeDhikr()" title="Change Dhikr">
+      <i class="fas fa-sync-alt"></i>
+    </button>
+  </div>
+  {% endif %}
+
+  <div class="toast-container" id="toastContainer"></div>
+
+  <div class="container">
+    {{ body|safe }}
+  </div>
+
+  <!-- Preview Modal -->
+  <div class="modal" id="previewModal">
+    <div class="modal-content">
+      <div class="modal-header">
+        <div class="modal-title" id="pvTitle">Preview</div>
+        <button class="modal-close" onclick="closeModal('previewModal')" aria-label="Close"><i class="fas fa-times"></i></button>
+      </div>
+      <div class="modal-body">
+        <div class="preview-container" style="position:relative;">
+          <div class="preview-holder" id="pvMedia">Loading…</div>
+          <button class="nav-arrow nav-prev" id="pvPrevBtn" style="position:absolute; left:10px; top:50%; transform:translateY(-50%); background:rgba(0,0,0,0.5); color:white; border:none; border-radius:50%; width:40px; height:40px; display:flex; align-items:center; justify-content:center; cursor:pointer;"><i class="fas fa-chevron-left"></i></button>
+          <button class="nav-arrow nav-next" id="pvNextBtn" style="position:absolute; right:10px; top:50%; transform:translateY(-50%); background:rgba(0,0,0,0.5); color:white; border:none; border-radius:50%; width:40px; height:40px; display:flex; align-items:center; justify-content:center; cursor:pointer;"><i class="fas fa-chevron-right"></i></button>
+        </div>
+        <div class="row" style="gap:.5rem; align-items:center; margin-top:10px;">
+          <button class="btn btn-primary" id="pvOpenBtn"><i class="fas fa-up-right-from-square"></i> Open</button>
+          <a class="btn btn-secondary" id="pvDownloadBtn"><i class="fas fa-download"></i> Download</a>
+          <button class="btn btn-secondary" id="pvCopyBtn" style="display:none;"><i class="fas fa-copy"></i> Copy Text</button>
+          <button class="btn btn-secondary" id="pvShareBtn"><i class="fas fa-share"></i> Share</button>
+        </div>
+      </div>
+    </div>
+  </div>
+
+  <!-- Settings Modal -->
+  <div class="modal" id="settingsModal">
+    <div class="modal-content" style="max-width:520px;">
+      <div class="modal-header">
+        <div class="modal-title">Settings</div>
+        <button class="modal-close" onclick="closeModal('settingsModal')" aria-label="Close"><i class="fas fa-times"></i></button>
+      </div>
+      <div class="modal-body" id="settingsBody">
+        <div class="toggle-container">
+          <span class="toggle-label">Public</span>
+          <div class="toggle-switch" id="privacyToggle">
+            <div class="slider"></div>
+          </div>
+          <span class="toggle-label">Private</span>
+        </div>
+        <div style="margin-top:.75rem;">
+          <label class="form-label">Password (set/change when switching to Private)</label>
+          <input type="password" id="privacyPassword" class="form-input" placeholder="New password">
+        </div>
+        <div style="margin-top:1.5rem;">
+          <label class="form-label">API Token</label>
+          <div class="row" style="gap:.5rem; margin-top:.5rem;">
+            <input type="text" id="apiTokenInput" class="form-input" placeholder="Token will appear here" readonly style="flex:1;">
+            <button class="btn btn-primary" id="generateTokenBtn"><i class="fas fa-key"></i> Generate Token</button>
+            <button class="btn btn-secondary" id="shareTokenBtn" style="display:none;"><i class="fas fa-share"></i> Share</button>
+          </div>
+          <div style="margin-top:.5rem; color:var(--text-muted); font-size:.85rem;">Generate a non-expiring token for API access. There is one per account: generating another replaces it, and links shared with the old one stop working.</div>
+        </div>
+        <div style="margin-top:.75rem; color:var(--text-muted); font-size:.85rem;">Only the first device (admin) can change privacy.</div>
+      </div>
+      <div class="modal-footer">
+        <button class="btn btn-secondary" onclick="closeModal('settingsModal')">Close</button>
+        <button class="btn btn-primary" id="saveSettingsBtn"><i class="fas fa-save"></i> Save</button>
+      </div>
+    </div>
+  </div>
+  
+  <!-- Token Share Modal -->
+  <div class="modal" id="tokenShareModal">
+    <div class="modal-content" style="max-width:520px;">
+      <div class="modal-header">
+        <div class="modal-title">Share Access Token</div>
+        <button class="modal-close" onclick="closeModal('tokenShareModal')" aria-label="Close"><i class="fas fa-times"></i></button>
+      </div>
+      <div class="modal-body" id="tokenShareBody">
+        <div class="qr-box"><div style="color:#222;">Loading…</div></div>
+        <div class="row" style="justify-content:space-between; margin-top:.75rem;">
+          <div style="font-size:.85rem; color:var(--text-secondary); word-break:break-all;" id="tokenShareLink"></div>
+          <button class="btn btn-secondary" id="copyTokenShareBtn"><i class="fas fa-link"></i> Copy</button>
+        </div>
+        <div style="margin-top:1rem; color:var(--text-muted); font-size:.85rem;">
+          <p>Scan this QR code or share the link to allow others to access your server even after restarts.</p>
+          <p>This token does not expire and provides full access to your files.</p>
+        </div>
+      </div>
+    </div>
+  </div>
+
+  <!-- My QR Modal -->
+  <div class="modal" id="myQRModal">
+    <div class="modal-content" style="max-width:400px;">
+      <div class="modal-header">
+        <div class="modal-title">My QR</div>
+        <button class="modal-close" onclick="closeModal('myQRModal')" aria-label="Close"><i class="fas fa-times"></i></button>
+      </div>
+      <div class="modal-body" id="myQRBody">
+        <div class="qr-box"><div style="color:#222;">Loading…</div></div>
+        <div class="row" style="justify-content:space-between; margin-top:.75rem;">
+          <div style="font-size:.85rem; color:var(--text-secondary); word-break:break-all;" id="myQRLink"></div>
+          <button class="btn btn-secondary" id="copyQRBtn"><i class="fas fa-link"></i> Copy</button>
+        </div>
+      </div>
+    </div>
+  </div>
 
-      document.getElementById('searchInput')?.addEventListener('input', searchFiles);
-      initUploadArea();
-      initFileGrid();
-      initSortControls();
-      applySort();
-      initSocket();
+<!-- Accounts Modal -->
+<div class="modal" id="accountsModal">
+  <div class="modal-content" style="max-width:620px;">
+    <div class="modal-header">
+      <div class="modal-title">Accounts</div>
+      <button class="modal-close" onclick="closeModal('accountsModal')" aria-label="Close"><i class="fas fa-times"></i></button>
+    </div>
+    <div class="modal-body" id="accountsBody">Loading…</div>
+    <div class="modal-footer" style="flex-wrap:wrap; gap:.5rem;">
+      <input type="text" id="accCreateNameInput" class="form-input" placeholder="Custom name (optional) e.g. lucky-duck-042" style="flex:1; min-width:220px;">
+      <button class="btn btn-primary" id="accCreateBtn"><i class="fas fa-user-plus"></i> Create & Switch</button>
+    </div>
+  </div>
+</div>
 
-      // Bind Create Folder / Paste text buttons
-      document.getElementById('mkdirCreateBtn')?.addEventListener('click', createNewFolder);
-      document.getElementById('folderNameInput')?.addEventListener('keydown', (e)=>{ if(e.key==='Enter'){ e.preventDefault(); createNewFolder(); }});
-      document.getElementById('openClipBtn')?.addEventListener('click', openClipModal);
-      document.getElementById('clipSaveBtn')?.addEventListener('click', saveClipboardText);
-      document.getElementById('clipTextInput')?.addEventListener('keydown', (e)=>{ if((e.ctrlKey||e.metaKey) && e.key==='Enter'){ e.preventDefault(); saveClipboardText(); }});
-      document.getElementById('clipNameInput')?.addEventListener('keydown', (e)=>{ if(e.key==='Enter'){ e.preventDefault(); saveClipboardText(); }});
-    });
+<!-- Transfer Admin Modal -->
+<div class="modal" id="transferAdminModal">
+  <div class="modal-content" style="max-width:520px;">
+    <div class="modal-header">
+      <div class="modal-title" id="transferTitle">Transfer Admin</div>
+      <button class="modal-close" onclick="closeModal('transferAdminModal')" aria-label="Close"><i class="fas fa-times"></i></button>
+    </div>
+    <div class="modal-body" id="transferBody">
+      <div class="qr-box"><div style="color:#222;">Generating…</div></div>
+      <div class="row" style="justify-content:space-between; margin-top:.75rem;">
+        <div style="font-size:.85rem; color:var(--text-secondary); word-break:break-all;" id="transferLink"></div>
+        <button class="btn btn-secondary" id="transferCopyBtn"><i class="fas fa-link"></i> Copy</button>
+      </div>
+      <div style="margin-top:.5rem; color:var(--text-muted); font-size:.85rem;">
+        Scan this QR from the new device to become the admin of this account. The scanning device will be logged into the account and set as default.
+      </div>
+    </div>
+    <div class="modal-footer">
+      <button class="btn btn-secondary" onclick="closeModal('transferAdminModal')">Close</button>
+    </div>
+  </div>
+</div>
+</div>
 
-    // FAB
-    function toggleFabMenu(){ document.getElementById('fabMenu')?.classList.toggle('active'); }
-    function closeFabMenu(){ document.getElementById('fabMenu')?.classList.remove('active'); }
+  <script src="/static/socket.io.min.js"></script>
+  <script>
+    if (typeof io === 'undefined') {
+      var s = document.createElement('script');
+      s.src = '/socket.io/socket.io.js';
+      document.head.appendChild(s);
+    }
   </script>
+
+<script src="{{ asset_url('accounts.js') }}"></script>
+  
+  <script>window.FV_CONFIG = {{ {"currentPath": current_rel or "", "dhikrList": dhikr_list}|tojson }};</script>
+  <script src="{{ asset_url('app.js') }}"></script>
 </body>
 </html>
 """
@@ -2246,15 +4762,16 @@ BROWSE_HTML = """
 <div class="stats-grid">
   <div class="stat-card">
     <div class="stat-icon" style="background: rgba(59,130,246,.2); color: var(--primary);"><i class="fas fa-file"></i></div>
-    <div class="stat-info"><div class="stat-label">Files</div><div class="stat-value">{{ stats.files }}</div></div>
+    <div class="stat-info"><div class="stat-label">Files</div><div class="stat-value" id="statFiles">{{ stats.files }}</div></div>
   </div>
   <div class="stat-card">
     <div class="stat-icon" style="background: rgba(245,158,11,.2); color: var(--warning);"><i class="fas fa-hdd"></i></div>
-    <div class="stat-info"><div class="stat-label">Storage</div><div class="stat-value">{{ stats.size_h }}</div></div>
+    <div class="stat-info"><div class="stat-label">Storage</div><div class="stat-value" id="statSize">{{ stats.size_h }}</div></div>
+    <button class="stat-rescan" onclick="rescanUsage()" title="Recount storage"><i class="fas fa-sync-alt"></i></button>
   </div>
   <div class="stat-card">
     <div class="stat-icon" style="background: rgba(139,92,246,.2); color: var(--secondary);"><i class="fas fa-folder"></i></div>
-    <div class="stat-info"><div class="stat-label">Folders</div><div class="stat-value">{{ stats.dirs }}</div></div>
+    <div class="stat-info"><div class="stat-label">Folders</div><div class="stat-value" id="statDirs">{{ stats.dirs }}</div></div>
   </div>
   <div class="stat-card">
     <div class="stat-icon" style="background: rgba(16,185,129,.2); color: var(--success);"><i class="fas fa-calendar"></i></div>
@@ -2287,6 +4804,7 @@ BROWSE_HTML = """
     </div>
     <button class="btn btn-secondary" onclick="showNewFolderModal()"><i class="fas fa-folder-plus"></i> New Folder</button>
     <button class="btn btn-primary" id="openClipBtn"><i class="fas fa-clipboard"></i> Paste Text</button>
+    {% if current_rel and can_zip %}<a class="btn btn-secondary" href="{{ url_for('api_zip', paths=current_rel) }}" data-zip-path="{{ current_rel }}" onclick="startZipJob([this.dataset.zipPath]); return false;" title="Download this folder as ZIP"><i class="fas fa-file-zipper"></i> ZIP</a>{% endif %}
     <nav class="nav-menu">
     <a class="btn btn-secondary" href=".." title="Up one folder">
       <i class="fas fa-level-up-alt"></i>
@@ -2301,6 +4819,7 @@ BROWSE_HTML = """
 <div class="upload-section">
   <div class="upload-area" id="uploadArea">
     <input type="file" id="uploadInput" class="upload-input" multiple accept="*/*" />
+    <input type="file" id="uploadFolderInput" webkitdirectory multiple hidden />
     <div class="upload-icon"><i class="fas fa-cloud-upload-alt"></i></div>
     <div class="upload-text">Drop files or tap here</div>
     <div class="upload-subtext">Max 10GB per file</div>
@@ -2309,10 +4828,18 @@ BROWSE_HTML = """
 </div>
 
 <!-- Files -->
-<div class="file-grid list-view" id="fileGrid">
+<div class="file-grid list-view" id="fileGrid"
+     data-next-cursor="{{ listing.next_cursor or '' }}"
+     data-sort="{{ sort_opts.sort }}"
+     data-order="{{ 'desc' if sort_opts.desc else 'asc' }}"
+     data-folders-first="{{ 1 if sort_opts.folders_first else 0 }}"
+     data-changes-epoch="{{ changes.epoch }}"
+     data-can-zip="{{ 1 if can_zip else 0 }}"
+     data-changes-seq="{{ changes.seq }}">
   {% if not entries %}
     <div class="card" style="text-align:center; color:var(--text-muted);">No files yet. Upload something!</div>
   {% endif %}
+  {% set browse_url = url_for('browse') %}
   {% for item in entries %}
     <div class="file-card"
          data-rel="{{ item.rel }}"
@@ -2321,13 +4848,13 @@ BROWSE_HTML = """
          data-is-dir="{{ 1 if item.is_dir else 0 }}"
          data-size="{{ item.size }}"
          data-mtime="{{ item.mtime }}"
-         data-raw="{{ url_for('raw', path=item.rel) }}"
-         data-dl="{{ url_for('download', path=item.rel) }}">
+         data-raw="{{ item.raw_url }}"
+         data-dl="{{ item.download_url }}">
       <div class="file-preview">
         {% if item.is_dir %}
           <div class="file-icon-large" style="font-size:2rem;opacity:.6;">📁</div>
         {% elif item.mime.startswith('image/') %}
-          <img src="{{ url_for('raw', path=item.rel) }}" alt="{{ item.name }}" loading="lazy" />
+          <img src="{{ item.thumb_url }}" alt="{{ item.name }}" loading="lazy" decoding="async" />
         {% elif item.mime.startswith('video/') %}
           <div class="file-icon-large" style="font-size:2rem;opacity:.6;">🎬</div>
         {% elif item.mime.startswith('audio/') %}
@@ -2343,11 +4870,12 @@ BROWSE_HTML = """
         <div class="file-meta">{{ item.size_h }} • {{ item.mtime_h }}</div>
         <div class="file-actions">
           {% if not item.is_dir %}
-            <a class="btn btn-primary btn-icon" href="{{ url_for('download', path=item.rel) }}" title="Download"><i class="fas fa-download"></i></a>
+            <a class="btn btn-primary btn-icon" href="{{ item.download_url }}" title="Download"><i class="fas fa-download"></i></a>
             <button class="btn btn-secondary btn-icon" onclick="event.stopPropagation(); shareFile('{{ item.rel }}')" title="Share"><i class="fas fa-share"></i></button>
             <button class="btn btn-danger btn-icon" onclick="event.stopPropagation(); deleteFile('{{ item.rel }}')" title="Delete"><i class="fas fa-trash"></i></button>
           {% else %}
-            <a class="btn btn-secondary btn-icon" href="{{ url_for('browse') }}/{{ item.rel }}" title="Open"><i class="fas fa-folder-open"></i></a>
+            <a class="btn btn-secondary btn-icon" href="{{ browse_url }}/{{ item.rel }}" title="Open"><i class="fas fa-folder-open"></i></a>
+            {% if can_zip %}<a class="btn btn-secondary btn-icon" href="{{ url_for('api_zip', paths=item.rel) }}" title="Download as ZIP"><i class="fas fa-file-zipper"></i></a>{% endif %}
             <button class="btn btn-danger btn-icon" onclick="event.stopPropagation(); deleteFile('{{ item.rel }}')" title="Delete Folder"><i class="fas fa-trash"></i></button>
           {% endif %}
         </div>
@@ -2355,6 +4883,7 @@ BROWSE_HTML = """
     </div>
   {% endfor %}
 </div>
+<div id="listSentinel" style="height:1px;"></div>
 
 <!-- New Folder Modal -->
 <div class="modal" id="newFolderModal">
@@ -2400,6 +4929,7 @@ BROWSE_HTML = """
   <div class="fab-menu" id="fabMenu">
     <button class="fab-menu-item" onclick="showNewFolderModal()"><i class="fas fa-folder-plus"></i> New Folder</button>
     <button class="fab-menu-item" onclick="document.getElementById('uploadInput').click()"><i class="fas fa-file-upload"></i> Upload Files</button>
+    <button class="fab-menu-item" onclick="document.getElementById('uploadFolderInput').click()"><i class="fas fa-folder-tree"></i> Upload Folder</button>
     <button class="fab-menu-item" onclick="openClipModal()"><i class="fas fa-clipboard"></i> Paste Text</button>
   </div>
   <button class="fab" onclick="toggleFabMenu()"><i class="fas fa-plus"></i></button>
@@ -2452,15 +4982,25 @@ LOGIN_HTML = """
   });
   {% endif %}
   
+  // The server pushes "login_ready" once the phone scans; polling is only a slow fallback.
+  let pollDelay = 3000;
+  let done = false;
+  function finish(url){ if(url && !done){ done = true; window.location = url; } }
   async function poll(){
+    if(done) return;
     try {
       const r = await fetch("{{ url_for('check_login', token=token) }}", {cache:'no-store'});
       const j = await r.json();
-      if(j.authenticated && j.url){ window.location = j.url; return; }
+      if(j.authenticated && j.url){ finish(j.url); return; }
     } catch(e){}
-    setTimeout(poll, 1000);
+    setTimeout(poll, pollDelay);
   }
-  setTimeout(poll, 500);
+  // app.js initSocket() subscribes its (only) connection to this token and calls onReady.
+  window.FV_LOGIN = {token: currentToken, onReady: finish};
+  window.addEventListener('load', ()=>{
+    if(typeof io !== 'undefined') pollDelay = 20000;
+    setTimeout(poll, pollDelay);
+  });
 </script>
 """
 
@@ -2483,6 +5023,76 @@ UNLOCK_HTML = """
 </div>
 """
 
+# Compile the templates once at startup; render_template_string would
+# re-parse and recompile them on every page view.
+TEMPLATES = {
+    "base.html": BASE_HTML,
+    "browse.html": BROWSE_HTML,
+    "login.html": LOGIN_HTML,
+    "unlock.html": UNLOCK_HTML,
+}
+app.jinja_env.loader = ChoiceLoader([DictLoader(TEMPLATES), app.jinja_env.loader])
+for _name in TEMPLATES:
+    app.jinja_env.get_template(_name)
+
+# -----------------------------
+# Static bundle build: content-hashed names + gzip variants, cached forever
+# -----------------------------
+BUNDLE_DIR = Path(__file__).parent.resolve() / "static" / "build"
+BUNDLE_SOURCES = {"app.css": APP_CSS, "accounts.js": ACCOUNTS_JS, "app.js": APP_JS}
+BUNDLES: dict[str, str] = {}  # logical name -> fingerprinted file name
+
+def _write_atomic(p: Path, data: bytes):
+    tmp = p.with_name(p.name + ".tmp")
+    tmp.write_bytes(data)
+    tmp.replace(p)
+
+def build_static_bundles():
+    BUNDLE_DIR.mkdir(parents=True, exist_ok=True)
+    keep = set()
+    for name, source in BUNDLE_SOURCES.items():
+        data = source.strip().encode("utf-8") + b"\n"
+        stem, ext = os.path.splitext(name)
+        fname = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+        if not (BUNDLE_DIR / fname).exists():
+            _write_atomic(BUNDLE_DIR / fname, data)
+        if not (BUNDLE_DIR / (fname + ".gz")).exists():
+            _write_atomic(BUNDLE_DIR / (fname + ".gz"), gzip.compress(data, 9, mtime=0))
+        BUNDLES[name] = fname
+        keep |= {fname, fname + ".gz"}
+    for old in BUNDLE_DIR.iterdir():
+        if old.name not in keep:
+            old.unlink(missing_ok=True)  # left over from a previous build
+
+@app.template_global()
+def asset_url(name: str) -> str:
+    # Without a built bundle (unwritable static dir, ...) pages still work: the
+    # logical name is served straight from BUNDLE_SOURCES, just not cached for long.
+    return url_for("static_bundle", filename=BUNDLES.get(name, name))
+
+@app.route("/static/build/<filename>")
+def static_bundle(filename: str):
+    if filename in BUNDLE_SOURCES and filename not in BUNDLES:
+        rv = Response(BUNDLE_SOURCES[filename], mimetype=guess_mime(Path(filename)))
+        rv.headers["Cache-Control"] = "no-cache"
+        return rv
+    if filename not in BUNDLES.values():
+        abort(404)
+    path = BUNDLE_DIR / filename
+    gz = request.accept_encodings["gzip"] > 0
+    rv = send_file(BUNDLE_DIR / (filename + ".gz") if gz else path, mimetype=guess_mime(path),
+                   conditional=True, max_age=365 * 24 * 3600)
+    if gz:
+        rv.headers["Content-Encoding"] = "gzip"
+    rv.vary.add("Accept-Encoding")
+    rv.cache_control.immutable = True
+    return rv
+
+try:
+    build_static_bundles()
+except Exception as e:
+    print("[assets] bundle build failed, serving unbundled assets:", e)
+
 # -----------------------------
 # Routes: Auth with persistent device folders + Privacy
 # -----------------------------
@@ -2522,17 +5132,17 @@ def scan_admin(token: str):
     device_id, _existing_folder = get_or_create_device_folder(request)
 
     # Assign admin to this device for the target folder
-    users = app.config.setdefault("USERS", load_users())
+    users = app.config["USERS"]
     cfg = users.get(folder) or get_user_cfg(folder)
     cfg["admin_device"] = device_id
-    save_users(users)
+    save_user(folder)
 
     # Log this device into that account and set default
     session["authed"] = True
     session["folder"] = folder
     session["icon"] = get_user_icon(folder)
     app.config["DEVICE_MAP"][device_id] = {"folder": folder, "created": datetime.utcnow().isoformat() + "Z"}
-    save_device_map(app.config["DEVICE_MAP"])
+    save_device(device_id)
 
     resp = make_response(redirect(url_for("browse", subpath=folder)))
     resp.set_cookie(DEVICE_COOKIE_NAME, device_id, max_age=60*60*24*730, samesite="Lax")
@@ -2576,14 +5186,14 @@ def login():
     if ngrok_available:
         message = "Choose local (same network) or online (anywhere) and scan the QR."
     
-    body = render_template_string(LOGIN_HTML, 
+    body = render_template("login.html", 
                                    qr_b64=qr_b64, 
                                    qr_url=qr_url, 
                                    token=token,
                                    ngrok_available=ngrok_available,
                                    message=message)
     # On login page, no dhikr banner
-    return render_template_string(BASE_HTML, body=body, authed=is_authed(), icon=None, user_label="", current_rel="", dhikr="", dhikr_list=[], is_admin=False)
+    return render_template("base.html", body=body, authed=is_authed(), icon=None, user_label="", current_rel="", dhikr="", dhikr_list=[], is_admin=False)
 
 @app.route("/api/login_qr")
 def api_login_qr():
@@ -2623,23 +5233,201 @@ def unlock():
             return redirect(next_url)
         else:
             error = "Wrong password"
-    body = render_template_string(UNLOCK_HTML, error=error, next_url=next_url)
-    return render_template_string(BASE_HTML, body=body, authed=False, icon=None, user_label="", current_rel="", dhikr="", dhikr_list=[], is_admin=False)
+    body = render_template("unlock.html", error=error, next_url=next_url)
+    return render_template("base.html", body=body, authed=False, icon=None, user_label="", current_rel="", dhikr="", dhikr_list=[], is_admin=False)
+
+def login_completion_url(info: dict) -> Optional[str]:
+    """One-shot /pc_login URL for a pending session the phone has approved."""
+    pc_token = info.get("pc_token")
+    if not pc_token or not info.get("folder"):
+        return None
+    app.config["LOGIN_TOKENS"][pc_token] = info["folder"]
+    return url_for("pc_login", token=pc_token)
 
 @app.route("/check/<token>")
 def check_login(token: str):
+    # Polling fallback; the login page normally waits for the "login_ready" socket event.
     info = pending_sessions.get(token)
     if not info:
         return jsonify({"authenticated": False})
     if info["authenticated"]:
-        pc_token = info.get("pc_token")
-        pc_url = None
-        if pc_token and info.get("folder"):
-            app.config["LOGIN_TOKENS"][pc_token] = info["folder"]
-            pc_url = url_for("pc_login", token=pc_token)
+        pc_url = login_completion_url(info)
         return jsonify({"authenticated": True, "folder": info.get("folder"), "icon": info.get("icon"), "url": pc_url})
     return jsonify({"authenticated": False})
 
+@socketio.on("watch_login")
+def on_watch_login(data):
+    token = (data or {}).get("token") if isinstance(data, dict) else None
+    info = pending_sessions.get(token) if token else None
+    if not info:
+        return
+    join_room(f"login:{token}")
+    if info["authenticated"]:
+        # Scanned before this socket joined (or while it was reconnecting).
+        emit("login_ready", {"url": login_completion_url(info)})
+
+
+# -----------------------------
+# Live updates (Socket.IO rooms: "acct:<folder>" per account, "dir:<rel>" per open folder)
+# -----------------------------
+def account_room(folder: str) -> str:
+    return f"acct:{folder}"
+
+def dir_room(rel: str) -> str:
+    return f"dir:{rel}"
+
+class ChangeJournal:
+    """Per-account, in-memory log of file changes with increasing sequence numbers.
+
+    Each account keeps its last max_events changes, none older than ttl seconds.
+    Sequences restart with the process, so a position is only valid with the same epoch.
+    """
+
+    def __init__(self, max_events: int, ttl: float):
+        self.epoch = secrets.token_hex(8)
+        self.max_events = max_events
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._logs: dict[str, deque] = {}  # folder -> deque of (seq, logged_at, event)
+        self._seq: dict[str, int] = {}
+        self._dropped: dict[str, int] = {}  # folder -> highest seq no longer kept
+
+    def _trim(self, folder: str, log: deque, now: float):
+        # caller holds the lock
+        while log and (len(log) > self.max_events or log[0][1] <= now - self.ttl):
+            self._dropped[folder] = log.popleft()[0]
+
+    def append(self, folder: str, event: dict) -> int:
+        now = time.monotonic()
+        with self._lock:
+            seq = self._seq.get(folder, 0) + 1
+            self._seq[folder] = seq
+            log = self._logs.setdefault(folder, deque())
+            log.append((seq, now, event))
+            self._trim(folder, log, now)
+            return seq
+
+    def seq(self, folder: str) -> int:
+        with self._lock:
+            return self._seq.get(folder, 0)
+
+    def since(self, folder: str, since: int) -> tuple[int, Optional[list]]:
+        """(current seq, events after since); events is None if some of them are gone."""
+        with self._lock:
+            cur = self._seq.get(folder, 0)
+            log = self._logs.get(folder)
+            if log:
+                self._trim(folder, log, time.monotonic())
+            if since > cur or since < self._dropped.get(folder, 0):
+                return cur, None
+            return cur, [ev for s, _, ev in (log or ()) if s > since]
+
+    def sweep(self):
+        now = time.monotonic()
+        with self._lock:
+            for folder, log in list(self._logs.items()):
+                self._trim(folder, log, now)
+                if not log:
+                    del self._logs[folder]
+
+JOURNAL = ChangeJournal(JOURNAL_MAX_EVENTS, JOURNAL_TTL)
+
+class EventBatcher:
+    """Collects file updates for a short window, then sends one file_update_batch per folder room.
+
+    Within a window the latest event per path wins (add-then-delete arrives as a delete),
+    and each touched account gets a single usage_update.
+    """
+
+    def __init__(self, window_ms: int, max_batch: int):
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.cond = threading.Condition()
+        self.pending: dict[str, dict] = {}  # dir rel -> {path rel -> event}
+        self.accounts: set[str] = set()
+        self.thread = None
+        self.stats = {"events": 0, "batches": 0, "superseded": 0}
+
+    def add(self, payload: dict):
+        rel = (payload.get("meta") or {}).get("rel") or payload.get("rel") or ""
+        with self.cond:
+            events = self.pending.setdefault(payload["dir"], {})
+            if events.pop(rel, None) is not None:
+                self.stats["superseded"] += 1
+            events[rel] = payload
+            self.stats["events"] += 1
+            folder = first_segment(payload["dir"] or rel)
+            if folder:
+                self.accounts.add(folder)
+            self.cond.notify()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="event-batcher", daemon=True)
+                self.thread.start()
+
+    def flush(self):
+        with self.cond:
+            pending, self.pending = self.pending, {}
+            accounts, self.accounts = self.accounts, set()
+        for d, events in pending.items():
+            items = list(events.values())
+            for i in range(0, len(items), self.max_batch):
+                socketio.emit("file_update_batch", {"dir": d, "events": items[i:i + self.max_batch]}, to=dir_room(d))
+                self.stats["batches"] += 1
+        for folder in accounts:
+            socketio.emit("usage_update", usage_stats(folder), to=account_room(folder))
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.accounts:
+                    self.cond.wait()
+            time.sleep(self.window)  # let the rest of a burst arrive
+            try:
+                self.flush()
+            except Exception as e:
+                print("Event batch emit failed:", e)
+
+EVENT_BATCHER = EventBatcher(EVENT_BATCH_MS, max_batch=500)
+
+_emit_lock = threading.Lock()  # keeps batches in journal order
+
+def emit_file_update(payload: dict, external: bool = False):
+    """Journal a change and queue it for the viewers of payload["dir"]; sent batched, along with the account's new usage.
+
+    external marks changes found by the file watcher; anything else is the app's own and the watcher skips it.
+    """
+    rel = (payload.get("meta") or {}).get("rel") or payload.get("rel") or ""
+    folder = first_segment(payload["dir"] or rel)
+    if not external:
+        FS_WATCHER.note_own(rel)
+    with _emit_lock:
+        if folder:
+            payload["seq"] = JOURNAL.append(folder, payload)
+        EVENT_BATCHER.add(payload)
+
+@socketio.on("connect")
+def on_connect(auth=None):
+    if is_authed() and session.get("folder"):
+        join_room(account_room(session["folder"]))
+
+@socketio.on("watch_dir")
+def on_watch_dir(data):
+    """Subscribe this connection to one folder's updates (the one the page shows)."""
+    if not is_authed() or not isinstance(data, dict):
+        return
+    rel = str(data.get("dir") or "").strip("/")
+    for room in rooms():
+        if room.startswith("dir:"):
+            leave_room(room)
+    try:
+        d = safe_path(rel)
+    except HTTPException:
+        return
+    folder = path_folder(d)  # of the resolved path: "pub/../priv" is in priv
+    if not folder or not has_folder_access(folder) or not d.is_dir():
+        return
+    join_room(dir_room(path_rel(d)))
+
 @app.route("/scan/<token>")
 def scan(token: str):
     info = pending_sessions.get(token)
@@ -2659,6 +5447,7 @@ def scan(token: str):
     else:
         info["folder"] = folder
         info["icon"] = icon
+    socketio.emit("login_ready", {"url": login_completion_url(info)}, to=f"login:{token}")
     resp = make_response(redirect(url_for("browse", subpath=folder)))
     resp.set_cookie(DEVICE_COOKIE_NAME, device_id, max_age=60*60*24*730, samesite="Lax")
     return resp
@@ -2694,24 +5483,24 @@ def browse(subpath: Optional[str] = None):
         return redirect(url_for("login"))
     if not subpath:
         subpath = session.get("folder", "")
-    # Enforce access on folder
-    folder_name = subpath.split("/",1)[0] if subpath else session.get("folder","")
+    # Enforce access on the folder the path resolves into ("a/../b" is in b)
+    dest = safe_path(subpath) if subpath else ROOT_DIR
+    folder_name = path_folder(dest) or session.get("folder","")
     need = enforce_access_or_redirect(folder_name)
     if need: return need
 
-    dest = safe_path(subpath) if subpath else ROOT_DIR
     if not dest.exists():
         abort(404)
     if dest.is_file():
         rel = path_rel(dest)
         return redirect(url_for("download", path=rel))
 
-    items = []
-    for p in sorted(dest.iterdir(), key=lambda x: (not x.is_dir(), x.name.lower())):
-        items.append(get_file_meta(p))
+    user_prefs = get_user_cfg(session.get("folder", "")).get("prefs", {})
+    sort_opts = list_args(request.args, user_prefs.get("sort"))
+    changes = {"epoch": JOURNAL.epoch, "seq": JOURNAL.seq(folder_name)}  # taken before listing: replaying a change is harmless, missing one is not
+    listing = list_page(dest, cursor="", **sort_opts)
 
-    root_for_stats = ROOT_DIR / session.get("folder", "")
-    stats = get_stats(root_for_stats if root_for_stats.exists() else ROOT_DIR)
+    stats = usage_stats(session.get("folder", ""))
     device_map = app.config["DEVICE_MAP"]
     since_iso = None
     for did, info in device_map.items():
@@ -2728,14 +5517,16 @@ def browse(subpath: Optional[str] = None):
     cfg = get_user_cfg(session.get("folder",""))
     is_admin = bool(device_id and device_id == cfg.get("admin_device"))
 
-    body = render_template_string(BROWSE_HTML, entries=items, stats=stats, since=since)
-    return render_template_string(
-        BASE_HTML,
+    current_rel = path_rel(dest) if dest != ROOT_DIR else ""
+    can_zip = path_folder(dest) == session.get("folder")  # /api/zip serves the own account only
+    body = render_template("browse.html", entries=listing["entries"], listing=listing, sort_opts=sort_opts, changes=changes, stats=stats, since=since, current_rel=current_rel, can_zip=can_zip)
+    return render_template(
+        "base.html",
         body=body,
         authed=True,
         icon=session.get("icon"),
         user_label=session.get("folder",""),
-        current_rel=(path_rel(dest) if dest != ROOT_DIR else ""),
+        current_rel=current_rel,
         dhikr=dhikr, dhikr_list=dhikr_list,
         is_admin=is_admin
     )
@@ -2748,10 +5539,10 @@ def download():
     p = safe_path(rel)
     if not p.exists() or not p.is_file():
         abort(404)
-    folder_name = first_segment(rel) or session.get("folder","")
+    folder_name = path_folder(p) or session.get("folder","")
     need = enforce_access_or_redirect(folder_name)
     if need: return need
-    return send_from_directory(p.parent, p.name, as_attachment=True, download_name=p.name)
+    return send_partial_file(p, guess_mime(p), as_attachment=True)
 
 @app.route("/raw")
 def raw():
@@ -2761,12 +5552,35 @@ def raw():
     p = safe_path(rel)
     if not p.exists() or not p.is_file():
         abort(404)
-    folder_name = first_segment(rel) or session.get("folder","")
+    folder_name = path_folder(p) or session.get("folder","")
     need = enforce_access_or_redirect(folder_name)
     if need: return need
     mime = guess_mime(p)
     return send_partial_file(p, mime)
 
+@app.route("/thumb")
+def thumb():
+    if not is_authed():
+        return redirect(url_for("login"))
+    rel = request.args.get("path", "")
+    p = safe_path(rel)
+    if not p.exists() or not p.is_file():
+        abort(404)
+    folder_name = path_folder(p) or session.get("folder","")
+    need = enforce_access_or_redirect(folder_name)
+    if need: return need
+    size_key = request.args.get("size", "m")
+    if size_key not in THUMB_SIZES:
+        size_key = "m"
+    t = get_thumbnail(p, size_key)
+    if not t:
+        return redirect(url_for("raw", path=path_rel(p)))
+    # URLs carry the source mtime (?v=), so a cached thumbnail never goes stale
+    rv = send_file(t, mimetype=THUMB_MIME, conditional=True, max_age=30 * 24 * 3600)
+    rv.cache_control.public = False
+    rv.cache_control.private = True
+    return rv
+
 # -----------------------------
 # APIs (User + Files)
 # -----------------------------
@@ -2802,6 +5616,92 @@ def api_privacy():
     set_privacy(folder, is_public, pwd if (pwd and not is_public) else None)
     return jsonify({"ok": True, "public": is_public})
 
+@app.route("/api/list")
+def api_list():
+    if not is_authed():
+        return jsonify({"ok": False, "error": "not authed"}), 401
+    rel = (request.args.get("path") or session.get("folder", "")).strip("/")
+    d = safe_path(rel)
+    folder_name = path_folder(d) or session.get("folder", "")
+    if not has_folder_access(folder_name):
+        return jsonify({"ok": False, "error": "locked"}), 403
+    if not d.is_dir():
+        return jsonify({"ok": False, "error": "not found"}), 404
+    try:
+        limit = int(request.args.get("limit", LIST_PAGE_SIZE))
+    except ValueError:
+        limit = LIST_PAGE_SIZE
+    opts = list_args(request.args)
+    seq = JOURNAL.seq(folder_name)
+    page = list_page(d, q=request.args.get("q", ""), cursor=request.args.get("cursor", ""), limit=limit, **opts)
+    page["entries"] = [m.as_dict() for m in page["entries"]]
+    resp = jsonify({"ok": True, "dir": path_rel(d) if d != ROOT_DIR else "", "epoch": JOURNAL.epoch, "seq": seq, **page})
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+@app.route("/api/changes")
+def api_changes():
+    """Changes since a journal position: {epoch, seq, events} or {epoch, seq, resync: true}.
+
+    path limits events to one folder (as seen by its viewers); without it, all of the account's.
+    """
+    if not is_authed():
+        return jsonify({"ok": False, "error": "not authed"}), 401
+    d = safe_path((request.args.get("path") or "").strip("/"))
+    rel = path_rel(d) if d != ROOT_DIR else ""
+    folder_name = path_folder(d) or session.get("folder", "")
+    if not has_folder_access(folder_name):
+        return jsonify({"ok": False, "error": "locked"}), 403
+    try:
+        since = int(request.args.get("since", ""))
+    except ValueError:
+        return jsonify({"ok": False, "error": "bad since"}), 400
+    seq, events = JOURNAL.since(folder_name, since)
+    if request.args.get("epoch", JOURNAL.epoch) != JOURNAL.epoch:
+        events = None  # server restarted: old positions mean nothing
+    body = {"ok": True, "epoch": JOURNAL.epoch, "seq": seq}
+    if events is None:
+        body["resync"] = True
+    else:
+        body["events"] = [ev for ev in events if ev["dir"] == rel] if rel else events
+    resp = jsonify(body)
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+@app.route("/api/zip", methods=["GET","POST"])
+def api_zip():
+    """Download files and folders as one ZIP, streamed as it is built.
+
+    paths may repeat (?paths=a&paths=b); POST takes the same field from a form for long selections.
+    With job=1 the archive is built in the background instead (202 + job); its result has a
+    download_url that serves the finished file with Range support.
+    """
+    if not is_authed():
+        return jsonify({"ok": False, "error": "not authed"}), 401
+    rels = [r.strip("/") for r in request.values.getlist("paths") if r.strip("/")]
+    if not rels:
+        return jsonify({"ok": False, "error": "paths required"}), 400
+    targets = []
+    for rel in rels:
+        p = safe_path(rel)
+        if path_folder(p) != session.get("folder"):
+            return jsonify({"ok": False, "error": "forbidden"}), 403
+        if p == ROOT_DIR or not p.exists() or is_internal_name(p.name):
+            return jsonify({"ok": False, "error": f"not found: {rel}"}), 404
+        if p not in targets:
+            targets.append(p)
+    name = (targets[0].name if len(targets) == 1 else targets[0].parent.name or "FileVault") + ".zip"
+    if request.values.get("job") in ("1", "true"):
+        try:
+            return job_response(zip_archive_job(targets, session.get("folder"), name))
+        except JobLimitReached:
+            return job_limit_response()
+    rv = Response(iter_zip(targets), mimetype="application/zip", direct_passthrough=True)
+    set_content_disposition(rv, name)
+    rv.headers["Cache-Control"] = "no-store"
+    rv.headers["X-Accel-Buffering"] = "no"  # let reverse proxies pass chunks through as they come
+    return rv
+
 @app.route("/api/prefs", methods=["GET","POST"])
 def api_prefs():
     if not is_authed():
@@ -2822,69 +5722,456 @@ def api_prefs():
 def api_upload():
     if not is_authed():
         return jsonify({"ok": False, "error": "not authed"}), 401
-    dest_rel = request.form.get("dest", "")
-    dest_dir = safe_path(dest_rel)
+    boundary = request.mimetype_params.get("boundary")
+    if request.mimetype != "multipart/form-data" or not boundary:
+        return jsonify({"ok": False, "error": "multipart body required"}), 400
+    base_folder = session.get("folder")
+
+    # Parse the body incrementally. The file part is written straight into a temp file in the
+    # account folder, so "dest" may come before or after it (or in the query string); it is
+    # checked once the body is read and the temp file is then renamed into it.
+    fields = {"dest": request.args.get("dest", "")}
+    field_name = None
+    target = None  # bytearray for a plain field, file object for the upload, None to skip
+    out = tmp = dest_dir = filename = None
+    save_path = None
+    try:
+        for event in iter_multipart(request.stream, boundary.encode("latin-1")):
+            if isinstance(event, Field):
+                field_name, target = event.name, bytearray()
+            elif isinstance(event, File):
+                target = None
+                if event.name != "file" or tmp is not None:
+                    continue
+                if not event.filename:
+                    return jsonify({"ok": False, "error": "no file"}), 400
+                filename = sanitize_filename(event.filename)
+                if ALLOWED_UPLOAD_EXT:
+                  ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+                  if ext not in ALLOWED_UPLOAD_EXT:
+                    return jsonify({"ok": False, "error": "file type not allowed"}), 400
+                account_dir = safe_path(base_folder or "")
+                if account_dir == ROOT_DIR or not account_dir.is_dir():
+                    return jsonify({"ok": False, "error": "forbidden"}), 403
+                out, tmp = open_upload_temp(account_dir)
+                target = out
+            elif isinstance(event, Data):
+                if isinstance(target, bytearray):
+                    target += event.data
+                    if len(target) > UPLOAD_FIELD_MAX:
+                        return jsonify({"ok": False, "error": "form field too large"}), 413
+                    if not event.more_data:
+                        fields[field_name] = target.decode("utf-8", "replace")
+                        target = None
+                elif target is not None:
+                    target.write(event.data)
+                    if not event.more_data:
+                        target = None
+        if tmp is None:
+            return jsonify({"ok": False, "error": "no file"}), 400
+        out.close()
+        dest_dir = safe_path(fields.get("dest", ""))
+        if first_segment(path_rel(dest_dir)) != base_folder and path_rel(dest_dir) != "":
+            return jsonify({"ok": False, "error": "forbidden"}), 403
+        if not dest_dir.exists() or not dest_dir.is_dir():
+            return jsonify({"ok": False, "error": "bad dest"}), 400
+        save_path = commit_upload_temp(tmp, dest_dir, filename)
+        queue_thumbnail(save_path)
+    except ValueError:
+        return jsonify({"ok": False, "error": "malformed upload body"}), 400
+    except OSError as e:
+        return jsonify({"ok": False, "error": f"save failed: {e}"}), 500
+    finally:
+        if out is not None and not out.closed:
+            out.close()
+        if tmp is not None and save_path is None:
+            tmp.unlink(missing_ok=True)
+
+    invalidate_listing(dest_dir)
+    meta = get_file_meta(save_path)
+    adjust_usage(first_segment(path_rel(save_path)), files=1, size=meta["size"])
+    parent_rel = path_rel(dest_dir) if dest_dir != ROOT_DIR else ""
+    emit_file_update({"action":"added","dir": parent_rel, "meta": meta})
+    return jsonify({"ok": True, "meta": meta}), 201
+
+@app.route("/api/upload/batch", methods=["POST"])
+def api_upload_batch():
+    """Many files in one streamed body, each with a path relative to dest (created as needed).
+
+    Body: multipart/form-data with "dest", then per file an optional "path" field followed by a
+    "file" part (its filename is the path when no "path" came first); or a tar stream
+    (application/x-tar, gzip allowed) with dest in the query string.
+    """
+    if not is_authed():
+        return jsonify({"ok": False, "error": "not authed"}), 401
+    base_folder = session.get("folder")
+    boundary = request.mimetype_params.get("boundary")
+    is_tar = request.mimetype in ("application/x-tar", "application/tar", "application/gzip", "application/x-gzip")
+    if not is_tar and (request.mimetype != "multipart/form-data" or not boundary):
+        return jsonify({"ok": False, "error": "multipart or tar body required"}), 400
+
+    def open_batch(dest_rel: str):
+        dest_dir = safe_path(dest_rel)
+        if first_segment(path_rel(dest_dir)) != base_folder:
+            return None, (jsonify({"ok": False, "error": "forbidden"}), 403)
+        if not dest_dir.is_dir():
+            return None, (jsonify({"ok": False, "error": "bad dest"}), 400)
+        return UploadBatch(dest_dir), None
+
+    # Every way out after the batch is opened goes through batch.finish() below, so files
+    # saved before an error are still counted, listed and announced.
+    batch = refused = None
+    error, status = None, 500
+    try:
+        if is_tar:
+            batch, refused = open_batch(request.args.get("dest", ""))
+            if batch is not None:
+                with tarfile.open(fileobj=request.stream, mode="r|*") as tf:
+                    for member in tf:
+                        if member.isdir():
+                            batch.add_dir(member.name)
+                        elif member.isfile():
+                            out = batch.begin(member.name)
+                            if out is None:
+                                continue
+                            src = tf.extractfile(member)
+                            while True:
+                                chunk = src.read(UPLOAD_CHUNK_SIZE)
+                                if not chunk:
+                                    break
+                                out.write(chunk)
+                            batch.end()
+                        else:
+                            batch.skipped.append(member.name)  # links, devices
+        else:
+            fields = {"dest": request.args.get("dest", "")}
+            field_name = target = None
+            for event in iter_multipart(request.stream, boundary.encode("latin-1")):
+                if isinstance(event, Field):
+                    field_name, target = event.name, bytearray()
+                elif isinstance(event, File):
+                    target = None
+                    if event.name != "file":
+                        continue
+                    if batch is None:
+                        batch, refused = open_batch(fields.get("dest", ""))
+                        if refused:
+                            break
+                    target = batch.begin(fields.pop("path", None) or event.filename or "")
+                elif isinstance(event, Data):
+                    if isinstance(target, bytearray):
+                        target += event.data
+                        if len(target) > UPLOAD_FIELD_MAX:
+                            error, status = "form field too large", 413
+                            break
+                        if not event.more_data:
+                            fields[field_name] = target.decode("utf-8", "replace")
+                            target = None
+                    elif target is not None:
+                        target.write(event.data)
+                        if not event.more_data:
+                            batch.end()
+                            target = None
+    except ClientDisconnected:
+        error = "client disconnected"
+    except (ValueError, tarfile.TarError, EOFError):
+        error, status = "malformed upload body", 400
+    except OSError as e:
+        error = f"save failed: {e}"
+    finally:
+        if batch is not None:
+            batch.discard()
+    if refused:
+        return refused
+    if batch is None:
+        return jsonify({"ok": False, "error": error or "no file"}), 413 if status == 413 else 400
+    result = batch.finish()  # whatever was saved before an error stays and is reported
+    if error:
+        return jsonify({"ok": False, "error": error, **result}), status
+    return jsonify({"ok": True, **result}), 201
+
+@app.route("/api/uploads", methods=["POST"])
+def api_uploads_create():
+    if not is_authed():
+        return jsonify({"ok": False, "error": "not authed"}), 401
+    data = request.get_json(silent=True) or {}
+    dest_dir = safe_path(data.get("dest") or "")
     base_folder = session.get("folder")
     if first_segment(path_rel(dest_dir)) != base_folder and path_rel(dest_dir) != "":
         return jsonify({"ok": False, "error": "forbidden"}), 403
     if not dest_dir.exists() or not dest_dir.is_dir():
         return jsonify({"ok": False, "error": "bad dest"}), 400
-    f = request.files.get("file")
-    if not f or not f.filename:
-        return jsonify({"ok": False, "error": "no file"}), 400
-
-    filename = sanitize_filename(f.filename)
+    if not (data.get("name") or "").strip():
+        return jsonify({"ok": False, "error": "name required"}), 400
+    filename = sanitize_filename(data.get("name"))
     if ALLOWED_UPLOAD_EXT:
       ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
       if ext not in ALLOWED_UPLOAD_EXT:
         return jsonify({"ok": False, "error": "file type not allowed"}), 400
+    try:
+        size = int(data.get("size"))
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "size required"}), 400
+    if size < 0 or size > MAX_CONTENT_LENGTH:
+        return jsonify({"ok": False, "error": "file too large"}), 413
+
+    gc_upload_sessions()
+    upload_id = secrets.token_urlsafe(18)
+    part = dest_dir / f"{INTERNAL_PREFIX}upload-{upload_id}.part"
+    try:
+        UPLOAD_SESSIONS_DIR.mkdir(parents=True, exist_ok=True)
+        with part.open("xb") as out:
+            preallocate(out.fileno(), size)
+    except OSError as e:
+        part.unlink(missing_ok=True)
+        return jsonify({"ok": False, "error": f"create failed: {e}"}), 500
+    info = {
+        "id": upload_id,
+        "folder": base_folder,
+        "dest": path_rel(dest_dir),
+        "name": filename,
+        "size": size,
+        "offset": 0,
+        "ranges": [],
+        "part": path_rel(part),
+        "created": datetime.utcnow().isoformat() + "Z",
+    }
+    save_upload_session(info)
+    rv = upload_offset_response(info, 201)
+    rv.headers["Location"] = url_for("api_uploads_status", upload_id=upload_id)
+    return rv
 
-    save_path = dest_dir / filename
-    base, ext = os.path.splitext(filename)
-    i = 1
-    while save_path.exists():
-        save_path = dest_dir / f"{base} ({i}){ext}"
-        i += 1
+@app.route("/api/uploads/<upload_id>", methods=["GET"])
+def api_uploads_status(upload_id: str):
+    if not is_authed():
+        return jsonify({"ok": False, "error": "not authed"}), 401
+    info = load_upload_session(upload_id)
+    if not info or info.get("folder") != session.get("folder"):
+        return jsonify({"ok": False, "error": "no such upload"}), 404
+    return upload_offset_response(info)
+
+@app.route("/api/uploads/<upload_id>", methods=["PATCH"])
+def api_uploads_patch(upload_id: str):
+    """Write one chunk at Upload-Offset. Chunks may arrive in any order and in parallel."""
+    if not is_authed():
+        return jsonify({"ok": False, "error": "not authed"}), 401
+    with upload_session_lock(upload_id):
+        info = load_upload_session(upload_id)
+    if not info or info.get("folder") != session.get("folder"):
+        return jsonify({"ok": False, "error": "no such upload"}), 404
     try:
-        f.save(save_path)
-    except Exception as e:
-        return jsonify({"ok": False, "error": f"save failed: {e}"}), 500
+        offset = int(request.headers.get("Upload-Offset", ""))
+    except ValueError:
+        return jsonify({"ok": False, "error": "Upload-Offset header required"}), 400
+    length = request.content_length
+    if length is None or offset < 0 or offset + length > info["size"]:
+        return jsonify({"ok": False, "error": "chunk outside upload"}), 416
+    try:
+        checksum = parse_upload_checksum(request.headers.get("Upload-Checksum"))
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    part = upload_part_path(info)
+    if not part or not part.exists():
+        with upload_session_lock(upload_id):
+            discard_upload_session(info)
+        return jsonify({"ok": False, "error": "upload data lost"}), 410
+
+    if checksum and length > UPLOAD_CHECKED_CHUNK_MAX:
+        return jsonify({"ok": False, "error": "checksummed chunk too large"}), 413
+
+    def pwrite_all(fd: int, data, pos: int) -> int:
+        view = memoryview(data)
+        while view:
+            n = os.pwrite(fd, view, pos)
+            view = view[n:]
+            pos += n
+        return len(data)
+
+    # The data write happens outside the session lock so parallel chunks don't serialize;
+    # each chunk lands directly at its offset in the preallocated part file. A checksummed
+    # chunk is buffered and written only once it verifies, so a bad retry of an already
+    # committed range cannot overwrite good data.
+    written = 0
+    buffered = bytearray() if checksum else None
+    try:
+        fd = os.open(part, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+        try:
+            try:
+                received = 0
+                while received < length:
+                    chunk = request.stream.read(min(UPLOAD_CHUNK_SIZE, length - received))
+                    if not chunk:
+                        break
+                    received += len(chunk)
+                    if buffered is not None:
+                        buffered += chunk
+                    else:
+                        written += pwrite_all(fd, chunk, offset + written)
+            except ClientDisconnected:
+                pass
+            if buffered is not None:
+                checksum[0].update(buffered)
+                if len(buffered) != length or not secrets.compare_digest(checksum[0].digest(), checksum[1]):
+                    return jsonify({"ok": False, "error": "checksum mismatch"}), 460
+                written = pwrite_all(fd, buffered, offset)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    except OSError as e:
+        return jsonify({"ok": False, "error": f"write failed: {e}"}), 500
+
+    with upload_session_lock(upload_id):
+        info = load_upload_session(upload_id)
+        if not info:
+            return jsonify({"ok": False, "error": "no such upload"}), 404
+        if written:
+            add_upload_range(info, offset, offset + written)
+            save_upload_session(info)
+        return upload_offset_response(info)
+
+@app.route("/api/uploads/<upload_id>/finish", methods=["POST"])
+def api_uploads_finish(upload_id: str):
+    if not is_authed():
+        return jsonify({"ok": False, "error": "not authed"}), 401
+    with upload_session_lock(upload_id):
+        info = load_upload_session(upload_id)
+        if not info or info.get("folder") != session.get("folder"):
+            return jsonify({"ok": False, "error": "no such upload"}), 404
+        if info["ranges"] != [[0, info["size"]]] and info["size"] > 0:
+            return upload_offset_response(info, 409)
+        dest_dir = safe_path(info["dest"])
+        part = upload_part_path(info)
+        if not part or not part.exists() or not dest_dir.is_dir():
+            discard_upload_session(info)
+            return jsonify({"ok": False, "error": "upload data lost"}), 410
+        try:
+            save_path = commit_upload_temp(part, dest_dir, info["name"])
+            queue_thumbnail(save_path)
+        except OSError as e:
+            return jsonify({"ok": False, "error": f"save failed: {e}"}), 500
+        discard_upload_session(info)
 
+    invalidate_listing(dest_dir)
     meta = get_file_meta(save_path)
+    adjust_usage(first_segment(path_rel(save_path)), files=1, size=meta["size"])
     parent_rel = path_rel(dest_dir) if dest_dir != ROOT_DIR else ""
-    socketio.emit("file_update", {"action":"added","dir": parent_rel, "meta": meta})
+    emit_file_update({"action":"added","dir": parent_rel, "meta": meta})
     return jsonify({"ok": True, "meta": meta}), 201
 
+@app.route("/api/uploads/<upload_id>", methods=["DELETE"])
+def api_uploads_cancel(upload_id: str):
+    if not is_authed():
+        return jsonify({"ok": False, "error": "not authed"}), 401
+    with upload_session_lock(upload_id):
+        info = load_upload_session(upload_id)
+        if not info or info.get("folder") != session.get("folder"):
+            return jsonify({"ok": False, "error": "no such upload"}), 404
+        discard_upload_session(info)
+    return jsonify({"ok": True})
+
 @app.route("/api/delete", methods=["POST"])
 def api_delete():
+    """Delete files right away; folders go to one background job and the answer is 202 + job."""
     if not is_authed():
         return jsonify({"ok": False, "error": "not authed"}), 401
     data = request.get_json(silent=True) or {}
     files = data.get("files") or []
     deleted = []
+    trees = []
     base_folder = session.get("folder")
     for rel in files:
-        if first_segment(rel) != base_folder:
+        try:
+            p = safe_path(rel)
+        except HTTPException:
             continue
-        p = safe_path(rel)
-        if p.exists():
+        if path_folder(p) != base_folder:  # resolved: "own/../other/x" is not ours
+            continue
+        rel = path_rel(p)
+        if p.is_dir() and not p.is_symlink():
+            trees.append(p)
+        elif p.exists() or p.is_symlink():
             try:
-                if p.is_file():
-                    p.unlink()
-                elif p.is_dir():
-                    for sub in sorted(p.rglob("*"), reverse=True):
-                        if sub.is_file(): sub.unlink()
-                        else: sub.rmdir()
-                    p.rmdir()
+                removed = {"files": 0, "dirs": 0, "bytes": 0}
+                try:
+                    remove_counted(p, removed)
+                finally:
+                    invalidate_listing(p.parent)
+                    adjust_usage(base_folder, -removed["files"], -removed["dirs"], -removed["bytes"])
                 deleted.append(rel)
             except Exception as e:
                 print("Delete failed:", e)
     for rel in deleted:
         parent = str(Path(rel).parent).replace("\\", "/")
         if parent == ".": parent = ""
-        socketio.emit("file_update", {"action":"deleted","dir": parent, "rel": rel})
+        emit_file_update({"action":"deleted","dir": parent, "rel": rel})
+    if trees:
+        try:
+            job = delete_tree_job(trees, base_folder)
+        except JobLimitReached:
+            return job_limit_response(deleted=deleted)
+        return jsonify({"ok": True, "deleted": deleted, "job": job.as_dict()}), 202
     return jsonify({"ok": True, "deleted": deleted})
 
+@app.route("/api/usage/rescan", methods=["POST"])
+def api_usage_rescan():
+    """Recount this account's files and bytes from disk as a job; usage_update follows."""
+    if not is_authed():
+        return jsonify({"ok": False, "error": "not authed"}), 401
+    folder = session.get("folder")
+    for job in all_jobs():
+        if job.kind == "rescan" and job.folder == folder and job.state in ("queued", "running"):
+            return job_response(job)
+    try:
+        return job_response(usage_rescan_job(folder))
+    except JobLimitReached:
+        return job_limit_response()
+
+def owned_job(job_id: str) -> Optional[Job]:
+    job = get_job(job_id)
+    return job if job is not None and job.folder == session.get("folder") else None
+
+@app.route("/api/jobs")
+def api_jobs():
+    if not is_authed():
+        return jsonify({"ok": False, "error": "not authed"}), 401
+    folder = session.get("folder")
+    jobs = sorted((j for j in all_jobs() if j.folder == folder), key=lambda j: j.created)
+    return jsonify({"ok": True, "jobs": [j.as_dict() for j in jobs]})
+
+@app.route("/api/jobs/<job_id>")
+def api_job(job_id):
+    if not is_authed():
+        return jsonify({"ok": False, "error": "not authed"}), 401
+    job = owned_job(job_id)
+    if job is None:
+        return jsonify({"ok": False, "error": "no such job"}), 404
+    resp = jsonify({"ok": True, "job": job.as_dict()})
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+@app.route("/api/jobs/<job_id>/cancel", methods=["POST"])
+def api_job_cancel(job_id):
+    if not is_authed():
+        return jsonify({"ok": False, "error": "not authed"}), 401
+    job = owned_job(job_id)
+    if job is None:
+        return jsonify({"ok": False, "error": "no such job"}), 404
+    job.cancel()  # a running job stops at its next check()
+    return jsonify({"ok": True, "job": job.as_dict()})
+
+@app.route("/api/jobs/<job_id>/download")
+def api_job_download(job_id):
+    if not is_authed():
+        return jsonify({"ok": False, "error": "not authed"}), 401
+    job = owned_job(job_id)
+    if job is None or job.kind != "zip":
+        return jsonify({"ok": False, "error": "no such job"}), 404
+    if job.state != "done" or not zip_job_file(job.id).is_file():
+        return jsonify({"ok": False, "error": f"archive {job.state}"}), 409
+    rv = send_partial_file(zip_job_file(job.id), "application/zip", as_attachment=True)
+    set_content_disposition(rv, job.result["name"])
+    return rv
+
 @app.route("/api/mkdir", methods=["POST"])
 def api_mkdir():
     if not is_authed():
@@ -2910,10 +6197,50 @@ def api_mkdir():
         return jsonify({"ok": False, "error": "already exists"}), 400
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)}), 500
+    invalidate_listing(new_dir.parent)
     meta = get_file_meta(new_dir)
-    socketio.emit("file_update", {"action":"added","dir": dest_rel, "meta": meta})
+    if dest != ROOT_DIR:
+        adjust_usage(first_segment(path_rel(dest)), dirs=1)
+    emit_file_update({"action":"added","dir": path_rel(dest) if dest != ROOT_DIR else "", "meta": meta})
     return jsonify({"ok": True, "meta": meta})
 
+@app.route("/api/mkdirs", methods=["POST"])
+def api_mkdirs():
+    """Create a whole directory skeleton under dest in one call; folder uploads send their files afterwards.
+
+    Body: {"dest": "<rel>", "dirs": ["a", "a/b", ...]}. "dirs" in the reply has the created (or
+    existing) path of each, or null where it was skipped.
+    """
+    if not is_authed():
+        return jsonify({"ok": False, "error": "not authed"}), 401
+    data = request.get_json(silent=True) or {}
+    dirs = data.get("dirs")
+    if not isinstance(dirs, list) or len(dirs) > MKDIRS_MAX:
+        return jsonify({"ok": False, "error": f"dirs must be a list of at most {MKDIRS_MAX} paths"}), 400
+    dest = data.get("dest", "")
+    if not isinstance(dest, str):
+        return jsonify({"ok": False, "error": "dest must be a path"}), 400
+    dest_dir = safe_path(dest)
+    if path_folder(dest_dir) != session.get("folder"):
+        return jsonify({"ok": False, "error": "forbidden"}), 403
+    if not dest_dir.is_dir():
+        return jsonify({"ok": False, "error": "bad dest"}), 400
+    # Stops at the first directory that can't be made; the ones made before it are still
+    # counted and announced by batch.finish(), and reported in "dirs" (null from there on).
+    batch = UploadBatch(dest_dir)
+    out, error = [], None
+    for rel in dirs:
+        parts = split_upload_relpath(rel) if isinstance(rel, str) and not error else None
+        try:
+            d = batch.make_dirs(parts) if parts else None
+        except OSError as e:
+            error, d = f"mkdir failed: {e}", None
+        out.append(path_rel(d) if d else None)
+    batch.finish()
+    if error:
+        return jsonify({"ok": False, "error": error, "created": len(batch.new_dirs), "dirs": out}), 500
+    return jsonify({"ok": True, "created": len(batch.new_dirs), "dirs": out})
+
 @app.route("/api/my_qr")
 def api_my_qr():
     if not is_authed():
@@ -2993,9 +6320,11 @@ def api_cliptext():
     except Exception as e:
         return jsonify({"ok": False, "error": f"save failed: {e}"}), 500
 
+    invalidate_listing(dest_dir)
     meta = get_file_meta(save_path)
+    adjust_usage(first_segment(path_rel(save_path)), files=1, size=meta["size"])
     parent_rel = path_rel(dest_dir) if dest_dir != ROOT_DIR else ""
-    socketio.emit("file_update", {"action":"added","dir": parent_rel, "meta": meta})
+    emit_file_update({"action":"added","dir": parent_rel, "meta": meta})
     return jsonify({"ok": True, "meta": meta})
 
 # -----------------------------
@@ -3029,5 +6358,10 @@ if __name__ == "__main__":
     else:
         print("Ngrok not detected. To enable online access, run: ngrok http 5000")
     print(f"Root directory: {ROOT_DIR}")
+    gc_upload_sessions(force=True)
+    gc_job_files()
+    start_usage_reconciler()
+    start_sweeper()
+    start_fs_watcher()
     socketio.run(app, host="0.0.0.0", port=PORT, debug=False)
     
\ No newline at end of file
@@ -0,0 +1,68 @@
+"""Socket fan-out load check for live file updates (not collected by pytest).
+
+Connects ACCOUNTS x CLIENTS in-process Socket.IO test clients, each watching its
+account root, then uploads UPLOADS files into the first account and counts how
+many file update events every client received.
+
+    python tests/load_socket_rooms.py [ACCOUNTS] [CLIENTS] [UPLOADS]
+
+Defaults: 100 accounts x 10 clients, 200 uploads. Every event should reach only
+the uploading account's clients: CLIENTS deliveries per upload, none elsewhere.
+"""
+import io
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault("ROOT_DIR", tempfile.mkdtemp())
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app as fv  # noqa: E402
+
+
+def connect(folder: str):
+    (fv.ROOT_DIR / folder).mkdir(exist_ok=True)
+    c = fv.app.test_client()
+    with c.session_transaction() as s:
+        s["authed"] = True
+        s["folder"] = folder
+    sio = fv.socketio.test_client(fv.app, flask_test_client=c)
+    sio.emit("watch_dir", {"dir": folder})
+    return c, sio
+
+
+def deliveries(sio) -> int:
+    n = 0
+    for msg in sio.get_received():
+        if msg["name"] == "file_update_batch":
+            n += len(msg["args"][0]["events"])
+        elif msg["name"] == "file_update":
+            n += 1
+    return n
+
+
+def main(accounts: int = 100, clients: int = 10, uploads: int = 200):
+    folders = [f"load{i:03d}" for i in range(accounts)]
+    conns = {f: [connect(f) for _ in range(clients)] for f in folders}
+    for conn in conns.values():
+        for _, sio in conn:
+            sio.get_received()  # drop connect-time messages
+    uploader = conns[folders[0]][0][0]
+    started = time.perf_counter()
+    for i in range(uploads):
+        r = uploader.post(f"/api/upload?dest={folders[0]}", data={"file": (io.BytesIO(b"x"), f"f{i}.txt")})
+        assert r.status_code == 201, r.get_json()
+        fv.EVENT_BATCHER.flush()  # one batch per upload, so nothing is merged away
+    elapsed = time.perf_counter() - started
+    own = sum(deliveries(sio) for _, sio in conns[folders[0]])
+    other = sum(deliveries(sio) for f in folders[1:] for _, sio in conns[f])
+    print(f"{accounts} accounts x {clients} clients, {uploads} uploads")
+    print(f"  deliveries: {own + other:,} ({other:,} to other accounts)")
+    print(f"  {elapsed / uploads * 1000:.1f} ms/upload")
+    return own, other
+
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:4]))
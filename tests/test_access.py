@@ -0,0 +1,113 @@
+import io
+import os
+import sys
+import tempfile
+import zipfile
+from pathlib import Path
+
+os.environ.setdefault("ROOT_DIR", tempfile.mkdtemp())
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app as fv  # noqa: E402
+
+FOLDER = "tester"
+
+
+def client():
+    for name in (FOLDER, "pub", "priv"):
+        (fv.ROOT_DIR / name).mkdir(exist_ok=True)
+    (fv.ROOT_DIR / "priv" / "secret.txt").write_text("secret")
+    fv.get_user_cfg("priv")["public"] = False
+    c = fv.app.test_client()
+    with c.session_transaction() as s:
+        s["authed"] = True
+        s["folder"] = FOLDER
+    return c
+
+
+def test_zip_dotdot_into_other_account_is_refused():
+    c = client()
+    assert c.get("/api/zip?paths=priv").status_code == 403
+    assert c.get("/api/zip?paths=pub/../priv").status_code == 403
+    assert c.get(f"/api/zip?paths={FOLDER}/../priv").status_code == 403
+
+
+def test_zip_own_folder():
+    c = client()
+    (fv.ROOT_DIR / FOLDER / "z").mkdir(exist_ok=True)
+    (fv.ROOT_DIR / FOLDER / "z" / "a.txt").write_text("a")
+    r = c.get(f"/api/zip?paths={FOLDER}/z")
+    assert r.status_code == 200
+    assert zipfile.ZipFile(io.BytesIO(r.data)).namelist() == ["z/", "z/a.txt"]
+
+
+def test_list_dotdot_into_locked_account_is_refused():
+    c = client()
+    assert c.get("/api/list?path=priv").status_code == 403
+    assert c.get("/api/list?path=pub/../priv").status_code == 403
+    assert c.get("/api/list?path=pub").status_code == 200
+
+
+def test_browse_dotdot_into_locked_account_is_refused():
+    c = client()
+    direct = c.get("/b/priv")
+    dotted = c.get("/b/pub/../priv")
+    assert direct.status_code != 200
+    assert dotted.status_code == direct.status_code
+
+
+def test_changes_dotdot_into_locked_account_is_refused():
+    c = client()
+    assert c.get("/api/changes?since=0&path=priv").status_code == 403
+    assert c.get("/api/changes?since=0&path=pub/../priv").status_code == 403
+    assert c.get(f"/api/changes?since=0&path={FOLDER}").status_code == 200
+
+
+def test_thumb_dotdot_into_locked_account_is_refused():
+    c = client()
+    direct = c.get("/thumb?path=priv/secret.txt")
+    dotted = c.get("/thumb?path=pub/../priv/secret.txt")
+    assert direct.location.startswith("/unlock?folder=priv")
+    assert dotted.location.startswith("/unlock?folder=priv")
+
+
+def test_raw_and_download_dotdot_into_locked_account_are_refused():
+    c = client()
+    for route in ("/raw", "/download"):
+        r = c.get(f"{route}?path=pub/../priv/secret.txt")
+        assert r.status_code == 302
+        assert r.location.startswith("/unlock?folder=priv")
+
+
+def test_watch_dir_dotdot_into_locked_account_is_refused():
+    c = client()
+    sio = fv.socketio.test_client(fv.app, flask_test_client=c)
+    sio.emit("watch_dir", {"dir": "pub/../priv"})
+    fv.socketio.emit("file_update_batch", {"dir": "priv", "events": []}, to=fv.dir_room("priv"))
+    assert not [m for m in sio.get_received() if m["name"] == "file_update_batch"]
+    sio.emit("watch_dir", {"dir": "pub/../pub"})
+    fv.socketio.emit("file_update_batch", {"dir": "pub", "events": []}, to=fv.dir_room("pub"))
+    assert [m for m in sio.get_received() if m["name"] == "file_update_batch"]
+    sio.disconnect()
+
+
+def test_delete_dotdot_into_other_account_is_ignored():
+    c = client()
+    r = c.post("/api/delete", json={"files": [f"{FOLDER}/../priv/secret.txt"]})
+    assert r.status_code == 200
+    assert r.get_json()["deleted"] == []
+    assert (fv.ROOT_DIR / "priv" / "secret.txt").exists()
+
+
+def test_permanent_token_is_only_replaced_on_request():
+    c = client()
+    fv.get_user_cfg(FOLDER)["admin_device"] = "admin-dev"
+    c.set_cookie(fv.DEVICE_COOKIE_NAME, "admin-dev")
+    first = c.post("/api/accounts/token", json={}).get_json()["token"]
+    r = c.post("/api/accounts/token", json={})
+    assert r.status_code == 409 and r.get_json()["rotate_required"]
+    assert fv.token_digest(first) in fv._token_index
+    r = c.post("/api/accounts/token", json={"rotate": True})
+    assert r.status_code == 200 and r.get_json()["rotated"] == 1
+    assert fv.token_digest(first) not in fv._token_index
+    assert fv.token_digest(r.get_json()["token"]) in fv._token_index
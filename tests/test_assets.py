@@ -0,0 +1,41 @@
+import os
+import re
+import sys
+import tempfile
+from pathlib import Path
+
+os.environ.setdefault("ROOT_DIR", tempfile.mkdtemp())
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app as fv  # noqa: E402
+
+
+def asset_links(html):
+    return re.findall(r'(?:href|src)="(/static/build/[^"]+)"', html)
+
+
+def test_bundles_are_fingerprinted_and_immutable():
+    c = fv.app.test_client()
+    links = asset_links(c.get("/login").get_data(as_text=True))
+    assert links and all(re.search(r"\.[0-9a-f]{12}\.(js|css)$", link) for link in links)
+    r = c.get(links[0])
+    assert r.status_code == 200
+    assert "immutable" in r.headers["Cache-Control"]
+
+
+def test_pages_work_without_built_bundles():
+    saved = dict(fv.BUNDLES)
+    fv.BUNDLES.clear()
+    try:
+        c = fv.app.test_client()
+        r = c.get("/login")
+        assert r.status_code == 200
+        links = asset_links(r.get_data(as_text=True))
+        assert "/static/build/app.js" in links and "/static/build/app.css" in links
+        js = c.get("/static/build/app.js")
+        assert js.status_code == 200
+        assert js.get_data(as_text=True) == fv.BUNDLE_SOURCES["app.js"]
+        assert js.headers["Cache-Control"] == "no-cache"
+    finally:
+        fv.BUNDLES.update(saved)
+    assert fv.app.test_client().get("/static/build/app.js").status_code == 404
@@ -0,0 +1,74 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+os.environ.setdefault("ROOT_DIR", tempfile.mkdtemp())
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app as fv  # noqa: E402
+
+FOLDER = "jobber"
+
+
+def client():
+    (fv.ROOT_DIR / FOLDER).mkdir(exist_ok=True)
+    c = fv.app.test_client()
+    with c.session_transaction() as s:
+        s["authed"] = True
+        s["folder"] = FOLDER
+    return c
+
+
+def blocking_jobs(n):
+    release = threading.Event()
+
+    def run(job):
+        while not release.wait(0.01):
+            job.check()
+
+    return [fv.start_job(fv.Job("test", FOLDER, f"block {i}"), run) for i in range(n)], release
+
+
+def wait_finished(job):
+    for _ in range(500):
+        if job.state in ("done", "failed", "cancelled"):
+            return
+        time.sleep(0.01)
+
+
+def test_active_jobs_survive_a_full_job_store():
+    c = client()
+    jobs, release = blocking_jobs(1)
+    try:
+        for i in range(fv.JOBS.max_size + 10):
+            done = fv.Job("test", "someone-else", f"old {i}")
+            done.state = "done"
+            fv.JOBS.set(done.id, done)
+        r = c.get(f"/api/jobs/{jobs[0].id}")
+        assert r.status_code == 200
+        assert r.get_json()["job"]["state"] in ("queued", "running")
+        assert c.post(f"/api/jobs/{jobs[0].id}/cancel").status_code == 200
+        wait_finished(jobs[0])
+        assert jobs[0].state == "cancelled"
+        assert c.get(f"/api/jobs/{jobs[0].id}").status_code == 200
+    finally:
+        release.set()
+
+
+def test_active_jobs_per_account_are_capped():
+    c = client()
+    (fv.ROOT_DIR / FOLDER / "z").mkdir(exist_ok=True)
+    jobs, release = blocking_jobs(fv.JOB_MAX_ACTIVE)
+    try:
+        r = c.post("/api/zip", data={"paths": f"{FOLDER}/z", "job": "1"})
+        assert r.status_code == 429
+        assert c.post("/api/usage/rescan").status_code == 429
+    finally:
+        release.set()
+    for job in jobs:
+        wait_finished(job)
+    r = c.post("/api/zip", data={"paths": f"{FOLDER}/z", "job": "1"})
+    assert r.status_code == 202
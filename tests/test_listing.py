@@ -0,0 +1,54 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+from werkzeug.datastructures import MultiDict
+
+os.environ.setdefault("ROOT_DIR", tempfile.mkdtemp())
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app as fv  # noqa: E402
+
+FOLDER = "tester"
+
+
+def test_list_args_ignores_malformed_sort_pref():
+    for saved in ("name", ["name"], 3, None, {"by": ["name"], "dir": 1, "foldersFirst": "no"}):
+        assert fv.list_args(MultiDict(), saved) == {"sort": "date", "desc": True, "folders_first": True}
+
+
+def test_list_args_uses_saved_pref():
+    saved = {"by": "name", "dir": "asc", "foldersFirst": False}
+    assert fv.list_args(MultiDict(), saved) == {"sort": "name", "desc": False, "folders_first": False}
+    assert fv.list_args(MultiDict({"sort": "size"}), saved)["sort"] == "size"
+
+
+def test_listing_survives_string_sort_pref():
+    (fv.ROOT_DIR / FOLDER).mkdir(exist_ok=True)
+    c = fv.app.test_client()
+    with c.session_transaction() as s:
+        s["authed"] = True
+        s["folder"] = FOLDER
+    assert c.post("/api/prefs", json={"key": "sort", "value": "name"}).status_code == 200
+    assert c.get(f"/api/list?path={FOLDER}").status_code == 200
+    assert c.get(f"/b/{FOLDER}").status_code == 200
+
+
+def test_watcher_reports_outside_changes_without_a_request():
+    d = fv.ROOT_DIR / FOLDER / "watched"
+    d.mkdir(parents=True, exist_ok=True)
+    c = fv.app.test_client()
+    with c.session_transaction() as s:
+        s["authed"] = True
+        s["folder"] = FOLDER
+    sio = fv.socketio.test_client(fv.app, flask_test_client=c)
+    sio.emit("watch_dir", {"dir": f"{FOLDER}/watched"})
+    sio.get_received()
+    (d / "outside.txt").write_text("x")
+    fv.FS_WATCHER.pending[f"{FOLDER}/watched/outside.txt"] = True
+    fv.FS_WATCHER.flush()
+    fv.EVENT_BATCHER.flush()
+    batches = [m["args"][0] for m in sio.get_received() if m["name"] == "file_update_batch"]
+    sio.disconnect()
+    assert [e["meta"]["raw_url"] for b in batches for e in b["events"]] == [f"/raw?path={FOLDER}/watched/outside.txt"]
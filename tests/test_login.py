@@ -0,0 +1,33 @@
+import os
+import re
+import sys
+import tempfile
+from pathlib import Path
+
+os.environ.setdefault("ROOT_DIR", tempfile.mkdtemp())
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app as fv  # noqa: E402
+
+
+def test_login_page_reuses_the_app_socket():
+    r = fv.app.test_client().get("/login")
+    assert r.status_code == 200
+    html = r.get_data(as_text=True)
+    inline = "".join(re.findall(r"<script>(.*?)</script>", html, re.S))
+    assert "window.FV_LOGIN" in inline
+    assert "io(" not in inline
+
+
+def test_watch_login_gets_login_ready_after_scan():
+    c = fv.app.test_client()
+    html = c.get("/login").get_data(as_text=True)
+    token = re.search(r'let currentToken = "([^"]+)"', html).group(1)
+    sio = fv.socketio.test_client(fv.app, flask_test_client=c)
+    sio.emit("watch_login", {"token": token})
+    info = fv.pending_sessions.get(token)
+    info["authenticated"] = True
+    info["folder"] = "tester"
+    sio.emit("watch_login", {"token": token})
+    assert [m for m in sio.get_received() if m["name"] == "login_ready"]
+    sio.disconnect()
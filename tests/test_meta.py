@@ -0,0 +1,98 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+os.environ.setdefault("ROOT_DIR", tempfile.mkdtemp())
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app as fv  # noqa: E402
+
+
+def test_json_store_writes_saved_rows_only():
+    d = Path(tempfile.mkdtemp())
+    store = fv.JsonMetaStore(d / "users.json", d / "devices.json")
+    store.users["a"] = {"public": True, "prefs": {"view": "grid"}}
+    store.save_user("a")
+    store.users["a"]["prefs"]["view"] = "list"  # edited, not saved yet
+    fv.JSON_FLUSHER.flush()
+    assert json.loads((d / "users.json").read_text()) == {"a": {"public": True, "prefs": {"view": "grid"}}}
+    store.save_pref("a", "view")
+    fv.JSON_FLUSHER.flush()
+    assert json.loads((d / "users.json").read_text())["a"]["prefs"]["view"] == "list"
+
+
+def test_json_store_flush_races_writers_without_errors():
+    d = Path(tempfile.mkdtemp())
+    store = fv.JsonMetaStore(d / "users.json", d / "devices.json")
+    errors = fv.JSON_FLUSHER.stats["errors"]
+    stop = threading.Event()
+
+    def writer():
+        for i in range(2000):
+            if stop.is_set():
+                return
+            store.devices[f"dev{i}"] = {"folder": "a", "created": str(i)}
+            store.save_device(f"dev{i}")
+
+    t = threading.Thread(target=writer)
+    t.start()
+    try:
+        for _ in range(20):
+            fv.JSON_FLUSHER.flush()
+    finally:
+        stop.set()
+        t.join()
+    fv.JSON_FLUSHER.flush()
+    assert fv.JSON_FLUSHER.stats["errors"] == errors
+    assert len(json.loads((d / "devices.json").read_text())) == len(store.devices)
+
+
+def test_usage_snapshot_is_a_copy():
+    fv.app.config["USAGE"]["snap"] = {"files": 1, "dirs": 0, "bytes": 5}
+    snap = fv.usage_snapshot()
+    fv.adjust_usage("snap", files=1)
+    assert snap["snap"]["files"] == 1
+    assert fv.app.config["USAGE"]["snap"]["files"] == 2
+
+
+def write_legacy_json(d):
+    users = {"acct": {"public": False, "tokens": {"t1": {"token": "plain-secret", "name": "link"}}}}
+    devices = {"dev1": {"folder": "acct", "created": "2024-01-01T00:00:00Z"}}
+    (d / "users.json").write_text(json.dumps(users))
+    (d / "devices.json").write_text(json.dumps(devices))
+
+
+def test_sqlite_migration_leaves_json_usable():
+    d = Path(tempfile.mkdtemp())
+    write_legacy_json(d)
+    store = fv.SqliteMetaStore(d / "meta.db", d / "users.json", d / "devices.json")
+    assert store.users["acct"]["public"] is False
+    assert (d / "users.json").exists() and (d / "devices.json").exists()
+    assert "plain-secret" not in (d / "users.json").read_text()
+    back = fv.JsonMetaStore(d / "users.json", d / "devices.json")
+    assert back.users["acct"]["tokens"]["t1"]["digest"] == fv.token_digest("plain-secret")
+    assert back.devices["dev1"]["folder"] == "acct"
+
+
+def test_json_store_reads_files_renamed_by_older_migrations():
+    d = Path(tempfile.mkdtemp())
+    write_legacy_json(d)
+    for name in ("users.json", "devices.json"):
+        (d / name).rename(d / (name + ".migrated"))
+    store = fv.JsonMetaStore(d / "users.json", d / "devices.json")
+    assert "acct" in store.users and "dev1" in store.devices
+
+
+def test_sqlite_save_survives_os_errors(monkeypatch):
+    d = Path(tempfile.mkdtemp())
+    store = fv.SqliteMetaStore(d / "meta.db", d / "users.json", d / "devices.json")
+    store.users["acct"] = {"public": True}
+
+    def full(*args):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(store, "_write_user", full)
+    store.save_user("acct")  # logged, not raised
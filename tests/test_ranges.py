@@ -0,0 +1,42 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+os.environ.setdefault("ROOT_DIR", tempfile.mkdtemp())
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app as fv  # noqa: E402
+
+FOLDER = "tester"
+
+
+def client():
+    (fv.ROOT_DIR / FOLDER).mkdir(exist_ok=True)
+    (fv.ROOT_DIR / FOLDER / "r.bin").write_bytes(bytes(range(256)) * 4)
+    c = fv.app.test_client()
+    with c.session_transaction() as s:
+        s["authed"] = True
+        s["folder"] = FOLDER
+    return c
+
+
+def test_range_is_served():
+    c = client()
+    r = c.get(f"/raw?path={FOLDER}/r.bin", headers={"Range": "bytes=0-9"})
+    assert r.status_code == 206
+    assert r.data == bytes(range(10))
+
+
+def test_if_none_match_wins_over_range():
+    c = client()
+    etag = c.get(f"/raw?path={FOLDER}/r.bin").headers["ETag"]
+    r = c.get(f"/raw?path={FOLDER}/r.bin", headers={"If-None-Match": etag, "Range": "bytes=0-9"})
+    assert r.status_code == 304
+    assert r.data == b""
+
+
+def test_stale_if_none_match_still_gets_range():
+    c = client()
+    r = c.get(f"/raw?path={FOLDER}/r.bin", headers={"If-None-Match": '"stale"', "Range": "bytes=0-9"})
+    assert r.status_code == 206
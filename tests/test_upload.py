@@ -0,0 +1,157 @@
+import base64
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+os.environ.setdefault("ROOT_DIR", tempfile.mkdtemp())
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app as fv  # noqa: E402
+
+FOLDER = "tester"
+
+
+def client():
+    (fv.ROOT_DIR / FOLDER).mkdir(exist_ok=True)
+    c = fv.app.test_client()
+    with c.session_transaction() as s:
+        s["authed"] = True
+        s["folder"] = FOLDER
+    return c
+
+
+def multipart(parts, boundary="fvtestboundary"):
+    """Body with parts in exactly the given order: (name, value) or (name, filename, bytes)."""
+    out = b""
+    for part in parts:
+        out += f"--{boundary}\r\n".encode()
+        if len(part) == 3:
+            name, filename, data = part
+            out += f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'.encode()
+            out += b"Content-Type: application/octet-stream\r\n\r\n" + data + b"\r\n"
+        else:
+            name, value = part
+            out += f'Content-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+    out += f"--{boundary}--\r\n".encode()
+    return out, f"multipart/form-data; boundary={boundary}"
+
+
+def post(c, parts, query=""):
+    body, ctype = multipart(parts)
+    return c.post("/api/upload" + query, data=body, content_type=ctype)
+
+
+def test_upload_dest_before_file():
+    c = client()
+    (fv.ROOT_DIR / FOLDER / "a").mkdir(exist_ok=True)
+    r = post(c, [("dest", f"{FOLDER}/a"), ("file", "first.txt", b"one")])
+    assert r.status_code == 201
+    assert (fv.ROOT_DIR / FOLDER / "a" / "first.txt").read_bytes() == b"one"
+
+
+def test_upload_file_before_dest():
+    c = client()
+    (fv.ROOT_DIR / FOLDER / "b").mkdir(exist_ok=True)
+    r = post(c, [("file", "late.txt", b"two"), ("dest", f"{FOLDER}/b")])
+    assert r.status_code == 201, r.get_json()
+    assert r.get_json()["meta"]["rel"] == f"{FOLDER}/b/late.txt"
+    assert (fv.ROOT_DIR / FOLDER / "b" / "late.txt").read_bytes() == b"two"
+    assert not [p for p in (fv.ROOT_DIR / FOLDER).iterdir() if fv.is_internal_name(p.name)]
+
+
+def test_upload_dest_in_query():
+    c = client()
+    (fv.ROOT_DIR / FOLDER / "q").mkdir(exist_ok=True)
+    r = post(c, [("file", "q.txt", b"three")], query=f"?dest={FOLDER}/q")
+    assert r.status_code == 201
+    assert (fv.ROOT_DIR / FOLDER / "q" / "q.txt").exists()
+
+
+def test_upload_foreign_dest_after_file_is_refused():
+    c = client()
+    (fv.ROOT_DIR / "someone").mkdir(exist_ok=True)
+    r = post(c, [("file", "x.txt", b"x"), ("dest", "someone")])
+    assert r.status_code == 403
+    assert not (fv.ROOT_DIR / "someone" / "x.txt").exists()
+    assert not [p for p in (fv.ROOT_DIR / FOLDER).iterdir() if fv.is_internal_name(p.name)]
+
+
+def test_commit_upload_temp_never_overwrites():
+    d = fv.ROOT_DIR / FOLDER / "race"
+    d.mkdir(exist_ok=True)
+    tmps = []
+    for i in range(8):
+        out, tmp = fv.open_upload_temp(d)
+        out.write(str(i).encode())
+        out.close()
+        tmps.append(tmp)
+    saved = []
+    threads = [threading.Thread(target=lambda t=t: saved.append(fv.commit_upload_temp(t, d, "same.txt"))) for t in tmps]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(saved)) == 8
+    assert sorted(p.read_bytes() for p in saved) == sorted(str(i).encode() for i in range(8))
+
+
+def test_resumable_bad_checksum_keeps_committed_bytes():
+    def sha(data):
+        return "sha256 " + base64.b64encode(hashlib.sha256(data).digest()).decode()
+
+    c = client()
+    good, bad = b"a" * 1000, b"b" * 1000
+    j = c.post("/api/uploads", json={"dest": FOLDER, "name": "resume.bin", "size": len(good)}).get_json()
+    url = f"/api/uploads/{j['id']}"
+    r = c.patch(url, data=good, headers={"Upload-Offset": "0", "Upload-Checksum": sha(good)})
+    assert r.status_code == 200
+    r = c.patch(url, data=bad, headers={"Upload-Offset": "0", "Upload-Checksum": sha(good)})
+    assert r.status_code == 460
+    r = c.post(url + "/finish")
+    assert r.status_code == 201
+    assert (fv.ROOT_DIR / FOLDER / "resume.bin").read_bytes() == good
+
+
+def test_batch_oversized_field_keeps_saved_files_accounted():
+    c = client()
+    d = fv.ROOT_DIR / FOLDER / "batch"
+    d.mkdir(exist_ok=True)
+    before = fv.usage_stats(FOLDER)["files"]
+    body, ctype = multipart([
+        ("dest", f"{FOLDER}/batch"),
+        ("path", "one.txt"), ("file", "one.txt", b"1"),
+        ("path", "x" * (fv.UPLOAD_FIELD_MAX + 1)),
+    ])
+    r = c.post("/api/upload/batch", data=body, content_type=ctype)
+    assert r.status_code == 413
+    assert r.get_json()["saved"] == 1
+    assert (d / "one.txt").exists()
+    assert fv.usage_stats(FOLDER)["files"] == before + 1
+
+
+def test_mkdirs_rejects_non_string_dest():
+    c = client()
+    for dest in ([FOLDER], {"path": FOLDER}, 3):
+        r = c.post("/api/mkdirs", json={"dest": dest, "dirs": ["a"]})
+        assert r.status_code == 400
+
+
+def test_mkdirs_reports_os_errors(monkeypatch):
+    c = client()
+    real = fv.UploadBatch.make_dirs
+
+    def make_dirs(self, parts):
+        if parts[0] == "full":
+            raise OSError(28, "No space left on device")
+        return real(self, parts)
+
+    monkeypatch.setattr(fv.UploadBatch, "make_dirs", make_dirs)
+    r = c.post("/api/mkdirs", json={"dest": FOLDER, "dirs": ["made", "full", "later"]})
+    assert r.status_code == 500
+    j = r.get_json()
+    assert not j["ok"] and "No space left" in j["error"]
+    assert j["dirs"] == [f"{FOLDER}/made", None, None]
+    assert (fv.ROOT_DIR / FOLDER / "made").is_dir() and not (fv.ROOT_DIR / FOLDER / "later").exists()
@@ -0,0 +1,32 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+os.environ.setdefault("ROOT_DIR", tempfile.mkdtemp())
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app as fv  # noqa: E402
+
+
+def test_first_scan_is_retried_when_an_upload_lands_mid_scan(monkeypatch):
+    folder = "racy"
+    root = fv.ROOT_DIR / folder
+    root.mkdir(exist_ok=True)
+    (root / "a.txt").write_text("a")
+    real_scan = fv.scan_usage
+    calls = []
+
+    def scan(path, *args, **kwargs):
+        result = real_scan(path, *args, **kwargs)
+        calls.append(result)
+        if len(calls) == 1:
+            (root / "b.txt").write_text("b")  # an upload finishing while the scan runs
+            fv.adjust_usage(folder, files=1, size=1)
+        return result
+
+    monkeypatch.setattr(fv, "scan_usage", scan)
+    fv.app.config["USAGE"].pop(folder, None)
+    u = fv.get_usage(folder)
+    assert len(calls) == 2
+    assert (u["files"], u["bytes"]) == (2, 2)